@@ -3,13 +3,21 @@ from app.models import db, ReportHistory
 from flask_login import current_user, login_required
 from app.auth import require_permission
 import pandas as pd
+import numpy as np
+import openpyxl
+from openpyxl import Workbook
+from openpyxl.cell.cell import MergedCell
 from openpyxl.formatting.rule import ColorScaleRule
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+from openpyxl.styles import Font, PatternFill, Alignment, Border, Side, NamedStyle
 from openpyxl.worksheet.table import Table, TableStyleInfo
 from openpyxl.utils import get_column_letter
 from openpyxl.styles import numbers
+from openpyxl.styles.fonts import DEFAULT_FONT
 import os
 import re
+import shutil
+import traceback
+import unicodedata
 import logging
 from datetime import datetime, timedelta
 from werkzeug.utils import secure_filename
@@ -24,8 +32,129 @@ from config import (
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Motor de lectura de Excel: calamine (Rust, mucho más rápido) si python-calamine está instalado
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_READ_ENGINE = 'calamine'
+except ImportError:
+    EXCEL_READ_ENGINE = 'openpyxl'
+
+# Serializador XML de openpyxl: usa lxml automáticamente si está instalado (guardado mucho más rápido)
+if not openpyxl.LXML:
+    logger.info("ℹ️ lxml no está instalado; openpyxl guardará los reportes con el serializador XML estándar")
+
 reportes_bp = Blueprint('reportes', __name__)
 
+# Rangos de días de mora para las hojas X_Coordinación / X_Recuperador: intervalos cerrados [0,0], [1,7],
+# [8,15], ... [61,90]; cualquier otro valor (negativos, fracciones entre intervalos, más de 90) es Mayor_90
+RANGOS_MORA_INTERVALOS = ((0, 0), (1, 7), (8, 15), (16, 30), (31, 60), (61, 90))
+RANGOS_MORA_ETIQUETAS = ['0', '1-7', '8-15', '16-30', '31-60', '61-90', 'Mayor_90']
+
+# Coordenadas GPS en grados/minutos/segundos, p. ej. 19°12'12.2"N 100°07'51.8"W
+PATRON_COORDENADAS = re.compile(r"(\d+)°(\d+)'([\d.]+)\"([NS])\s+(\d+)°(\d+)'([\d.]+)\"([WE])")
+URL_BUSQUEDA_MAPS = "https://www.google.com/maps/search/?api=1&query="
+
+# Columna PAR (mismas reglas que asignar_rango_mora): menos de 1 día o nulo es '0'; después (1,7], (7,15], ...
+PAR_LIMITES_SUPERIORES = np.array([7, 15, 30, 60, 90, 180])
+PAR_ETIQUETAS = np.array(['0', '7', '15', '30', '60', '90', 'Mayor_90', 'Mayor_180'], dtype=object)
+
+# Columnas que se suman por grupo y en la fila 'Total' de X_Coordinación / X_Recuperador
+COLUMNAS_SUMA_RESUMEN = [
+    'Cantidad Prestada', 'Saldo capital', 'Saldo vencido', 'Saldo total',
+    'Saldo riesgo capital', 'Saldo riesgo total'
+]
+COLUMNAS_TOTAL_RESUMEN = COLUMNAS_SUMA_RESUMEN + [f'Rango_{etiqueta}' for etiqueta in RANGOS_MORA_ETIQUETAS]
+
+# Columnas fuente de 'Saldo riesgo capital', 'Saldo riesgo total' y '% MORA'
+COLUMNAS_RIESGO_Y_MORA = ['Días de mora', 'Saldo capital', 'Saldo total', 'Saldo vencido']
+# Columnas derivadas, en el orden en que las devuelve _calcular_riesgo_y_mora
+COLUMNAS_DERIVADAS_RIESGO = ('Saldo riesgo capital', 'Saldo riesgo total', '% MORA')
+
+# Estilos de openpyxl reutilizados en los bucles por celda (se crean una sola vez; openpyxl los trata
+# como valores inmutables, así que pueden asignarse a cualquier número de celdas)
+COLOR_FONDO_AZUL_CLARO = 'D9E1F2'  # Azul claro para fondo de encabezados
+COLOR_TEXTO_AZUL_FUERTE = '002060'  # Azul fuerte para texto de encabezados
+BORDE_DELGADO = Border(
+    left=Side(style='thin', color='000000'),
+    right=Side(style='thin', color='000000'),
+    top=Side(style='thin', color='000000'),
+    bottom=Side(style='thin', color='000000')
+)
+BORDE_VACIO = Border()
+RELLENO_AZUL_CLARO = PatternFill(start_color=COLOR_FONDO_AZUL_CLARO, end_color=COLOR_FONDO_AZUL_CLARO, fill_type='solid')
+RELLENO_AMARILLO = PatternFill(start_color='FFFF00', end_color='FFFF00', fill_type='solid')
+RELLENO_BLANCO = PatternFill(start_color='FFFFFF', end_color='FFFFFF', fill_type='solid')
+FUENTE_ENCABEZADO = Font(bold=True, size=11, color=COLOR_TEXTO_AZUL_FUERTE)
+FUENTE_ENCABEZADO_COMPACTO = Font(bold=True, size=9, color=COLOR_TEXTO_AZUL_FUERTE)
+FUENTE_TOTAL = Font(bold=True, color=COLOR_TEXTO_AZUL_FUERTE)
+FUENTE_HIPERVINCULO = Font(color="0000FF", underline="single")
+FUENTE_DEFAULT = Font()
+ALINEACION_CENTRO = Alignment(horizontal='center', vertical='center')
+ALINEACION_CENTRO_AJUSTE = Alignment(horizontal='center', vertical='center', wrap_text=True)
+ALINEACION_DERECHA = Alignment(horizontal='right', vertical='center')
+ALINEACION_IZQUIERDA = Alignment(horizontal='left', vertical='center')
+ALINEACION_DEFAULT = Alignment()
+# Hojas de informe (encabezados en fila 2) y Liquidación anticipada
+FUENTE_NEGRITA = Font(bold=True)
+RELLENO_AZUL_ENCABEZADO = PatternFill(start_color=COLORS['light_blue'], end_color=COLORS['light_blue'], fill_type='solid')
+BORDE_GRIS_DELGADO = Border(
+    left=Side(style='thin', color='D3D3D3'),
+    right=Side(style='thin', color='D3D3D3'),
+    top=Side(style='thin', color='D3D3D3'),
+    bottom=Side(style='thin', color='D3D3D3')
+)
+FUENTE_LIQUIDACION_ENCABEZADO = Font(name='Arial', size=10, bold=True, color='2F4F4F')  # Azul gris oscuro
+FUENTE_LIQUIDACION_DATOS = Font(name='Arial', size=10, color='2C2C2C')  # Gris oscuro
+FUENTE_LIQUIDACION_MANUAL = Font(name='Arial', size=10, bold=True, color='2C2C2C')
+RELLENO_LIQUIDACION_ENCABEZADO = PatternFill(start_color='F8F9FA', end_color='F8F9FA', fill_type='solid')  # Gris muy claro
+RELLENO_VERDE_CLARO = PatternFill(start_color=COLORS['light_green'], end_color=COLORS['light_green'], fill_type='solid')
+RELLENO_ALERTA = PatternFill(start_color=COLORS.get('alert_red', 'F4CCCC'), end_color=COLORS.get('alert_red', 'F4CCCC'), fill_type='solid')
+RELLENO_TITULO_VERDE = PatternFill(start_color=COLORS['green'], end_color=COLORS['green'], fill_type='solid')
+RELLENO_TITULO_AZUL = PatternFill(start_color=COLORS['blue'], end_color=COLORS['blue'], fill_type='solid')
+
+# Estilos con nombre de X_Coordinación / X_Recuperador (se registran por libro)
+ESTILO_ENCABEZADO_RESUMEN = 'encabezado_resumen'
+ESTILO_MONEDA_RESUMEN = 'moneda_resumen'
+ESTILO_PORCENTAJE_RESUMEN = 'porcentaje_resumen'
+ESTILO_TEXTO_RESUMEN = 'texto_resumen'
+ESTILO_FUERA_DE_AREA = 'fuera_de_area_resumen'
+ESTILO_ENCABEZADO_LIQUIDACION = 'encabezado_liquidacion'
+ESTILO_DATOS_LIQUIDACION = 'datos_liquidacion'
+ESTILO_MANUAL_LIQUIDACION = 'manual_liquidacion'
+
+# Diseño fijo de la hoja 'Liquidación anticipada'
+ANCHOS_COLUMNAS_LIQUIDACION = (
+    ('A', 18),  # Código acreditado (más ancho para códigos largos)
+    ('B', 12),  # Ciclo
+    ('C', 25),  # Nombre (más ancho para nombres largos)
+    ('D', 20),  # Saldo interés vencido
+    ('E', 20),  # Saldo comisión vencida
+    ('F', 15),  # Saldo recargos
+    ('G', 18),  # Saldo capital
+    ('H', 18),  # Saldo adelantado
+    ('I', 22),  # Intereses próximo pago
+    ('J', 22),  # Comisiones próximo pago
+    ('K', 20),  # Cantidad a liquidar
+    ('L', 25),  # Cálculo válido hasta
+)
+COLUMNAS_MANUALES_LIQUIDACION = frozenset({'I', 'J', 'L'})  # Captura manual: relleno verde claro y negrita
+# BUSCARV de B3:G3: (celda, clave en columnas_mapeadas, nombre para el log, valor por defecto)
+CAMPOS_BUSCARV_LIQUIDACION = (
+    ('B3', 'ciclo', 'Ciclo', '""'),
+    ('C3', 'nombre_acreditado', 'Nombre acreditado', '""'),
+    ('D3', 'intereses_vencidos', 'Intereses vencidos', '0'),
+    ('E3', 'comision_vencida', 'Comisión vencida', '0'),
+    ('F3', 'recargos', 'Recargos', '0'),
+    ('G3', 'saldo_capital', 'Saldo capital', '0'),
+)
+
+class SinDatosError(ValueError):
+    """No hay datos suficientes para construir una hoja resumen (X_Coordinación / X_Recuperador)."""
+
+
+# Conjunto inmutable de códigos de fraude (se construye una sola vez al importar)
+CODIGOS_FRAUDE = frozenset(LISTA_FRAUDE)
+
 def allowed_file(filename):
     """Verifica que el archivo sea Excel"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -46,7 +175,6 @@ def move_to_reports_folder(file_path, report_type='individual'):
         new_path = os.path.join(REPORTS_FOLDER, new_filename)
         
         # Mover archivo
-        import shutil
         shutil.move(file_path, new_path)
         
         logger.info(f"✅ Archivo movido a directorio de reportes: {new_path}")
@@ -59,13 +187,28 @@ def move_to_reports_folder(file_path, report_type='individual'):
 def validate_file_size(file_path):
     """Valida que el archivo no exceda el tamaño máximo permitido"""
     try:
-        file_size = os.path.getsize(file_path)
+        # Una sola llamada a stat cubre existencia y tamaño
+        file_size = os.stat(file_path).st_size
         if file_size > MAX_FILE_SIZE:
             raise ValueError(f"El archivo excede el tamaño máximo de {MAX_FILE_SIZE // (1024*1024)}MB")
         return True
     except OSError as e:
         raise ValueError(f"Error al verificar el tamaño del archivo: {str(e)}")
 
+def motor_lectura_excel(archivo_path):
+    """Motor de lectura para el archivo: calamine lee .xlsx y .xls; sin él, los .xls van con xlrd"""
+    if EXCEL_READ_ENGINE == 'openpyxl' and archivo_path.lower().endswith('.xls'):
+        return 'xlrd'
+    return EXCEL_READ_ENGINE
+
+def leer_excel(archivo_path, nrows=None):
+    """Lee un archivo Excel de entrada con el motor más rápido disponible (ver EXCEL_READ_ENGINE).
+
+    Con nrows=0 solo se lee la fila de encabezados (suficiente para detectar_tipo_archivo).
+    """
+    return pd.read_excel(archivo_path, engine=motor_lectura_excel(archivo_path), dtype=DTYPE_CONFIG,
+                         header=0, nrows=nrows)
+
 def clean_dataframe_columns(df):
     """Limpia los nombres de columnas del DataFrame"""
     df.columns = df.columns.str.replace('\n', ' ').str.strip()
@@ -78,27 +221,46 @@ def standardize_codes(df, code_columns):
             df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(int).astype(str).str.zfill(6)
     return df
 
+def convertir_a_categoria(df, columnas):
+    """Convierte a dtype 'category' las columnas indicadas que existan en el DataFrame"""
+    for col in columnas:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    return df
+
+def mascara_codigos(serie, codigos):
+    """Máscara booleana de los valores de `serie` que están en `codigos`.
+
+    Factoriza la serie y compara solo los valores únicos contra el conjunto, en lugar de
+    buscar cada fila (los códigos estandarizados se repiten mucho entre créditos).
+    """
+    codes, uniques = pd.factorize(serie)
+    en_conjunto = np.fromiter((valor in codigos for valor in uniques), dtype=bool, count=len(uniques))
+    # El código -1 (nulos) toma el último elemento, que siempre es False
+    return np.append(en_conjunto, False)[codes]
+
 def clean_phone_numbers(df):
     """Limpia y estandariza números de teléfono"""
     df = df.copy()  # Crear copia para evitar SettingWithCopyWarning
-    for col in df.columns:
-        if 'Teléfono' in col:
-            df[col] = df[col].fillna('').astype(str)
+    columnas_telefono = df.columns[df.columns.str.contains('Teléfono', regex=False)]
+    if len(columnas_telefono):
+        df[columnas_telefono] = df[columnas_telefono].fillna('').astype(str)
     return df
 
 def add_geolocation_links(df, geolocation_column):
     """Añade columnas de enlaces de geolocalización al DataFrame"""
     df = df.copy()  # Crear copia para evitar SettingWithCopyWarning
     if geolocation_column in df.columns:
-        geolocalizacion_data = df[geolocation_column].apply(generar_link_google_maps)
-        df['link_texto'] = [item[0] for item in geolocalizacion_data]
-        df['link_url'] = [item[1] for item in geolocalizacion_data]
+        df['link_texto'] = "Ver en mapa"
+        df['link_url'] = generar_links_google_maps(df[geolocation_column])
     return df
 
 
 def add_par_column(df, mora_column):
-    """Añade columna PAR y la posiciona correctamente"""
-    df = df.copy()  # Crear copia para evitar SettingWithCopyWarning
+    """Añade columna PAR y la posiciona correctamente.
+    
+    Inserta sobre `df` sin copiarlo: los llamadores pasan el resultado nuevo de sort_values.
+    """
     
     # Solo eliminar columnas que sean exactamente "PAR" o variantes exactas de "PAR 2"
     columnas_par_exactas = []
@@ -112,18 +274,13 @@ def add_par_column(df, mora_column):
         logger.warning(f"⚠️ ELIMINANDO columnas PAR exactas: {columnas_par_exactas}")
         df = df.drop(columns=columnas_par_exactas, errors='ignore')
     
-    # Crear la columna PAR
-    df['PAR'] = df[mora_column].apply(asignar_rango_mora)
+    # Crear la columna PAR e insertarla al lado de 'Días de mora' (sin reindexar todo el DataFrame)
+    par_series = calcular_par(df[mora_column])
+    mora_index = df.columns.get_loc(mora_column)
+    df.insert(mora_index + 1, 'PAR', par_series)
     logger.info(f"✅ PAR creado")
     
-    # Reordenar columnas para que 'PAR' esté al lado de 'Días de mora'
-    columnas = df.columns.tolist()
-    mora_index = columnas.index(mora_column)
-    nuevas_columnas = (columnas[:mora_index+1] + 
-                      ['PAR'] + 
-                      columnas[mora_index+1:])
-    
-    return df[nuevas_columnas]
+    return df
 
 
 def generate_valid_table_name(sheet_name):
@@ -141,7 +298,6 @@ def generate_valid_table_name(sheet_name):
     clean_name = str(sheet_name).replace(' ', '_').replace('-', '_')
     
     # Remover caracteres no válidos (mantener solo letras, números, guiones bajos y puntos)
-    import re
     clean_name = re.sub(r'[^a-zA-Z0-9_.]', '', clean_name)
     
     # Asegurar que empiece con una letra o guión bajo
@@ -182,8 +338,7 @@ def generar_link_google_maps(geolocalizacion):
         try:
             # Extraer coordenadas usando regex
             # Patrón para coordenadas: 19°12'12.2"N 100°07'51.8"W
-            coord_pattern = r"(\d+)°(\d+)'([\d.]+)\"([NS])\s+(\d+)°(\d+)'([\d.]+)\"([WE])"
-            match = re.search(coord_pattern, geolocalizacion)
+            match = PATRON_COORDENADAS.search(geolocalizacion)
             
             if match:
                 lat_deg, lat_min, lat_sec, lat_dir = match.groups()[:4]
@@ -200,16 +355,62 @@ def generar_link_google_maps(geolocalizacion):
                     lon_decimal = -lon_decimal
                 
                 # Crear URL de Google Maps
-                url = f"https://www.google.com/maps/search/?api=1&query={lat_decimal},{lon_decimal}"
+                url = f"{URL_BUSQUEDA_MAPS}{lat_decimal},{lon_decimal}"
                 return ("Ver en mapa", url)
         except:
             pass
     
     # Caso 4: Dirección de texto - crear búsqueda
     direccion_encoded = urllib.parse.quote_plus(geolocalizacion)
-    url = f"https://www.google.com/maps/search/?api=1&query={direccion_encoded}"
+    url = f"{URL_BUSQUEDA_MAPS}{direccion_encoded}"
     return ("Ver en mapa", url)
 
+def generar_links_google_maps(geolocalizaciones):
+    """
+    Versión vectorizada de generar_link_google_maps: devuelve la serie de URLs para toda la columna.
+    
+    Vacíos y URLs existentes se resuelven con operaciones de texto sobre la serie; las coordenadas se
+    extraen con un solo str.extract y solo las direcciones de texto pasan por quote_plus.
+    """
+    texto = geolocalizaciones.astype(str).str.strip()
+    vacio = (geolocalizaciones.isna() | texto.eq('')).to_numpy()
+    es_url = ~vacio & (texto.str.contains('http', regex=False)
+                       | texto.str.contains('google.com/maps', regex=False)).to_numpy()
+    urls = np.full(len(texto), "https://maps.google.com", dtype=object)
+    urls[es_url] = texto.to_numpy()[es_url]
+    
+    posiciones_resto = np.flatnonzero(~(vacio | es_url))
+    if len(posiciones_resto):
+        resto = texto.iloc[posiciones_resto]
+        partes = resto.str.extract(PATRON_COORDENADAS)
+        # Mismo cálculo y mismo orden de operaciones que la versión por fila
+        numeros = partes[[0, 1, 2, 4, 5, 6]].apply(pd.to_numeric, errors='coerce')
+        es_coord = numeros.notna().all(axis=1).to_numpy()
+        if es_coord.any():
+            lat = numeros[0] + numeros[1] / 60 + numeros[2] / 3600
+            lon = numeros[4] + numeros[5] / 60 + numeros[6] / 3600
+            lat = lat.where(partes[3].ne('S'), -lat)[es_coord]
+            lon = lon.where(partes[7].ne('W'), -lon)[es_coord]
+            urls[posiciones_resto[es_coord]] = [
+                f"{URL_BUSQUEDA_MAPS}{lat_decimal},{lon_decimal}"
+                for lat_decimal, lon_decimal in zip(lat.tolist(), lon.tolist())
+            ]
+        direcciones = resto.to_numpy()[~es_coord]
+        urls[posiciones_resto[~es_coord]] = [URL_BUSQUEDA_MAPS + urllib.parse.quote_plus(d) for d in direcciones]
+    return pd.Series(urls, index=geolocalizaciones.index)
+
+def calcular_par(dias_mora):
+    """
+    Versión vectorizada de asignar_rango_mora para una serie completa de días de mora.
+    
+    Un solo searchsorted sobre los límites reemplaza la llamada a Python por fila.
+    """
+    dias = pd.to_numeric(dias_mora, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+    posiciones = np.searchsorted(PAR_LIMITES_SUPERIORES, dias, side='left') + 1
+    # Nulos (searchsorted los manda al final) y menos de 1 día caen en '0'
+    posiciones[~(dias >= 1)] = 0
+    return pd.Series(PAR_ETIQUETAS[posiciones], index=dias_mora.index)
+
 def asignar_rango_mora(dias_mora):
     """
     Asigna valor PAR (Período de Antigüedad de Recuperación) basado en días de mora.
@@ -241,15 +442,31 @@ def asignar_rango_mora(dias_mora):
     else:
         return 'Mayor_180'
 
-def escribir_hipervinculo_excel(worksheet, row, col, texto, url):
-    """Escribe un hipervínculo en una celda de Excel usando fórmula HYPERLINK (más confiable con openpyxl)."""
-    cell = worksheet.cell(row=row, column=col)
-    if url and pd.notna(url) and str(url).strip():
-        # Escapar comillas dobles en texto y url para la fórmula
-        url_safe = str(url).replace('"', '""')
-        texto_safe = str(texto).replace('"', '""') if pd.notna(texto) and str(texto).strip() else 'Link'
-        cell.value = f'=HYPERLINK("{url_safe}","{texto_safe}")'
-        cell.font = Font(color="0000FF", underline="single")
+def escribir_hipervinculos_columna(worksheet, col, df_links, fila_inicio=3):
+    """
+    Escribe en la columna `col` los hipervínculos de 'link_texto'/'link_url' de df_links (una fila por registro)
+    usando la fórmula HYPERLINK (más confiable con openpyxl).
+    
+    Las fórmulas se arman de forma vectorizada sobre las columnas del DataFrame; solo se visitan
+    las celdas de los registros con URL.
+    """
+    if 'link_texto' not in df_links.columns or 'link_url' not in df_links.columns:
+        return
+    urls = df_links['link_url']
+    textos = df_links['link_texto']
+    urls_txt = urls.astype(str)
+    textos_txt = textos.astype(str)
+    con_url = (urls.notna() & urls_txt.str.strip().ne('')).to_numpy()
+    if not con_url.any():
+        return
+    # Texto por defecto 'Link' si no hay texto; comillas dobles escapadas para la fórmula
+    textos_txt = textos_txt.where(textos.notna() & textos_txt.str.strip().ne(''), 'Link')
+    formulas = ('=HYPERLINK("' + urls_txt.str.replace('"', '""', regex=False) + '","'
+                + textos_txt.str.replace('"', '""', regex=False) + '")').to_numpy()
+    # El valor se pasa al crear la celda; la fuente compartida es la única otra asignación por fila
+    celda = worksheet.cell
+    for posicion in np.flatnonzero(con_url).tolist():
+        celda(row=fila_inicio + posicion, column=col, value=formulas[posicion]).font = FUENTE_HIPERVINCULO
 
 def generar_concepto_deposito(df):
     """
@@ -269,6 +486,36 @@ def generar_concepto_deposito(df):
     
     return concepto_deposito
 
+def _calcular_concepto_deposito(df):
+    """Calcula la Serie 'Concepto Depósito' (solo el ciclo mayor por código recibe valor)."""
+    # Asegurar que Código acreditado tenga 6 dígitos y Ciclo tenga 2 dígitos
+    codigo = df['Código acreditado'].astype(str).str.strip().str.zfill(6)
+    ciclo_str = df['Ciclo'].astype(str).str.strip().str.zfill(2)
+    ciclo_num = pd.to_numeric(df['Ciclo'], errors='coerce').fillna(0)
+    
+    # Generar concepto temporalmente
+    concepto_temporal = '1' + codigo + ciclo_str
+    
+    # Para cada código, identificar la fila con el ciclo mayor
+    concepto = pd.Series([''] * len(df))
+    
+    for codigo_unico in codigo.unique():
+        # Encontrar todas las filas con este código
+        mascara = codigo == codigo_unico
+        indices = df.index[mascara]
+        
+        if len(indices) > 1:
+            # Hay duplicados: encontrar el índice con el ciclo mayor
+            ciclos_valores = ciclo_num.loc[indices]
+            indice_ciclo_mayor = ciclos_valores.idxmax()
+            concepto.loc[indice_ciclo_mayor] = concepto_temporal.loc[indice_ciclo_mayor]
+            logger.info(f"🔍 Código {codigo_unico}: {len(indices)} duplicados, asignado a ciclo {ciclo_str.loc[indice_ciclo_mayor]}")
+        else:
+            # No hay duplicados: asignar normalmente
+            concepto.loc[indices[0]] = concepto_temporal.loc[indices[0]]
+    
+    return concepto
+
 def agregar_columna_concepto_deposito(df):
     """
     Agrega la columna 'Concepto Depósito' después de 'Forma de entrega' si existe,
@@ -280,40 +527,17 @@ def agregar_columna_concepto_deposito(df):
         logger.warning("⚠️ No se puede generar 'Concepto Depósito': faltan columnas 'Código acreditado' o 'Ciclo'")
         concepto = pd.Series([''] * len(df))
     else:
-        # Asegurar que Código acreditado tenga 6 dígitos y Ciclo tenga 2 dígitos
-        codigo = df['Código acreditado'].astype(str).str.strip().str.zfill(6)
-        ciclo_str = df['Ciclo'].astype(str).str.strip().str.zfill(2)
-        ciclo_num = pd.to_numeric(df['Ciclo'], errors='coerce').fillna(0)
-        
-        # Generar concepto temporalmente
-        concepto_temporal = '1' + codigo + ciclo_str
-        
-        # Para cada código, identificar la fila con el ciclo mayor
-        concepto = pd.Series([''] * len(df))
-        
-        for codigo_unico in codigo.unique():
-            # Encontrar todas las filas con este código
-            mascara = codigo == codigo_unico
-            indices = df.index[mascara]
-            
-            if len(indices) > 1:
-                # Hay duplicados: encontrar el índice con el ciclo mayor
-                ciclos_valores = ciclo_num.loc[indices]
-                indice_ciclo_mayor = ciclos_valores.idxmax()
-                concepto.loc[indice_ciclo_mayor] = concepto_temporal.loc[indice_ciclo_mayor]
-                logger.info(f"🔍 Código {codigo_unico}: {len(indices)} duplicados, asignado a ciclo {ciclo_str.loc[indice_ciclo_mayor]}")
-            else:
-                # No hay duplicados: asignar normalmente
-                concepto.loc[indices[0]] = concepto_temporal.loc[indices[0]]
+        concepto = _calcular_concepto_deposito(df)
     
     # Buscar la columna 'Forma de entrega'
     columna_forma_entrega = None
     for col in df.columns:
-        if 'forma de entrega' in str(col).lower() or 'forma entrega' in str(col).lower():
+        col_lower = str(col).lower()
+        if 'forma de entrega' in col_lower or 'forma entrega' in col_lower:
             columna_forma_entrega = col
             break
     
-    if columna_forma_entrega and columna_forma_entrega in df.columns:
+    if columna_forma_entrega is not None:
         # Insertar después de 'Forma de entrega'
         forma_index = df.columns.get_loc(columna_forma_entrega)
         df.insert(forma_index + 1, 'Concepto Depósito', concepto)
@@ -325,7 +549,48 @@ def agregar_columna_concepto_deposito(df):
     
     return df
 
-def agregar_columnas_riesgo_y_mora(df):
+def _calcular_riesgo_y_mora(df):
+    """Calcula las Series 'Saldo riesgo capital', 'Saldo riesgo total' y '% MORA'."""
+    # Operaciones por columna en lugar de apply(axis=1), que construye una Series por fila
+    en_mora = df['Días de mora'] > 0  # NaN > 0 es False
+    
+    # Calcular Saldo riesgo capital = IF(Días de mora > 0, Saldo capital, 0)
+    saldo_riesgo_capital = df['Saldo capital'].where(en_mora, 0)
+    
+    # Calcular Saldo riesgo total = IF(Días de mora > 0, Saldo total, 0)
+    saldo_riesgo_total = df['Saldo total'].where(en_mora, 0)
+    
+    # Calcular % MORA = Saldo vencido / Saldo total (0 si el saldo total es nulo o cero)
+    saldo_total = df['Saldo total']
+    pct_mora = (df['Saldo vencido'] / saldo_total).where(saldo_total.notna() & saldo_total.ne(0), 0)
+    
+    return saldo_riesgo_capital, saldo_riesgo_total, pct_mora
+
+def completar_columnas_riesgo(df, series_base=None):
+    """
+    Devuelve `df` con las columnas de COLUMNAS_DERIVADAS_RIESGO que le falten, sin modificar `df`.
+    
+    Usa `series_base` (calcular_riesgo_y_mora_base del mismo DataFrame) si viene; si no, las calcula
+    por columnas con _calcular_riesgo_y_mora. Si faltan columnas fuente, `df` se devuelve sin cambios.
+    """
+    faltantes = [col for col in COLUMNAS_DERIVADAS_RIESGO if col not in df.columns]
+    if not faltantes or any(col not in df.columns for col in COLUMNAS_RIESGO_Y_MORA):
+        return df
+    logger.info("🔍 Calculando %s (no existen en df_completo)", faltantes)
+    series = series_base if series_base is not None else _calcular_riesgo_y_mora(df)
+    return df.assign(**{col: serie for col, serie in zip(COLUMNAS_DERIVADAS_RIESGO, series) if col in faltantes})
+
+def calcular_riesgo_y_mora_base(df):
+    """
+    Calcula las Series de riesgo y % MORA de un DataFrame base para que los
+    subconjuntos de filas (Mora, Saldo vencido) las tomen por índice en lugar de recalcularlas.
+    Devuelve None si faltan columnas o si el índice no es único.
+    """
+    if any(col not in df.columns for col in COLUMNAS_RIESGO_Y_MORA) or not df.index.is_unique:
+        return None
+    return _calcular_riesgo_y_mora(df)
+
+def agregar_columnas_riesgo_y_mora(df, series_base=None):
     """
     Agrega las columnas 'Saldo riesgo capital', 'Saldo riesgo total' y '% MORA' 
     después de 'Concepto Depósito' si existe, o al final si no existe.
@@ -334,9 +599,12 @@ def agregar_columnas_riesgo_y_mora(df):
     - Saldo riesgo capital = IF(Días de mora > 0, Saldo capital, 0)
     - Saldo riesgo total = IF(Días de mora > 0, Saldo total, 0)
     - % MORA = Saldo vencido / Saldo total
+    
+    Las fórmulas son por fila: si `series_base` (calcular_riesgo_y_mora_base) viene de un DataFrame
+    del que `df` es un subconjunto de filas, los valores se toman por índice sin recalcular.
     """
     # Verificar que existan las columnas necesarias
-    columnas_requeridas = ['Días de mora', 'Saldo capital', 'Saldo total', 'Saldo vencido']
+    columnas_requeridas = COLUMNAS_RIESGO_Y_MORA
     columnas_faltantes = [col for col in columnas_requeridas if col not in df.columns]
     
     if columnas_faltantes:
@@ -347,25 +615,10 @@ def agregar_columnas_riesgo_y_mora(df):
         df['% MORA'] = 0
         return df
     
-    # Calcular Saldo riesgo capital = IF(Días de mora > 0, Saldo capital, 0)
-    saldo_riesgo_capital = df.apply(
-        lambda row: row['Saldo capital'] if pd.notna(row['Días de mora']) and row['Días de mora'] > 0 else 0,
-        axis=1
-    )
-    
-    # Calcular Saldo riesgo total = IF(Días de mora > 0, Saldo total, 0)
-    saldo_riesgo_total = df.apply(
-        lambda row: row['Saldo total'] if pd.notna(row['Días de mora']) and row['Días de mora'] > 0 else 0,
-        axis=1
-    )
-    
-    # Calcular % MORA = Saldo vencido / Saldo total
-    pct_mora = df.apply(
-        lambda row: (row['Saldo vencido'] / row['Saldo total']) 
-                    if pd.notna(row['Saldo total']) and row['Saldo total'] != 0 
-                    else 0,
-        axis=1
-    )
+    if series_base is not None:
+        saldo_riesgo_capital, saldo_riesgo_total, pct_mora = (serie.loc[df.index] for serie in series_base)
+    else:
+        saldo_riesgo_capital, saldo_riesgo_total, pct_mora = _calcular_riesgo_y_mora(df)
     
     # Buscar la columna 'Concepto Depósito' para insertar después
     if 'Concepto Depósito' in df.columns:
@@ -384,12 +637,50 @@ def agregar_columnas_riesgo_y_mora(df):
     
     return df
 
+def eliminar_columnas_duplicadas(df, nombre_hoja):
+    """
+    Quita las columnas con nombre repetido (conserva la primera aparición).
+    
+    `columns.is_unique` reutiliza la tabla hash del índice de columnas, así que la máscara de
+    duplicadas solo se calcula (una vez, para el log y el filtrado) cuando realmente las hay.
+    """
+    if df.columns.is_unique:
+        return df
+    duplicadas = df.columns.duplicated()
+    logger.error("🚨 COLUMNAS DUPLICADAS encontradas en %s: %s", nombre_hoja, df.columns[duplicadas].tolist())
+    logger.info("🗑️ Columnas duplicadas eliminadas de %s", nombre_hoja)
+    return df.loc[:, ~duplicadas]
+
+
+def preparar_df_hoja_detalle(df, nombre_hoja, series_base=None):
+    """
+    Prepara el DataFrame de una hoja de detalle (Informe completo, Mora, Saldo vencido) para escribirlo.
+    
+    Elimina columnas duplicadas, quita las columnas temporales de links y agrega 'Concepto Depósito'
+    y las columnas de riesgo. `drop` ya devuelve un DataFrame nuevo, así que las columnas derivadas
+    se insertan sobre él sin copias adicionales. `series_base` se pasa a agregar_columnas_riesgo_y_mora
+    cuando `df` es un subconjunto de filas del DataFrame base.
+    
+    Returns:
+        tuple: (DataFrame sin columnas duplicadas, DataFrame listo para to_excel)
+    """
+    df = eliminar_columnas_duplicadas(df, nombre_hoja)
+    
+    # DIAGNÓSTICO FINAL: Verificar columnas PAR antes de escribir
+    if logger.isEnabledFor(logging.DEBUG):
+        columnas_par = [col for col in df.columns if 'par' in str(col).lower()]
+        logger.debug("🔍 Columnas PAR en %s FINAL: %s", nombre_hoja, columnas_par)
+    
+    df_sin_links = df.drop(columns=['link_texto', 'link_url'], errors='ignore')
+    df_sin_links = agregar_columna_concepto_deposito(df_sin_links)
+    df_sin_links = agregar_columnas_riesgo_y_mora(df_sin_links, series_base)
+    return df, df_sin_links
+
 def _normalizar_texto_para_mapeo(s):
     """Normaliza texto para búsqueda en mapeo (minúsculas, sin tildes)."""
     if pd.isna(s):
         return ''
     s = str(s).strip().lower()
-    import unicodedata
     s = unicodedata.normalize('NFD', s)
     return ''.join(c for c in s if unicodedata.category(c) != 'Mn')
 
@@ -460,13 +751,13 @@ def aplicar_formatos_moneda_fecha_openpyxl(ws, df, num_filas):
 
         # Formato moneda
         if any(k in col_lower for k in CURRENCY_COLUMNS_KEYWORDS) and col_lower not in _NO_MONEDA:
-            for row in range(fila_inicio, fila_fin):
-                ws.cell(row=row, column=col_idx).number_format = EXCEL_CONFIG['currency_format']
+            for (cell,) in ws.iter_rows(min_row=fila_inicio, max_row=fila_fin - 1, min_col=col_idx, max_col=col_idx):
+                cell.number_format = EXCEL_CONFIG['currency_format']
 
         # Formato fecha corta (solo columnas datetime en el df)
         elif df[col_name].dtype in ('datetime64[ns]', 'datetime64[ns, UTC]') or str(df[col_name].dtype).startswith('datetime'):
-            for row in range(fila_inicio, fila_fin):
-                ws.cell(row=row, column=col_idx).number_format = EXCEL_CONFIG['date_format']
+            for (cell,) in ws.iter_rows(min_row=fila_inicio, max_row=fila_fin - 1, min_col=col_idx, max_col=col_idx):
+                cell.number_format = EXCEL_CONFIG['date_format']
 
 
 def agregar_columnas_nuevas(df):
@@ -523,12 +814,11 @@ def limpiar_celda_segura(cell):
         True si se pudo limpiar, False si es MergedCell
     """
     try:
-        from openpyxl.cell.cell import MergedCell
         if isinstance(cell, MergedCell):
             return False  # No se puede modificar MergedCell
         cell.value = None
-        cell.fill = PatternFill(start_color='FFFFFF', end_color='FFFFFF', fill_type='solid')
-        cell.border = Border()
+        cell.fill = RELLENO_BLANCO
+        cell.border = BORDE_VACIO
         return True
     except (AttributeError, TypeError, ImportError):
         # Si hay error, intentar solo limpiar el valor
@@ -540,7 +830,229 @@ def limpiar_celda_segura(cell):
             pass
         return False
 
-def crear_hoja_x_coordinacion(df_completo):
+
+def escribir_resumen_en_hoja(workbook, nombre_hoja, df, fila_datos=11):
+    """
+    Crea la hoja y escribe los datos del DataFrame a partir de `fila_datos`, sin encabezado
+    (los encabezados de las hojas resumen se escriben directamente en la fila 6) y sin pasar por
+    el ExcelFormatter de pandas. Las filas se recorren con itertuples (una tupla por fila, sin
+    copiar el DataFrame completo) y los NaN quedan como celdas vacías, igual que con to_excel.
+    
+    Se escribe directamente en el libro de openpyxl que se está armando: generar estos valores con
+    otra librería (p. ej. pyexcelerate) obligaría a guardar y volver a abrir todo el archivo para
+    aplicar los estilos, y los resúmenes solo tienen unas cuantas filas por coordinación/recuperador.
+    
+    Returns:
+        La hoja creada
+    """
+    worksheet = workbook.create_sheet(nombre_hoja)
+    for fila, valores in enumerate(df.itertuples(index=False, name=None), start=fila_datos):
+        for col, valor in enumerate(valores, start=1):
+            worksheet.cell(row=fila, column=col, value=None if pd.isna(valor) else valor)
+    return worksheet
+
+
+def registrar_estilos_resumen(workbook):
+    """
+    Registra en el libro los estilos con nombre de las hojas resumen (solo la primera vez).
+    Asignar `cell.style = nombre` aplica fuente, relleno, formato, alineación y borde con una sola referencia.
+    """
+    estilos = {
+        ESTILO_ENCABEZADO_RESUMEN: dict(font=FUENTE_ENCABEZADO, fill=RELLENO_AZUL_CLARO,
+                                        alignment=ALINEACION_CENTRO_AJUSTE, border=BORDE_DELGADO),
+        ESTILO_MONEDA_RESUMEN: dict(number_format=EXCEL_CONFIG['currency_format'], font=DEFAULT_FONT,
+                                    alignment=ALINEACION_DERECHA, border=BORDE_DELGADO),
+        ESTILO_PORCENTAJE_RESUMEN: dict(number_format='0.00%', font=DEFAULT_FONT,
+                                        alignment=ALINEACION_DERECHA, border=BORDE_DELGADO),
+        ESTILO_TEXTO_RESUMEN: dict(font=DEFAULT_FONT, alignment=ALINEACION_IZQUIERDA, border=BORDE_DELGADO),
+        ESTILO_FUERA_DE_AREA: dict(font=FUENTE_DEFAULT, fill=RELLENO_BLANCO, alignment=ALINEACION_DEFAULT,
+                                   border=BORDE_VACIO),
+    }
+    _registrar_estilos(workbook, estilos)
+
+
+def registrar_estilos_liquidacion(workbook):
+    """Registra en el libro los estilos con nombre de la hoja 'Liquidación anticipada' (solo la primera vez)."""
+    estilos = {
+        ESTILO_ENCABEZADO_LIQUIDACION: dict(font=FUENTE_LIQUIDACION_ENCABEZADO, fill=RELLENO_LIQUIDACION_ENCABEZADO,
+                                            alignment=ALINEACION_CENTRO_AJUSTE, border=BORDE_GRIS_DELGADO),
+        ESTILO_DATOS_LIQUIDACION: dict(font=FUENTE_LIQUIDACION_DATOS, alignment=ALINEACION_CENTRO_AJUSTE,
+                                       border=BORDE_GRIS_DELGADO),
+        ESTILO_MANUAL_LIQUIDACION: dict(font=FUENTE_LIQUIDACION_MANUAL, fill=RELLENO_VERDE_CLARO,
+                                        alignment=ALINEACION_CENTRO_AJUSTE, border=BORDE_GRIS_DELGADO),
+    }
+    _registrar_estilos(workbook, estilos)
+
+
+def _registrar_estilos(workbook, estilos):
+    """Agrega al libro los estilos {nombre: atributos} que todavía no estén registrados."""
+    for nombre, atributos in estilos.items():
+        if nombre not in workbook.named_styles:
+            workbook.add_named_style(NamedStyle(name=nombre, **atributos))
+
+
+def aplicar_formato_datos_resumen(worksheet, posicion_columna, columnas_moneda, columnas_texto, max_fila):
+    """
+    Formatea las filas de datos (11+) de una hoja resumen en un solo recorrido por fila:
+    moneda y % MORA con sus estilos con nombre (solo celdas con valor) y columnas de texto
+    alineadas a la izquierda con borde (todas las filas).
+    
+    Excel no aplica el estilo de columna (column_dimensions) a celdas que ya tienen valor,
+    así que el formato se asigna por celda, pero con un solo estilo con nombre por celda.
+    
+    Args:
+        worksheet: Hoja de openpyxl
+        posicion_columna: dict {nombre de columna: posición en Excel (1-indexada)}
+        columnas_moneda: Nombres de columnas con formato de moneda
+        columnas_texto: Nombres de columnas de texto
+        max_fila: Última fila de la hoja
+    """
+    cols_moneda = {posicion_columna[col] for col in columnas_moneda if col in posicion_columna}
+    cols_texto = {posicion_columna[col] for col in columnas_texto if col in posicion_columna}
+    col_porcentaje = posicion_columna.get('% MORA')
+    cols_formato = cols_moneda | cols_texto | ({col_porcentaje} if col_porcentaje else set())
+    if not cols_formato:
+        return
+    
+    for fila_celdas in worksheet.iter_rows(min_row=11, max_row=max_fila, max_col=max(cols_formato)):
+        for cell in fila_celdas:
+            col = cell.column
+            if col in cols_texto:
+                cell.style = ESTILO_TEXTO_RESUMEN
+            elif cell.value is None:
+                continue
+            elif col in cols_moneda:
+                cell.style = ESTILO_MONEDA_RESUMEN
+            elif col == col_porcentaje:
+                cell.style = ESTILO_PORCENTAJE_RESUMEN
+
+
+def resaltar_filas_total(worksheet, es_total, max_columna, fila_inicio=11):
+    """
+    Resalta con azul claro las filas 'Total' de una hoja resumen.
+    
+    Args:
+        worksheet: Hoja de openpyxl
+        es_total: Máscara booleana (una posición por fila del DataFrame) de las filas Total
+        max_columna: Última columna a resaltar
+        fila_inicio: Fila de Excel donde empieza la primera fila de datos
+    """
+    for posicion in np.flatnonzero(es_total):
+        fila_total = fila_inicio + int(posicion)
+        for fila_celdas in worksheet.iter_rows(min_row=fila_total, max_row=fila_total, max_col=max_columna):
+            for cell in fila_celdas:
+                cell.fill = RELLENO_AZUL_CLARO
+                cell.font = FUENTE_TOTAL
+                cell.border = BORDE_DELGADO
+
+
+def limpiar_fuera_de_area(worksheet, columnas_area_por_fila, max_fila=None, max_columna=None):
+    """
+    Limpia todas las celdas fuera del área principal de una hoja resumen
+    (blancas, sin bordes, fuente y alineación por defecto) con el estilo con nombre ESTILO_FUERA_DE_AREA.
+    
+    Las celdas fuera del área deben conservarse (filas 7-10 ocultas, columna separadora entre tablas),
+    así que no se usan delete_rows/delete_cols: solo se visitan las posiciones fuera del área.
+    
+    Args:
+        worksheet: Hoja de openpyxl
+        columnas_area_por_fila: dict {fila: set de columnas dentro del área};
+            las filas ausentes se consideran completamente fuera del área
+        max_fila, max_columna: Dimensiones ya conocidas de la hoja (si no se pasan, se leen de la hoja)
+    """
+    sin_area = frozenset()
+    registrar_estilos_resumen(worksheet.parent)
+    if max_fila is None:
+        max_fila = worksheet.max_row
+    if max_columna is None:
+        max_columna = worksheet.max_column
+    # Posiciones (0-indexadas) fuera del área, calculadas una vez por cada conjunto de columnas distinto
+    # (todas las filas de datos comparten el mismo conjunto); las celdas del área ni se visitan
+    fuera_por_area = {}
+    for fila_celdas in worksheet.iter_rows(max_row=max_fila, max_col=max_columna):
+        area = columnas_area_por_fila.get(fila_celdas[0].row, sin_area)
+        fuera = fuera_por_area.get(id(area))
+        if fuera is None:
+            fuera = fuera_por_area[id(area)] = [i for i in range(max_columna) if i + 1 not in area]
+        for i in fuera:
+            cell = fila_celdas[i]
+            if isinstance(cell, MergedCell):
+                continue  # No se puede modificar MergedCell
+            cell.value = None
+            cell.style = ESTILO_FUERA_DE_AREA
+
+def codigos_rango_mora(dias):
+    """
+    Posición en RANGOS_MORA_ETIQUETAS de cada valor de días de mora (arreglo float).
+    
+    Días nulos cuentan como 0; lo que no cae en ningún intervalo de RANGOS_MORA_INTERVALOS es Mayor_90.
+    """
+    dias = np.nan_to_num(dias, nan=0.0)
+    condiciones = [(dias >= inferior) & (dias <= superior) for inferior, superior in RANGOS_MORA_INTERVALOS]
+    return np.select(condiciones, np.arange(len(condiciones)), default=len(RANGOS_MORA_INTERVALOS))
+
+def riesgo_para_rangos(df_completo, columnas_grupo, columna_riesgo):
+    """
+    Saldo en riesgo (float) que se reparte en los Rango_*; NaN en las filas que no cuentan.
+    
+    Las filas sin coordinación (primera columna de `columnas_grupo`) no suman en ningún rango:
+    sus grupos se reportan con Rango_* en 0, como en el filtro original por igualdad, que nunca
+    coincide con un valor nulo.
+    """
+    riesgo = pd.to_numeric(df_completo[columna_riesgo], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+    return np.where(df_completo[columnas_grupo[0]].isna().to_numpy(), np.nan, riesgo)
+
+def agregar_rangos_mora(grupo, df_completo, columnas_grupo, columna_mora='Días de mora', columna_riesgo='Saldo riesgo total'):
+    """
+    Agrega a `grupo` las columnas Rango_* con la suma de Saldo riesgo total por rango de días de mora.
+    
+    Los rangos se asignan con codigos_rango_mora sobre todo df_completo y se suman con un único
+    groupby, en lugar de recorrer las filas de cada grupo.
+    """
+    columnas_rango = [f'Rango_{etiqueta}' for etiqueta in RANGOS_MORA_ETIQUETAS]
+    
+    if columna_mora not in df_completo.columns or columna_riesgo not in df_completo.columns:
+        for col in columnas_rango:
+            grupo[col] = 0
+        return grupo
+    
+    dias = pd.to_numeric(df_completo[columna_mora], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+    rango = pd.Series(
+        np.asarray(RANGOS_MORA_ETIQUETAS, dtype=object)[codigos_rango_mora(dias)],
+        index=df_completo.index, name='_rango'
+    )
+    claves = [df_completo[col] for col in columnas_grupo] + [rango]
+    rangos = (
+        pd.Series(riesgo_para_rangos(df_completo, columnas_grupo, columna_riesgo), index=df_completo.index)
+        .groupby(claves, dropna=False, observed=True)
+        .sum()
+        .unstack(fill_value=0)
+        .reindex(columns=RANGOS_MORA_ETIQUETAS, fill_value=0)
+    )
+    rangos.columns = columnas_rango
+    
+    grupo = grupo.merge(rangos.reset_index(), on=columnas_grupo, how='left')
+    grupo[columnas_rango] = grupo[columnas_rango].fillna(0)
+    return grupo
+
+def calcular_resumen_grupos(df_completo, columnas_grupo, columna_mora='Días de mora', columna_riesgo='Saldo riesgo total'):
+    """
+    Agrupa df_completo por `columnas_grupo` y devuelve las sumas de COLUMNAS_SUMA_RESUMEN,
+    el % MORA del grupo (Saldo vencido / Saldo total) y las columnas Rango_*.
+    """
+    grupo = df_completo.groupby(columnas_grupo, dropna=False, observed=True).agg(
+        {col: 'sum' for col in COLUMNAS_SUMA_RESUMEN}
+    ).reset_index()
+    # Rangos de días de mora por grupo (una sola agrupación vectorizada)
+    grupo = agregar_rangos_mora(grupo, df_completo, columnas_grupo, columna_mora, columna_riesgo)
+    
+    # % MORA = Saldo vencido / Saldo total (por grupo); 0 cuando Saldo total es 0 o nulo
+    saldo_total = grupo['Saldo total']
+    grupo.insert(len(columnas_grupo) + len(COLUMNAS_SUMA_RESUMEN), '% MORA',
+                 (grupo['Saldo vencido'] / saldo_total.where(saldo_total != 0)).fillna(0.0))
+    return grupo
+
+def crear_hoja_x_coordinacion(df_completo, series_base=None):
     """
     Crea la hoja 'X_Coordinación' con datos agregados por coordinación.
     
@@ -554,6 +1066,7 @@ def crear_hoja_x_coordinacion(df_completo):
     
     Args:
         df_completo: DataFrame completo con todos los datos procesados
+        series_base: Series de calcular_riesgo_y_mora_base de df_completo (opcional)
         
     Returns:
         DataFrame con la estructura de la hoja X_Coordinación
@@ -574,29 +1087,8 @@ def crear_hoja_x_coordinacion(df_completo):
         'Días de mora'
     ]
     
-    # Verificar y calcular columnas de riesgo si no existen
-    if 'Saldo riesgo capital' not in df_completo.columns:
-        logger.info("🔍 Calculando 'Saldo riesgo capital' (no existe en df_completo)")
-        df_completo['Saldo riesgo capital'] = df_completo.apply(
-            lambda row: row['Saldo capital'] if pd.notna(row.get('Días de mora', 0)) and row.get('Días de mora', 0) > 0 else 0,
-            axis=1
-        )
-    
-    if 'Saldo riesgo total' not in df_completo.columns:
-        logger.info("🔍 Calculando 'Saldo riesgo total' (no existe en df_completo)")
-        df_completo['Saldo riesgo total'] = df_completo.apply(
-            lambda row: row['Saldo total'] if pd.notna(row.get('Días de mora', 0)) and row.get('Días de mora', 0) > 0 else 0,
-            axis=1
-        )
-    
-    if '% MORA' not in df_completo.columns:
-        logger.info("🔍 Calculando '% MORA' (no existe en df_completo)")
-        df_completo['% MORA'] = df_completo.apply(
-            lambda row: (row['Saldo vencido'] / row['Saldo total']) 
-                        if pd.notna(row.get('Saldo total', 0)) and row.get('Saldo total', 0) != 0 
-                        else 0,
-            axis=1
-        )
+    # Completar columnas de riesgo si no existen (en un DataFrame nuevo; el del llamador no se modifica)
+    df_completo = completar_columnas_riesgo(df_completo, series_base)
     
     # Verificar columnas requeridas después de calcular las que faltaban
     columnas_faltantes = [col for col in columnas_requeridas if col not in df_completo.columns]
@@ -604,102 +1096,21 @@ def crear_hoja_x_coordinacion(df_completo):
         logger.warning(f"⚠️ Columnas faltantes para X_Coordinación después de calcular: {columnas_faltantes}")
         logger.warning(f"🔍 Columnas disponibles en df_completo: {list(df_completo.columns)[:30]}")
         logger.warning(f"🔍 Total columnas: {len(df_completo.columns)}")
-        # Crear DataFrame vacío con estructura mínima
-        return pd.DataFrame()
+        raise SinDatosError(f"Columnas faltantes para X_Coordinación: {columnas_faltantes}")
     
     logger.info(f"✅ Todas las columnas requeridas están presentes. Total registros: {len(df_completo)}")
     
     # Agrupar por Coordinación y calcular agregaciones
-    grupo = df_completo.groupby(columna_coordinacion, dropna=False).agg({
-        'Cantidad Prestada': 'sum',
-        'Saldo capital': 'sum',
-        'Saldo vencido': 'sum',
-        'Saldo total': 'sum',
-        'Saldo riesgo capital': 'sum',
-        'Saldo riesgo total': 'sum',
-        '% MORA': 'mean'  # Promedio del porcentaje (se recalculará después)
-    }).reset_index()
-    
-    # Calcular % MORA correcto (promedio ponderado o recálculo)
-    # % MORA = Saldo vencido / Saldo total (por coordinación)
-    grupo['% MORA'] = grupo.apply(
-        lambda row: (row['Saldo vencido'] / row['Saldo total']) 
-                    if pd.notna(row['Saldo total']) and row['Saldo total'] != 0 
-                    else 0,
-        axis=1
-    )
+    # Sumas, % MORA y rangos de días de mora por coordinación
+    grupo = calcular_resumen_grupos(df_completo, [columna_coordinacion])
     
-    # Calcular rangos de días de mora para cada coordinación
-    def calcular_rangos_mora(df_coord, columna_mora='Días de mora', columna_riesgo='Saldo riesgo total'):
-        """Calcula la suma de Saldo riesgo total por rangos de días de mora"""
-        rangos = {
-            '0': 0,
-            '1-7': 0,
-            '8-15': 0,
-            '16-30': 0,
-            '31-60': 0,
-            '61-90': 0,
-            'Mayor_90': 0
-        }
-        
-        if columna_mora not in df_coord.columns or columna_riesgo not in df_coord.columns:
-            return rangos
-        
-        for idx, row in df_coord.iterrows():
-            dias_mora = row[columna_mora] if pd.notna(row[columna_mora]) else 0
-            saldo_riesgo = row[columna_riesgo] if pd.notna(row[columna_riesgo]) else 0
-            
-            if dias_mora == 0:
-                rangos['0'] += saldo_riesgo
-            elif 1 <= dias_mora <= 7:
-                rangos['1-7'] += saldo_riesgo
-            elif 8 <= dias_mora <= 15:
-                rangos['8-15'] += saldo_riesgo
-            elif 16 <= dias_mora <= 30:
-                rangos['16-30'] += saldo_riesgo
-            elif 31 <= dias_mora <= 60:
-                rangos['31-60'] += saldo_riesgo
-            elif 61 <= dias_mora <= 90:
-                rangos['61-90'] += saldo_riesgo
-            else:
-                rangos['Mayor_90'] += saldo_riesgo
-        
-        return rangos
-    
-    # Calcular rangos para cada coordinación
-    rangos_por_coord = []
-    for coord in grupo[columna_coordinacion]:
-        df_coord = df_completo[df_completo[columna_coordinacion] == coord]
-        rangos = calcular_rangos_mora(df_coord)
-        rangos_por_coord.append(rangos)
-    
-    # Agregar columnas de rangos al grupo
-    grupo['Rango_0'] = [r['0'] for r in rangos_por_coord]
-    grupo['Rango_1-7'] = [r['1-7'] for r in rangos_por_coord]
-    grupo['Rango_8-15'] = [r['8-15'] for r in rangos_por_coord]
-    grupo['Rango_16-30'] = [r['16-30'] for r in rangos_por_coord]
-    grupo['Rango_31-60'] = [r['31-60'] for r in rangos_por_coord]
-    grupo['Rango_61-90'] = [r['61-90'] for r in rangos_por_coord]
-    grupo['Rango_Mayor_90'] = [r['Mayor_90'] for r in rangos_por_coord]
-    
-    # Calcular total general
+    # Calcular total general (una sola reducción sobre todas las columnas numéricas)
+    sumas = grupo[COLUMNAS_TOTAL_RESUMEN].sum()
     total_general = {
         columna_coordinacion: 'Total',
-        'Cantidad Prestada': grupo['Cantidad Prestada'].sum(),
-        'Saldo capital': grupo['Saldo capital'].sum(),
-        'Saldo vencido': grupo['Saldo vencido'].sum(),
-        'Saldo total': grupo['Saldo total'].sum(),
-        'Saldo riesgo capital': grupo['Saldo riesgo capital'].sum(),
-        'Saldo riesgo total': grupo['Saldo riesgo total'].sum(),
-        '% MORA': (grupo['Saldo vencido'].sum() / grupo['Saldo total'].sum()) 
-                  if grupo['Saldo total'].sum() != 0 else 0,
-        'Rango_0': grupo['Rango_0'].sum(),
-        'Rango_1-7': grupo['Rango_1-7'].sum(),
-        'Rango_8-15': grupo['Rango_8-15'].sum(),
-        'Rango_16-30': grupo['Rango_16-30'].sum(),
-        'Rango_31-60': grupo['Rango_31-60'].sum(),
-        'Rango_61-90': grupo['Rango_61-90'].sum(),
-        'Rango_Mayor_90': grupo['Rango_Mayor_90'].sum()
+        **sumas.to_dict(),
+        '% MORA': (sumas['Saldo vencido'] / sumas['Saldo total']) 
+                  if sumas['Saldo total'] != 0 else 0
     }
     
     # Crear DataFrame final con estructura específica
@@ -707,7 +1118,9 @@ def crear_hoja_x_coordinacion(df_completo):
     # Las filas 1-7 se escribirán manualmente en Excel
     
     # Preparar datos para escribir (sin las filas vacías iniciales)
-    df_resultado = grupo.copy()
+    # Agregar fila de total general in situ (sin copiar el DataFrame completo como hacía pd.concat)
+    df_resultado = grupo
+    df_resultado.loc[len(df_resultado)] = pd.Series(total_general)
     
     # Renombrar columnas para que coincidan con el formato esperado
     df_resultado = df_resultado.rename(columns={
@@ -721,15 +1134,11 @@ def crear_hoja_x_coordinacion(df_completo):
         'Rango_Mayor_90': 'Rango_Mayor_90'
     })
     
-    # Agregar fila de total general
-    fila_total = pd.DataFrame([total_general])
-    df_resultado = pd.concat([df_resultado, fila_total], ignore_index=True)
-    
-    logger.info(f"✅ Hoja X_Coordinación creada con {len(grupo)} coordinaciones + 1 total")
+    logger.info(f"✅ Hoja X_Coordinación creada con {len(df_resultado) - 1} coordinaciones + 1 total")
     
     return df_resultado
 
-def crear_hoja_x_recuperador(df_completo):
+def crear_hoja_x_recuperador(df_completo, series_base=None):
     """
     Crea la hoja 'X_Recuperador' con datos agregados por coordinación y recuperador.
     
@@ -737,6 +1146,7 @@ def crear_hoja_x_recuperador(df_completo):
     
     Args:
         df_completo: DataFrame completo con todos los datos procesados
+        series_base: Series de calcular_riesgo_y_mora_base de df_completo (opcional)
         
     Returns:
         DataFrame con la estructura de la hoja X_Recuperador
@@ -759,29 +1169,8 @@ def crear_hoja_x_recuperador(df_completo):
         'Días de mora'
     ]
     
-    # Verificar y calcular columnas de riesgo si no existen
-    if 'Saldo riesgo capital' not in df_completo.columns:
-        logger.info("🔍 Calculando 'Saldo riesgo capital' (no existe en df_completo)")
-        df_completo['Saldo riesgo capital'] = df_completo.apply(
-            lambda row: row['Saldo capital'] if pd.notna(row.get('Días de mora', 0)) and row.get('Días de mora', 0) > 0 else 0,
-            axis=1
-        )
-    
-    if 'Saldo riesgo total' not in df_completo.columns:
-        logger.info("🔍 Calculando 'Saldo riesgo total' (no existe en df_completo)")
-        df_completo['Saldo riesgo total'] = df_completo.apply(
-            lambda row: row['Saldo total'] if pd.notna(row.get('Días de mora', 0)) and row.get('Días de mora', 0) > 0 else 0,
-            axis=1
-        )
-    
-    if '% MORA' not in df_completo.columns:
-        logger.info("🔍 Calculando '% MORA' (no existe en df_completo)")
-        df_completo['% MORA'] = df_completo.apply(
-            lambda row: (row['Saldo vencido'] / row['Saldo total']) 
-                        if pd.notna(row.get('Saldo total', 0)) and row.get('Saldo total', 0) != 0 
-                        else 0,
-            axis=1
-        )
+    # Completar columnas de riesgo si no existen (en un DataFrame nuevo; el del llamador no se modifica)
+    df_completo = completar_columnas_riesgo(df_completo, series_base)
     
     # Verificar columnas requeridas después de calcular las que faltaban
     # Las columnas de recuperador pueden no existir, así que las verificamos por separado
@@ -803,10 +1192,10 @@ def crear_hoja_x_recuperador(df_completo):
         logger.warning(f"⚠️ Columnas faltantes para X_Recuperador después de calcular: {columnas_faltantes}")
         logger.warning(f"🔍 Columnas disponibles en df_completo: {list(df_completo.columns)[:30]}")
         logger.warning(f"🔍 Total columnas: {len(df_completo.columns)}")
-        # Si faltan columnas críticas (no recuperador), retornar vacío
+        # Si faltan columnas críticas (no recuperador), no se puede construir la hoja
         columnas_criticas = [col for col in columnas_faltantes if 'recuperador' not in col.lower()]
         if columnas_criticas:
-            return pd.DataFrame()
+            raise SinDatosError(f"Columnas faltantes para X_Recuperador: {columnas_criticas}")
         # Si solo faltan columnas de recuperador, continuar pero usar valores por defecto
     
     logger.info(f"✅ Columnas requeridas verificadas. Total registros: {len(df_completo)}")
@@ -827,119 +1216,24 @@ def crear_hoja_x_recuperador(df_completo):
     
     # Agrupar por Coordinación + Recuperador y calcular agregaciones
     # Manejar valores NaN en las columnas de agrupación
-    grupo = df_completo.groupby([columna_coordinacion, codigo_rec_col, nombre_rec_col], dropna=False).agg({
-        'Cantidad Prestada': 'sum',
-        'Saldo capital': 'sum',
-        'Saldo vencido': 'sum',
-        'Saldo total': 'sum',
-        'Saldo riesgo capital': 'sum',
-        'Saldo riesgo total': 'sum',
-        '% MORA': 'mean'  # Promedio del porcentaje (se recalculará después)
-    }).reset_index()
-    
-    # Calcular % MORA correcto (promedio ponderado o recálculo)
-    # % MORA = Saldo vencido / Saldo total (por coordinación + recuperador)
-    grupo['% MORA'] = grupo.apply(
-        lambda row: (row['Saldo vencido'] / row['Saldo total']) 
-                    if pd.notna(row['Saldo total']) and row['Saldo total'] != 0 
-                    else 0,
-        axis=1
-    )
+    # Sumas, % MORA y rangos de días de mora por coordinación + recuperador
+    grupo = calcular_resumen_grupos(df_completo, [columna_coordinacion, codigo_rec_col, nombre_rec_col])
     
-    # Calcular rangos de días de mora para cada coordinación + recuperador
-    def calcular_rangos_mora(df_group, columna_mora='Días de mora', columna_riesgo='Saldo riesgo total'):
-        """Calcula la suma de Saldo riesgo total por rangos de días de mora"""
-        rangos = {
-            '0': 0,
-            '1-7': 0,
-            '8-15': 0,
-            '16-30': 0,
-            '31-60': 0,
-            '61-90': 0,
-            'Mayor_90': 0
-        }
-        
-        if columna_mora not in df_group.columns or columna_riesgo not in df_group.columns:
-            return rangos
-        
-        for idx, row in df_group.iterrows():
-            dias_mora = row[columna_mora] if pd.notna(row[columna_mora]) else 0
-            saldo_riesgo = row[columna_riesgo] if pd.notna(row[columna_riesgo]) else 0
-            
-            if dias_mora == 0:
-                rangos['0'] += saldo_riesgo
-            elif 1 <= dias_mora <= 7:
-                rangos['1-7'] += saldo_riesgo
-            elif 8 <= dias_mora <= 15:
-                rangos['8-15'] += saldo_riesgo
-            elif 16 <= dias_mora <= 30:
-                rangos['16-30'] += saldo_riesgo
-            elif 31 <= dias_mora <= 60:
-                rangos['31-60'] += saldo_riesgo
-            elif 61 <= dias_mora <= 90:
-                rangos['61-90'] += saldo_riesgo
-            else:
-                rangos['Mayor_90'] += saldo_riesgo
-        
-        return rangos
-    
-    # Calcular rangos para cada coordinación + recuperador
-    rangos_por_grupo = []
-    for idx, row in grupo.iterrows():
-        coord = row[columna_coordinacion]
-        codigo_rec = row[codigo_rec_col]
-        nombre_rec = row[nombre_rec_col]
-        
-        # Filtrar datos del grupo específico (manejar NaN)
-        mask = (df_completo[columna_coordinacion] == coord)
-        if pd.notna(codigo_rec):
-            mask = mask & (df_completo[codigo_rec_col] == codigo_rec)
-        else:
-            mask = mask & (df_completo[codigo_rec_col].isna())
-        
-        if pd.notna(nombre_rec):
-            mask = mask & (df_completo[nombre_rec_col] == nombre_rec)
-        else:
-            mask = mask & (df_completo[nombre_rec_col].isna())
-        
-        df_group = df_completo[mask]
-        
-        rangos = calcular_rangos_mora(df_group)
-        rangos_por_grupo.append(rangos)
-    
-    # Agregar columnas de rangos al grupo
-    grupo['Rango_0'] = [r['0'] for r in rangos_por_grupo]
-    grupo['Rango_1-7'] = [r['1-7'] for r in rangos_por_grupo]
-    grupo['Rango_8-15'] = [r['8-15'] for r in rangos_por_grupo]
-    grupo['Rango_16-30'] = [r['16-30'] for r in rangos_por_grupo]
-    grupo['Rango_31-60'] = [r['31-60'] for r in rangos_por_grupo]
-    grupo['Rango_61-90'] = [r['61-90'] for r in rangos_por_grupo]
-    grupo['Rango_Mayor_90'] = [r['Mayor_90'] for r in rangos_por_grupo]
-    
-    # Calcular total general
+    # Calcular total general (una sola reducción sobre todas las columnas numéricas)
+    sumas = grupo[COLUMNAS_TOTAL_RESUMEN].sum()
     total_general = {
         columna_coordinacion: 'Total',
         codigo_rec_col: '',
         nombre_rec_col: '',
-        'Cantidad Prestada': grupo['Cantidad Prestada'].sum(),
-        'Saldo capital': grupo['Saldo capital'].sum(),
-        'Saldo vencido': grupo['Saldo vencido'].sum(),
-        'Saldo total': grupo['Saldo total'].sum(),
-        'Saldo riesgo capital': grupo['Saldo riesgo capital'].sum(),
-        'Saldo riesgo total': grupo['Saldo riesgo total'].sum(),
-        '% MORA': (grupo['Saldo vencido'].sum() / grupo['Saldo total'].sum()) 
-                  if grupo['Saldo total'].sum() != 0 else 0,
-        'Rango_0': grupo['Rango_0'].sum(),
-        'Rango_1-7': grupo['Rango_1-7'].sum(),
-        'Rango_8-15': grupo['Rango_8-15'].sum(),
-        'Rango_16-30': grupo['Rango_16-30'].sum(),
-        'Rango_31-60': grupo['Rango_31-60'].sum(),
-        'Rango_61-90': grupo['Rango_61-90'].sum(),
-        'Rango_Mayor_90': grupo['Rango_Mayor_90'].sum()
+        **sumas.to_dict(),
+        '% MORA': (sumas['Saldo vencido'] / sumas['Saldo total']) 
+                  if sumas['Saldo total'] != 0 else 0
     }
     
     # Crear DataFrame final con estructura específica
-    df_resultado = grupo.copy()
+    # Agregar fila de total general in situ (sin copiar el DataFrame completo como hacía pd.concat)
+    df_resultado = grupo
+    df_resultado.loc[len(df_resultado)] = pd.Series(total_general)
     
     # Renombrar columnas para que coincidan con el formato esperado
     rename_dict = {
@@ -960,77 +1254,133 @@ def crear_hoja_x_recuperador(df_completo):
     
     df_resultado = df_resultado.rename(columns=rename_dict)
     
-    # Agregar fila de total general
-    fila_total = pd.DataFrame([total_general])
-    df_resultado = pd.concat([df_resultado, fila_total], ignore_index=True)
-    
-    logger.info(f"✅ Hoja X_Recuperador creada con {len(grupo)} grupos + 1 total")
+    logger.info(f"✅ Hoja X_Recuperador creada con {len(df_resultado) - 1} grupos + 1 total")
     
     return df_resultado
 
-def aplicar_formato_texto_concepto_deposito(worksheet, df):
+def mapa_encabezados(worksheet, fila=2):
+    """Mapa encabezado -> índice de columna (primera aparición), leyendo la fila de encabezados una sola vez."""
+    encabezados = {}
+    for cell in worksheet[fila]:
+        if cell.value is not None:
+            encabezados.setdefault(cell.value, cell.column)
+    return encabezados
+
+def mapa_columnas(df, col_inicio=1):
+    """Mapa encabezado -> índice de columna (primera aparición) de un DataFrame escrito a partir de `col_inicio`."""
+    encabezados = {}
+    for col_idx, col_name in enumerate(df.columns, start=col_inicio):
+        encabezados.setdefault(col_name, col_idx)
+    return encabezados
+
+def aplicar_formato_texto_columnas(worksheet, df, columnas=('Concepto Depósito',), encabezados=None):
     """
-    Aplica formato de texto a la columna 'Concepto Depósito' para preservar ceros a la izquierda
+    Aplica formato de texto a las columnas indicadas (p. ej. 'Código acreditado', 'Concepto Depósito')
+    para preservar ceros a la izquierda.
+    
+    El formato se asigna a cada celda escrita (un formato a nivel de columna no aplica a celdas que
+    ya tienen valor) y el recorrido se limita a las filas del DataFrame (datos desde la fila 3), sin
+    consultar worksheet.max_row.
     """
-    if 'Concepto Depósito' in df.columns:
-        for col_idx in range(1, worksheet.max_column + 1):
-            if worksheet.cell(row=2, column=col_idx).value == 'Concepto Depósito':
-                for row in range(3, worksheet.max_row + 1):
-                    worksheet.cell(row=row, column=col_idx).number_format = '@'
-                logger.info(f"✅ Formato de texto aplicado a columna 'Concepto Depósito' (columna {col_idx})")
-                break
-
-def aplicar_formato_porcentaje_mora(worksheet, df):
+    encabezados = encabezados or mapa_encabezados(worksheet)
+    max_fila = len(df) + 2
+    for col_name in columnas:
+        col_idx = encabezados.get(col_name) if col_name in df.columns else None
+        if not col_idx:
+            continue
+        for (cell,) in worksheet.iter_rows(min_row=3, max_row=max_fila, min_col=col_idx, max_col=col_idx):
+            cell.number_format = '@'
+        logger.info(f"✅ Formato de texto aplicado a columna '{col_name}' (columna {col_idx})")
+
+def aplicar_formato_porcentaje_mora(worksheet, df, encabezados=None):
     """
     Aplica formato de porcentaje a la columna '% MORA' (formato de porcentaje 0-100%)
     Excel automáticamente multiplicará los valores (que están entre 0-1) por 100 para mostrarlos como porcentaje
     """
     if '% MORA' in df.columns:
-        for col_idx in range(1, worksheet.max_column + 1):
-            if worksheet.cell(row=2, column=col_idx).value == '% MORA':
-                for row in range(3, worksheet.max_row + 1):
-                    worksheet.cell(row=row, column=col_idx).number_format = '0.00%'  # Formato de porcentaje con 2 decimales
-                logger.info(f"✅ Formato de porcentaje aplicado a columna '% MORA' (columna {col_idx})")
-                break
-
-def aplicar_formato_alerta(worksheet, df):
+        col_idx = (encabezados or mapa_encabezados(worksheet)).get('% MORA')
+        if col_idx:
+            for (cell,) in worksheet.iter_rows(min_row=3, min_col=col_idx, max_col=col_idx):
+                cell.number_format = '0.00%'  # Formato de porcentaje con 2 decimales
+            logger.info(f"✅ Formato de porcentaje aplicado a columna '% MORA' (columna {col_idx})")
+
+def aplicar_formato_alerta(worksheet, df, encabezados=None):
     """Aplica relleno rojo suave a celdas de columna 'Alerta' con valor 1."""
     if 'Alerta' not in df.columns:
         return
-    alert_fill = PatternFill(start_color=COLORS.get('alert_red', 'F4CCCC'), end_color=COLORS.get('alert_red', 'F4CCCC'), fill_type='solid')
-    for col_idx in range(1, worksheet.max_column + 1):
-        if worksheet.cell(row=2, column=col_idx).value == 'Alerta':
-            for row in range(3, worksheet.max_row + 1):
-                cell = worksheet.cell(row=row, column=col_idx)
-                if cell.value == 1 or cell.value == 1.0:
-                    cell.fill = alert_fill
-            logger.info(f"✅ Formato rojo suave aplicado a columna 'Alerta' (columna {col_idx})")
-            break
+    col_idx = (encabezados or mapa_encabezados(worksheet)).get('Alerta')
+    if not col_idx:
+        return
+    for (cell,) in worksheet.iter_rows(min_row=3, min_col=col_idx, max_col=col_idx):
+        if cell.value == 1 or cell.value == 1.0:
+            cell.fill = RELLENO_ALERTA
+    logger.info(f"✅ Formato rojo suave aplicado a columna 'Alerta' (columna {col_idx})")
+
+def calcular_ancho_columna(serie, encabezado, ancho_maximo=EXCEL_CONFIG['max_column_width']):
+    """Calcula el ancho de una columna a partir de la longitud máxima de sus valores y su encabezado."""
+    if pd.api.types.is_integer_dtype(serie):
+        # Enteros: el texto más largo es el del mínimo o el del máximo, sin convertir toda la columna a texto
+        max_length = max((len(str(v)) for v in (serie.min(), serie.max()) if pd.notna(v)), default=0)
+    else:
+        # Solo se convierten a texto los valores distintos (códigos, coordinaciones, PAR y fechas se repiten mucho)
+        max_length = pd.Series(serie.dropna().unique()).astype('string').str.len().max()
+        max_length = 0 if pd.isna(max_length) else int(max_length)
+    return min(max(max_length, len(str(encabezado))) + 2, ancho_maximo)
 
-def aplicar_formato_final(worksheet, df, es_hoja_mora=False):
-    """Autoajuste de columnas, formato de moneda, fecha corta, y formatos especiales."""
-    from openpyxl.styles import Font, PatternFill, Alignment
+def calcular_anchos_columnas(df):
+    """Anchos de todas las columnas del DataFrame, en el orden de df.columns."""
+    return [calcular_ancho_columna(df.iloc[:, i], col_name) for i, col_name in enumerate(df.columns)]
+
+def calcular_anchos_hoja_resumen(worksheet, df, ultima_fila_encabezados=8, ancho_maximo=20):
+    """
+    Anchos de columna de una hoja resumen (X_Coordinación / X_Recuperador).
     
-    # a) Autoajuste de columnas
-    for i in range(1, worksheet.max_column + 1):
-        column_letter = get_column_letter(i)
-        max_length = 0
-        for j in range(1, worksheet.max_row + 1):
-            value = worksheet.cell(row=j, column=i).value
-            if value is not None:
-                max_length = max(max_length, len(str(value)))
-        worksheet.column_dimensions[column_letter].width = min(max_length + 2, 50)
+    Las filas de datos se miden desde el DataFrame escrito con to_excel; de la hoja solo se leen
+    las filas de encabezado fijas (1..ultima_fila_encabezados). Igual que el ajuste por celda,
+    los valores vacíos, cero o NaN no cuentan para el ancho.
+    
+    Returns:
+        Lista de anchos; el índice 0 corresponde a la columna A
+    """
+    longitudes = [0] * max(worksheet.max_column, len(df.columns))
+    for fila in worksheet.iter_rows(max_row=ultima_fila_encabezados, values_only=True):
+        for i, valor in enumerate(fila):
+            if valor:
+                longitudes[i] = max(longitudes[i], len(str(valor)))
+    for i, (_, serie) in enumerate(df.items()):
+        valores = serie.dropna().astype(object)
+        valores = valores[valores.astype(bool)]
+        if not valores.empty:
+            longitudes[i] = max(longitudes[i], int(valores.astype(str).str.len().max()))
+    return [min(longitud + 2, ancho_maximo) for longitud in longitudes]
+
+def aplicar_formato_final(worksheet, df, es_hoja_mora=False, anchos=None, encabezados=None):
+    """Autoajuste de columnas, formato de moneda, fecha corta, y formatos especiales.
+    
+    `anchos` y `encabezados` permiten reutilizar los anchos ya calculados (calcular_anchos_columnas)
+    y el mapa encabezado -> columna cuando varias hojas o funciones de formato comparten el mismo DataFrame.
+    """
+    
+    # a) Autoajuste de columnas (calculado desde el DataFrame, sin leer cada celda de la hoja)
+    if anchos is None:
+        anchos = calcular_anchos_columnas(df)
+    for i, ancho in enumerate(anchos, start=1):
+        worksheet.column_dimensions[get_column_letter(i)].width = ancho
 
     # b) Formato de encabezados (Fila 2)
     worksheet.row_dimensions[2].height = EXCEL_CONFIG['header_height']
     for cell in worksheet[2]:
-        cell.font = Font(bold=True)
+        cell.font = FUENTE_NEGRITA
+    
+    # Índice encabezado -> columna, calculado una sola vez para todas las reglas de formato
+    encabezados = encabezados or mapa_encabezados(worksheet)
+    # max_row recorre todas las celdas en cada lectura: se toma una sola vez para los bucles por columna
+    max_fila = worksheet.max_row
     
     # c) Relleno azul en "Días de mora" (en todas las hojas)
-    for cell in worksheet[2]:
-        if cell.value == 'Días de mora':
-            cell.fill = PatternFill(start_color=COLORS['light_blue'], end_color=COLORS['light_blue'], fill_type="solid")
-            break
+    col_idx = encabezados.get('Días de mora')
+    if col_idx:
+        worksheet.cell(row=2, column=col_idx).fill = RELLENO_AZUL_ENCABEZADO
 
     # d) Formato de moneda en columnas conocidas del df
     # Excluir columnas de días (que pueden contener "pago" en su nombre pero son numéricas enteras)
@@ -1041,41 +1391,31 @@ def aplicar_formato_final(worksheet, df, es_hoja_mora=False):
         and col.lower().strip() not in COLUMNAS_NO_MONEDA
     ]
     for col_name in columnas_moneda:
-        if col_name in df.columns:
-            # Buscar índice de la columna por encabezado (fila 2)
-            for cell in worksheet[2]:
-                if cell.value == col_name:
-                    col_idx = cell.column
-                    # Aplicar formato desde fila 3 (datos)
-                    for row in range(3, worksheet.max_row + 1):
-                        worksheet.cell(row=row, column=col_idx).number_format = EXCEL_CONFIG['currency_format']
-                    break
+        col_idx = encabezados.get(col_name)
+        if col_idx:
+            # Aplicar formato desde fila 3 (datos)
+            for (cell,) in worksheet.iter_rows(min_row=3, max_row=max_fila, min_col=col_idx, max_col=col_idx):
+                cell.number_format = EXCEL_CONFIG['currency_format']
 
     # e) Formato de fecha corta para columnas datetime del df
     columnas_fecha = df.select_dtypes(include=['datetime64[ns]', 'datetime64[ns, UTC]']).columns.tolist()
     for col_name in columnas_fecha:
-        # Ubicar columna
-        for cell in worksheet[2]:
-            if cell.value == col_name:
-                col_idx = cell.column
-                for row in range(3, worksheet.max_row + 1):
-                    worksheet.cell(row=row, column=col_idx).number_format = EXCEL_CONFIG['date_format']
-                break
+        col_idx = encabezados.get(col_name)
+        if col_idx:
+            for (cell,) in worksheet.iter_rows(min_row=3, max_row=max_fila, min_col=col_idx, max_col=col_idx):
+                cell.number_format = EXCEL_CONFIG['date_format']
 
     # f) Relleno azul en encabezados específicos de la hoja "Mora"
     if es_hoja_mora:
         for col_name in MORA_BLUE_COLUMNS:
-            if col_name in df.columns:
-                # Buscar y aplicar relleno azul al encabezado (fila 2)
-                for cell in worksheet[2]:
-                    if cell.value == col_name:
-                        cell.fill = PatternFill(start_color=COLORS['light_blue'], end_color=COLORS['light_blue'], fill_type="solid")
-                        break
+            col_idx = encabezados.get(col_name)
+            if col_name in df.columns and col_idx:
+                worksheet.cell(row=2, column=col_idx).fill = RELLENO_AZUL_ENCABEZADO
 
     # g) Inmovilización de paneles en A3
     worksheet.freeze_panes = EXCEL_CONFIG['freeze_panes']
 
-def aplicar_formato_condicional(worksheet, columna_mora, num_filas):
+def aplicar_formato_condicional(worksheet, columna_mora, num_filas, encabezados=None):
     """Aplica formato condicional de colores a la columna de días de mora"""
     color_scale_rule = ColorScaleRule(
         start_type='min', start_color='7AB800', # Verde
@@ -1084,7 +1424,7 @@ def aplicar_formato_condicional(worksheet, columna_mora, num_filas):
     )
     
     # Encuentra la letra de la columna 'Días de mora' (ahora en fila 2)
-    mora_col_letter = [col[0].column_letter for col in worksheet.iter_cols(min_row=2, max_row=2) if col[0].value == columna_mora][0]
+    mora_col_letter = get_column_letter((encabezados or mapa_encabezados(worksheet))[columna_mora])
     # Aplicar formato desde fila 3 (datos) hasta el final
     worksheet.conditional_formatting.add(f'{mora_col_letter}3:{mora_col_letter}{num_filas + 2}', color_scale_rule)
 
@@ -1108,7 +1448,6 @@ def crear_tabla_excel(worksheet, df, sheet_name, incluir_columnas_adicionales=Fa
         incluir_columnas_adicionales: Si True, incluye 9 columnas adicionales con títulos (solo para Mora)
     """
     try:
-        from openpyxl.styles import PatternFill, Alignment
         
         # Calcular el rango de la tabla dinámicamente
         num_filas_datos = len(df)  # Número de filas de datos
@@ -1133,8 +1472,8 @@ def crear_tabla_excel(worksheet, df, sheet_name, incluir_columnas_adicionales=Fa
             
             celda_titulo1 = worksheet[f"{titulo1_inicio}1"]
             celda_titulo1.value = ADDITIONAL_COLUMNS['titles']['green']['text']
-            celda_titulo1.fill = PatternFill(start_color=COLORS['green'], end_color=COLORS['green'], fill_type="solid")
-            celda_titulo1.alignment = Alignment(horizontal="center", vertical="center")
+            celda_titulo1.fill = RELLENO_TITULO_VERDE
+            celda_titulo1.alignment = ALINEACION_CENTRO
             
             # Título 2 (Azul): "Gestión de Cobranza en Campo" - siguientes 5 columnas adicionales
             titulo2_inicio = get_column_letter(num_columnas_originales + ADDITIONAL_COLUMNS['titles']['green']['columns'] + 1)
@@ -1144,12 +1483,11 @@ def crear_tabla_excel(worksheet, df, sheet_name, incluir_columnas_adicionales=Fa
             
             celda_titulo2 = worksheet[f"{titulo2_inicio}1"]
             celda_titulo2.value = ADDITIONAL_COLUMNS['titles']['blue']['text']
-            celda_titulo2.fill = PatternFill(start_color=COLORS['blue'], end_color=COLORS['blue'], fill_type="solid")
-            celda_titulo2.alignment = Alignment(horizontal="center", vertical="center")
+            celda_titulo2.fill = RELLENO_TITULO_AZUL
+            celda_titulo2.alignment = ALINEACION_CENTRO
             
             # --- PASO 2: Agregar encabezados específicos en la FILA 2 ---
             for i, encabezado in enumerate(ADDITIONAL_COLUMNS['headers']):
-                col_letra = get_column_letter(num_columnas_originales + 1 + i)
                 worksheet.cell(row=2, column=num_columnas_originales + 1 + i, value=encabezado)
             
             # Crear el rango de la tabla incluyendo las 9 columnas adicionales, empezando en fila 2
@@ -1176,26 +1514,246 @@ def crear_tabla_excel(worksheet, df, sheet_name, incluir_columnas_adicionales=Fa
         # Añadir la tabla a la hoja
         worksheet.add_table(tabla)
         
-        # Ajustar automáticamente el ancho de las columnas para que se vea todo el texto
-        num_columnas_ajustar = num_columnas_totales if incluir_columnas_adicionales else num_columnas_originales
-        fila_inicio_revision = 1 if incluir_columnas_adicionales else 2  # Revisar desde fila 1 si hay títulos, sino desde fila 2
-        
-        for i in range(1, num_columnas_ajustar + 1):
-            column_letter = get_column_letter(i)
-            max_length = 0
-            # Revisar desde la fila apropiada hasta el final de los datos
-            for row in range(fila_inicio_revision, num_filas_tabla + 2):  # +2 porque los datos empiezan en fila 2
-                cell_value = worksheet.cell(row=row, column=i).value
-                if cell_value:
-                    max_length = max(max_length, len(str(cell_value)))
-            
-            adjusted_width = min(max_length + 2, 50)  # Máximo 50 caracteres de ancho
-            worksheet.column_dimensions[column_letter].width = adjusted_width
+        # El ancho de las columnas del DataFrame lo ajusta aplicar_formato_final (se llama sobre la misma
+        # hoja y el mismo DataFrame); aquí solo se dimensionan las columnas adicionales de Mora
+        if incluir_columnas_adicionales:
+            # Columnas adicionales: solo tienen encabezado (fila 2) y, la primera de cada bloque, el título (fila 1)
+            inicio_titulo_azul = ADDITIONAL_COLUMNS['titles']['green']['columns']
+            titulos_fila1 = {
+                0: ADDITIONAL_COLUMNS['titles']['green']['text'],
+                inicio_titulo_azul: ADDITIONAL_COLUMNS['titles']['blue']['text']
+            }
+            for i, encabezado in enumerate(ADDITIONAL_COLUMNS['headers']):
+                max_length = max(len(encabezado), len(titulos_fila1.get(i, '')))
+                column_letter = get_column_letter(num_columnas_originales + 1 + i)
+                worksheet.column_dimensions[column_letter].width = min(max_length + 2, EXCEL_CONFIG['max_column_width'])
         
     except Exception as e:
         # Si hay algún error, no interrumpir el proceso principal
         logger.warning(f"No se pudo crear la tabla para la hoja {sheet_name}: {str(e)}")
 
+def crear_hoja_liquidacion(workbook, df_completo, nombre_hoja_informe, df_informe):
+    """
+    Crea la hoja 'Liquidación anticipada': formulario de una fila (fila 3) donde se captura el código
+    del acreditado y las columnas B:H se llenan con BUSCARV contra la hoja del informe completo
+    (`nombre_hoja_informe`, encabezados en la fila 2). Las columnas de `df_completo` se mapean por
+    posición y, si no, por nombre normalizado; el rango del BUSCARV se acota con `df_informe`, el
+    DataFrame que realmente se escribió en esa hoja.
+    """
+    logger.info("Creando hoja 'Liquidación anticipada'")
+    
+    # Validar columnas requeridas para liquidación anticipada
+    # Mapear a los nombres reales de columnas basados en el contenido de la primera fila
+    columnas_requeridas = {
+        'ciclo': 'Ciclo',
+        'nombre_acreditado': 'Nombre acreditado', 
+        'intereses_vencidos': 'Saldo interés vencido',
+        'comision_vencida': 'Saldo comisión vencida',
+        'recargos': 'Saldo recargos',
+        'saldo_capital': 'Saldo capital'
+    }
+    
+    # Verificar qué columnas existen en df_completo
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("🔍 DIAGNÓSTICO DETALLADO DE COLUMNAS:")
+        logger.debug("   - Columnas disponibles en df_completo: %s", list(df_completo.columns))
+        logger.debug("   - Columnas requeridas: %s", list(columnas_requeridas.values()))
+    
+    # Nombres de columna normalizados (minúsculas, sin tildes ni espacios), calculados una sola vez
+    def normalizar_nombre_columna(nombre):
+        return _normalizar_texto_para_mapeo(nombre).replace(' ', '')
+    
+    columnas_normalizadas = {}
+    for col_disponible in df_completo.columns:
+        columnas_normalizadas.setdefault(normalizar_nombre_columna(col_disponible), col_disponible)
+    
+    # Función para buscar columnas por similitud
+    def buscar_columna_similar(columna_requerida):
+        """Busca una columna por nombre normalizado: primero coincidencia exacta, luego parcial"""
+        columna_requerida_clean = normalizar_nombre_columna(columna_requerida)
+    
+        logger.info("🔍 Buscando columna similar a '%s' (limpio: '%s')", columna_requerida, columna_requerida_clean)
+    
+        # Búsqueda exacta
+        col_disponible = columnas_normalizadas.get(columna_requerida_clean)
+        if col_disponible is not None:
+            logger.info("✅ Encontrada coincidencia exacta: '%s'", col_disponible)
+            return col_disponible
+    
+        # Búsqueda por coincidencia parcial
+        for col_disponible_clean, col_disponible in columnas_normalizadas.items():
+            if columna_requerida_clean in col_disponible_clean or col_disponible_clean in columna_requerida_clean:
+                logger.info("✅ Encontrada coincidencia parcial: '%s'", col_disponible)
+                return col_disponible
+    
+        logger.warning("❌ No se encontró columna similar a '%s'", columna_requerida)
+        return None
+    
+    # Mapear columnas requeridas a columnas reales
+    columnas_mapeadas = {}
+    columnas_faltantes = []
+    
+    # Mapeo manual basado en la estructura real del archivo
+    # Según el debug anterior, las columnas están en posiciones específicas
+    mapeo_manual = {
+        'ciclo': df_completo.columns[7] if len(df_completo.columns) > 7 else None,  # Unnamed: 7 (Columna 8 Excel)
+        'nombre_acreditado': df_completo.columns[8] if len(df_completo.columns) > 8 else None,  # Unnamed: 8 (Columna 9 Excel)
+        'intereses_vencidos': df_completo.columns[25] if len(df_completo.columns) > 25 else None,  # Unnamed: 25 (Columna 26 Excel - Saldo interés vencido)
+        'comision_vencida': df_completo.columns[26] if len(df_completo.columns) > 26 else None,  # Unnamed: 26 (Columna 27 Excel - Saldo comisión vencida)
+        'recargos': df_completo.columns[27] if len(df_completo.columns) > 27 else None,  # Unnamed: 27 (Columna 28 Excel - Saldo recargos)
+        'saldo_capital': df_completo.columns[22] if len(df_completo.columns) > 22 else None,  # Unnamed: 22 (Columna 23 Excel - Saldo capital)
+    }
+    
+    for key, columna_requerida in columnas_requeridas.items():
+        # Primero intentar mapeo manual
+        columna_manual = mapeo_manual.get(key)
+        if columna_manual:
+            columnas_mapeadas[key] = columna_manual
+            logger.info("✅ Columna '%s' mapeada manualmente a '%s'", columna_requerida, columna_manual)
+        elif columna_requerida in df_completo.columns:
+            columnas_mapeadas[key] = columna_requerida
+            logger.info("✅ Columna '%s' encontrada exactamente", columna_requerida)
+        else:
+            # Buscar por similitud
+            columna_encontrada = buscar_columna_similar(columna_requerida)
+            if columna_encontrada:
+                columnas_mapeadas[key] = columna_encontrada
+                logger.info("✅ Columna '%s' mapeada por similitud a '%s'", columna_requerida, columna_encontrada)
+            else:
+                columnas_faltantes.append(columna_requerida)
+                logger.warning("⚠️ Columna '%s' no encontrada para 'Liquidación anticipada'", columna_requerida)
+    
+    if not columnas_faltantes:
+        logger.info("✅ Todas las columnas requeridas para liquidación anticipada están disponibles")
+    else:
+        logger.warning("⚠️ Columnas faltantes: %s", columnas_faltantes)
+    
+    # Definir columnas para la hoja de liquidación anticipada
+    liquidacion_columns = [
+        COLUMN_MAPPING.get('codigo', 'Código acreditado'),  # A
+        'Ciclo',                                           # B
+        'Nombre del acreditado',                           # C
+        'Saldo interés vencido',                           # D
+        'Saldo comisión vencida',                          # E
+        'Saldo recargos',                                  # F
+        'Saldo capital',                                   # G
+        'Saldo adelantado',                                # H (NUEVA COLUMNA)
+        'Intereses del próximo pago sin vencer',           # I
+        'Comisiones del próximo pago sin vencer',          # J
+        'Cantidad a liquidar',                             # K
+        'Cálculo válido hasta el próximo pago'             # L
+    ]
+    
+    # Escribir la hoja: fila 1 para el título, encabezados en la fila 2 (la fila 3 de captura se
+    # llena abajo con estilos y fórmulas), sin pasar por un DataFrame vacío y to_excel
+    ws_liquidacion = workbook.create_sheet('Liquidación anticipada')
+    ws_liquidacion.append([])
+    ws_liquidacion.append(liquidacion_columns)
+    
+    # --- Diseño personalizado para la hoja de liquidación anticipada ---
+    
+    # 1. Combinar celdas D1:F1 para "Montos Vencidos" con relleno azul claro
+    ws_liquidacion.merge_cells('D1:F1')
+    celda_titulo = ws_liquidacion['D1']
+    celda_titulo.value = 'Montos Vencidos'
+    celda_titulo.fill = RELLENO_AZUL_ENCABEZADO
+    celda_titulo.font = FUENTE_NEGRITA
+    celda_titulo.alignment = ALINEACION_CENTRO
+    
+    # 2. Establecer ancho de columna optimizado para cada tipo de dato
+    for col_letter, width in ANCHOS_COLUMNAS_LIQUIDACION:
+        ws_liquidacion.column_dimensions[col_letter].width = width
+    
+    # 3. Establecer altura de filas para mejor legibilidad
+    ws_liquidacion.row_dimensions[2].height = 35  # Encabezados más altos
+    ws_liquidacion.row_dimensions[3].height = 30  # Datos más altos
+    
+    # 4. Aplicar formato minimalista pero legible a todas las celdas
+    registrar_estilos_liquidacion(workbook)
+    # Encabezados (fila 2)
+    for (cell,) in ws_liquidacion.iter_cols(max_col=12, min_row=2, max_row=2):  # Columnas A a L
+        cell.style = ESTILO_ENCABEZADO_LIQUIDACION
+    
+    # Datos (fila 3); las celdas de captura manual (I, J, L) llevan relleno verde claro y negrita.
+    # Se guardan en orden A..L para dar formato abajo sin volver a resolver referencias 'D3', 'E3', ...
+    celdas_datos = [cell for (cell,) in ws_liquidacion.iter_cols(max_col=12, min_row=3, max_row=3)]  # Columnas A a L
+    for cell in celdas_datos:
+        cell.style = ESTILO_MANUAL_LIQUIDACION if cell.column_letter in COLUMNAS_MANUALES_LIQUIDACION else ESTILO_DATOS_LIQUIDACION
+    
+    # 5. Aplicar formato de moneda a columnas D:K (4:11)
+    formato_moneda = EXCEL_CONFIG['currency_format']
+    for cell in celdas_datos[3:11]:
+        cell.number_format = formato_moneda
+    
+    # 5. Formatear celda A3 (Código acreditado) para mantener ceros al inicio
+    celdas_datos[0].number_format = '@'  # Formato de texto para mantener ceros
+    
+    # 6. Agregar fórmulas BUSCARV en B3:G3 para autocompletado desde "Informe Completo"
+    
+    # Rango exacto de datos del informe (encabezados en la fila 2, datos desde la 3): acotarlo evita
+    # que Excel recorra columnas completas en cada recálculo del BUSCARV
+    ultima_columna_informe = len(df_informe.columns)
+    ultima_col_letter = get_column_letter(ultima_columna_informe)
+    ultima_fila_informe = max(len(df_informe) + 2, 3)
+    rango_informe = f"$A$3:${ultima_col_letter}${ultima_fila_informe}"
+    
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("🔍 Debug fórmulas BUSCARV:")
+        logger.debug("   - Nombre hoja informe: '%s'", nombre_hoja_informe)
+        logger.debug("   - Rango informe: '%s'", rango_informe)
+        logger.debug("   - Registros en df_completo: %s", len(df_completo))
+        logger.debug("   - Columnas en df_completo: %s", list(df_completo.columns))
+    
+        # Mostrar las primeras filas para verificar datos
+        if len(df_completo) > 0:
+            primera_columna = df_completo.columns[0]  # Primera columna (debería ser 'Código acreditado')
+            logger.debug("   - Primera columna: '%s'", primera_columna)
+            logger.debug("   - Primeros 3 valores de '%s': %s", primera_columna, df_completo[primera_columna].head(3).tolist())
+    if len(df_completo) == 0:
+        logger.error("   - ERROR: df_completo está vacío!")
+    
+    # Posición (1-indexada, como en Excel) de cada columna de df_completo, calculada una sola vez
+    posicion_columna = {col: i for i, col in enumerate(df_completo.columns, start=1)}
+    
+    # B3:G3: BUSCARV (VLOOKUP en inglés) por código; si la columna no existe queda el valor por defecto
+    formulas_liquidacion = {}
+    for celda, clave, etiqueta, valor_defecto in CAMPOS_BUSCARV_LIQUIDACION:
+        indice_columna = posicion_columna.get(columnas_mapeadas.get(clave))
+        if indice_columna:
+            formula = f"=IFERROR(VLOOKUP(A3,'{nombre_hoja_informe}'!{rango_informe},{indice_columna},FALSE),{valor_defecto})"
+            ws_liquidacion[celda] = formula
+            formulas_liquidacion[celda] = formula
+        else:
+            ws_liquidacion[celda] = valor_defecto
+            logger.warning("⚠️ Columna '%s' no encontrada, %s = %s", etiqueta, celda, valor_defecto)
+    
+    # H3: Saldo adelantado (NUEVA COLUMNA) - Buscar en columna específica del informe
+    # Esta columna busca directamente en una posición fija según el archivo del jefe
+    formula_adelantado = f"=IFERROR(VLOOKUP(A3,'{nombre_hoja_informe}'!{rango_informe},52,FALSE),0)"
+    ws_liquidacion['H3'] = formula_adelantado
+    formulas_liquidacion['H3'] = formula_adelantado
+    logger.debug("✅ Fórmulas BUSCARV de 'Liquidación anticipada': %s", formulas_liquidacion)
+    
+    # 7. Establecer fórmula de suma en columna K3 para "Cantidad a liquidar"
+    # Suma: Saldo interés vencido + Saldo comisión + Saldo recargos + Saldo capital + Intereses próximo pago + Comisiones próximo pago
+    # Resta: Saldo adelantado
+    ws_liquidacion['K3'] = '=SUM(D3:G3,I3:J3)-H3'
+    
+    # 8. NO usar crear_tabla_excel para mantener el diseño personalizado minimalista
+    
+    # 9. Aplicar formato final personalizado sin tabla formal
+    # Inmovilizar paneles en A3 para mejor navegación
+    ws_liquidacion.freeze_panes = 'A3'
+    
+    # 10. Fondo blanco fuera del área principal: basta con ocultar las líneas de cuadrícula
+    # (pintar celdas vacías de blanco obligaba a crear cada Cell del bloque A1:N14)
+    ws_liquidacion.sheet_view.showGridLines = False
+    
+    # 11. Instrucciones removidas para diseño más limpio
+    
+    logger.info("✅ Hoja 'Liquidación anticipada' creada")
+
+
 def procesar_reporte_antiguedad(archivo_path, codigos_a_excluir=None):
     """Procesa el reporte de antigüedad con mejoras de robustez y mantenibilidad
     
@@ -1208,22 +1766,24 @@ def procesar_reporte_antiguedad(archivo_path, codigos_a_excluir=None):
         validate_file_size(archivo_path)
         
         # --- PASO 1: Cargar y limpiar ---
-        logger.info(f"Iniciando procesamiento del archivo: {archivo_path}")
-        df = pd.read_excel(archivo_path, engine='openpyxl', dtype=DTYPE_CONFIG, header=0)
+        logger.info("Iniciando procesamiento del archivo: %s", archivo_path)
+        df = leer_excel(archivo_path)
         df = clean_dataframe_columns(df)
         
         # Aplicar filtro de exclusión si se especifica
         if codigos_a_excluir:
             registros_antes = len(df)
             df = df[~df['Código acreditado'].isin(codigos_a_excluir)]
-            logger.info(f"🔍 Filtro aplicado: Excluidos códigos {codigos_a_excluir}. Registros: {registros_antes} → {len(df)}")
+            logger.info("🔍 Filtro aplicado: Excluidos códigos %s. Registros: %s → %s", codigos_a_excluir, registros_antes, len(df))
         
-        # Debug: Verificar las primeras filas después de la carga
-        logger.info(f"🔍 DEBUG CARGA DE DATOS:")
-        logger.info(f"   - Filas cargadas: {len(df)}")
-        logger.info(f"   - Columnas: {list(df.columns)[:10]}...")  # Primeras 10 columnas
-        if len(df) > 0:
-            logger.info(f"   - Primera fila: {df.iloc[0].to_dict()}")
+        # Debug: Verificar las primeras filas después de la carga (solo se formatea con nivel DEBUG)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("🔍 DEBUG CARGA DE DATOS:")
+            logger.debug("   - Filas cargadas: %s", len(df))
+            logger.debug("   - Columnas: %s...", list(df.columns)[:10])  # Primeras 10 columnas
+            if len(df) > 0:
+                # Solo las primeras 5 columnas, sin construir la Series completa de la fila
+                logger.debug("   - Primera fila: %s", dict(zip(df.columns[:5], df.iloc[0, :5].to_numpy())))
         
         
         # Obtener nombres de columnas desde configuración
@@ -1243,12 +1803,18 @@ def procesar_reporte_antiguedad(archivo_path, codigos_a_excluir=None):
         code_columns = [columna_codigo, 'Código promotor', 'Código recuperador']
         df = standardize_codes(df, code_columns)
         
+        # Columnas identificadoras de baja cardinalidad como 'category': agrupar, filtrar y comparar
+        # sobre códigos enteros en lugar de cadenas de Python. El código de acreditado queda como texto:
+        # es casi único por fila, así que sus categorías serían tan grandes como la columna misma
+        columnas_categoricas = [columna_coordinacion, 'Código promotor', 'Código recuperador', 'Nombre recuperador']
+        df = convertir_a_categoria(df, columnas_categoricas)
+        
         # --- PASO 2: Filtrar fraudes INMEDIATAMENTE después de la limpieza ---
-        logger.info(f"Filtrando {len(LISTA_FRAUDE)} códigos de fraude")
+        logger.info("Filtrando %s códigos de fraude", len(LISTA_FRAUDE))
         registros_antes_filtrado = len(df)
-        df_filtrado = df[~df[columna_codigo].isin(LISTA_FRAUDE)]
+        df_filtrado = df[~mascara_codigos(df[columna_codigo], CODIGOS_FRAUDE)]
         registros_eliminados = registros_antes_filtrado - len(df_filtrado)
-        logger.info(f"Se eliminaron {registros_eliminados} registros por códigos fraudulentos")
+        logger.info("Se eliminaron %s registros por códigos fraudulentos", registros_eliminados)
         
         df_recup_000124_raw = None
         df_recup_000124_sin_links = None
@@ -1264,17 +1830,18 @@ def procesar_reporte_antiguedad(archivo_path, codigos_a_excluir=None):
                     codigos_excluir_norm.add(str(int(float(s))).zfill(6))
                 else:
                     codigos_excluir_norm.add(s)
-            mask_recup_excluir = df_filtrado['Código recuperador'].astype(str).str.zfill(6).isin(codigos_excluir_norm)
-            df_recup_000124_raw = df_filtrado[mask_recup_excluir].copy()
+            # 'Código recuperador' ya viene estandarizado a 6 dígitos (PASO 1.1): basta comparar sus valores únicos
+            mask_recup_excluir = mascara_codigos(df_filtrado['Código recuperador'], codigos_excluir_norm)
+            df_recup_000124_raw = df_filtrado[mask_recup_excluir]
             df_filtrado = df_filtrado[~mask_recup_excluir]
             eliminados_recup = registros_antes_recup - len(df_filtrado)
             if eliminados_recup > 0:
-                logger.info(f"🔍 Filtro por recuperador: Excluidos códigos {CODIGOS_RECUPERADOR_EXCLUIR}. Registros: {registros_antes_recup} → {len(df_filtrado)} ({eliminados_recup} eliminados)")
+                logger.info("🔍 Filtro por recuperador: Excluidos códigos %s. Registros: %s → %s (%s eliminados)", CODIGOS_RECUPERADOR_EXCLUIR, registros_antes_recup, len(df_filtrado), eliminados_recup)
         
         # Verificación de integridad de datos - ANTES de transformaciones (sobre datos filtrados)
         medio_comunic_1_antes = df_filtrado['Medio comunic. 1'].notna().sum() if 'Medio comunic. 1' in df_filtrado.columns else 0
         medio_comunic_2_antes = df_filtrado['Medio comunic. 2'].notna().sum() if 'Medio comunic. 2' in df_filtrado.columns else 0
-        logger.info(f"Verificación de integridad - ANTES: 'Medio comunic. 1' -> {medio_comunic_1_antes}, 'Medio comunic. 2' -> {medio_comunic_2_antes}")
+        logger.info("Verificación de integridad - ANTES: 'Medio comunic. 1' -> %s, 'Medio comunic. 2' -> %s", medio_comunic_1_antes, medio_comunic_2_antes)
         
         # --- PASO 1.2: Limpieza de datos sobre DataFrame filtrado ---
         # Limpiar números de teléfono
@@ -1290,23 +1857,28 @@ def procesar_reporte_antiguedad(archivo_path, codigos_a_excluir=None):
         df_filtrado = add_geolocation_links(df_filtrado, columna_geolocalizacion)
         
         # DIAGNÓSTICO: Verificar columnas PAR en df_filtrado
-        columnas_par_filtrado = [col for col in df_filtrado.columns if 'par' in str(col).lower()]
-        if columnas_par_filtrado:
-            logger.warning(f"🚨 PROBLEMA: df_filtrado tiene columnas PAR: {columnas_par_filtrado}")
-        else:
-            logger.info(f"✅ df_filtrado NO tiene columnas PAR")
+        if logger.isEnabledFor(logging.DEBUG):
+            columnas_par_filtrado = [col for col in df_filtrado.columns if 'par' in str(col).lower()]
+            if columnas_par_filtrado:
+                logger.debug("🚨 PROBLEMA: df_filtrado tiene columnas PAR: %s", columnas_par_filtrado)
+            else:
+                logger.debug("✅ df_filtrado NO tiene columnas PAR")
 
-        # --- PASO 1.3: Crear Informe Completo (después del filtrado) ---
-        logger.info("Creando informe completo con registros filtrados")
-        df_completo = df_filtrado.sort_values(by=columna_mora, ascending=False).copy()
-        logger.info(f"🔍 df_completo ANTES de add_par_column: {[col for col in df_completo.columns if 'par' in str(col).lower()]}")
-        df_completo = add_par_column(df_completo, columna_mora)
+        # --- PASO 1.3: Ordenar una sola vez y añadir PAR (base del informe completo, mora, saldo vencido y coordinaciones) ---
+        df_ordenado = add_par_column(
+            df_filtrado.sort_values(by=columna_mora, ascending=False), columna_mora
+        )
         
-        # Insertar columna 'Link de Geolocalización' después de 'Geolocalización domicilio' si existen los links
-        if 'link_texto' in df_completo.columns and columna_geolocalizacion in df_completo.columns:
-            geo_index = df_completo.columns.get_loc(columna_geolocalizacion)
-            df_completo.insert(geo_index + 1, 'Link de Geolocalización', df_completo['link_texto'])
-            logger.info(f"📍 Insertada columna 'Link de Geolocalización' en df_completo después de '{columna_geolocalizacion}'")
+        # Insertar columna 'Link de Geolocalización' después de 'Geolocalización domicilio' una sola vez;
+        # mora, saldo vencido y coordinaciones la heredan al filtrar df_ordenado.
+        # Se conservan 'link_texto' y 'link_url' porque los hipervínculos se escriben con ellas.
+        if 'link_texto' in df_ordenado.columns and columna_geolocalizacion in df_ordenado.columns:
+            geo_index = df_ordenado.columns.get_loc(columna_geolocalizacion)
+            df_ordenado.insert(geo_index + 1, 'Link de Geolocalización', df_ordenado['link_texto'])
+            logger.info("📍 Insertada columna 'Link de Geolocalización' después de '%s'", columna_geolocalizacion)
+
+        logger.info("Creando informe completo con registros filtrados")
+        df_completo = df_ordenado
         
         # Crear DataFrame sin las columnas temporales de links para escritura en Excel
         df_completo_sin_links = df_completo.drop(columns=['link_texto', 'link_url'], errors='ignore')
@@ -1320,75 +1892,56 @@ def procesar_reporte_antiguedad(archivo_path, codigos_a_excluir=None):
             columnas.insert(0, 'Código acreditado')
             # Reordenar el DataFrame
             df_completo_sin_links = df_completo_sin_links[columnas]
-            logger.info(f"📋 Reordenadas columnas en reporte completo: 'Código acreditado' es la primera columna")
+            logger.info("📋 Reordenadas columnas en reporte completo: 'Código acreditado' es la primera columna")
         
         # DIAGNÓSTICO: Verificar si hay columnas duplicadas
-        columnas_duplicadas = df_completo_sin_links.columns[df_completo_sin_links.columns.duplicated()].tolist()
-        if columnas_duplicadas:
-            logger.error(f"🚨 COLUMNAS DUPLICADAS encontradas: {columnas_duplicadas}")
-            # Eliminar columnas duplicadas
-            df_completo_sin_links = df_completo_sin_links.loc[:, ~df_completo_sin_links.columns.duplicated()]
-            logger.info(f"🗑️ Columnas duplicadas eliminadas")
+        df_completo_sin_links = eliminar_columnas_duplicadas(df_completo_sin_links, 'reporte completo')
 
         # --- Pipeline para hoja RECUPERADOR_000124 (misma estructura que informe completo) ---
         if df_recup_000124_raw is not None and len(df_recup_000124_raw) > 0:
-            dr = clean_phone_numbers(df_recup_000124_raw.copy())
+            dr = clean_phone_numbers(df_recup_000124_raw)
             if 'Ciclo' in dr.columns:
                 dr['Ciclo'] = pd.to_numeric(dr['Ciclo'], errors='coerce').fillna(0).astype(int).astype(str).str.zfill(2)
             dr = add_geolocation_links(dr, columna_geolocalizacion)
-            dr = dr.sort_values(by=columna_mora, ascending=False).copy()
-            dr = add_par_column(dr, columna_mora)
+            dr = add_par_column(dr.sort_values(by=columna_mora, ascending=False), columna_mora)
             if 'link_texto' in dr.columns and columna_geolocalizacion in dr.columns:
                 geo_idx = dr.columns.get_loc(columna_geolocalizacion)
                 dr.insert(geo_idx + 1, 'Link de Geolocalización', dr['link_texto'])
-            df_recup_000124_completo = dr.copy()
-            dr = dr.drop(columns=['link_texto', 'link_url'], errors='ignore')
+            # dr no se modifica después: las transformaciones siguientes devuelven DataFrames nuevos
+            df_recup_000124_completo = dr
             if 'Código acreditado' in dr.columns:
                 cols = dr.columns.tolist()
                 cols.remove('Código acreditado')
                 cols.insert(0, 'Código acreditado')
                 dr = dr[cols]
-            dr = dr.loc[:, ~dr.columns.duplicated()] if dr.columns.duplicated().any() else dr
-            dr = agregar_columna_concepto_deposito(dr.copy())
-            dr = agregar_columnas_riesgo_y_mora(dr.copy())
+            _, dr = preparar_df_hoja_detalle(dr, 'RECUPERADOR_000124')
             dr = agregar_columnas_dias_ultimo_pago_y_alerta(dr)
             df_recup_000124_sin_links = dr
-            logger.info(f"📋 Preparados {len(df_recup_000124_sin_links)} registros para hoja RECUPERADOR_000124")
+            logger.info("📋 Preparados %s registros para hoja RECUPERADOR_000124", len(df_recup_000124_sin_links))
 
-        # --- PASO 3: Ordenar y añadir columnas calculadas (sobre datos filtrados) ---
-        df_ordenado = df_filtrado.sort_values(by=columna_mora, ascending=False).copy()
-        logger.info(f"🔍 df_ordenado ANTES de add_par_column: {[col for col in df_ordenado.columns if 'par' in str(col).lower()]}")
-        df_ordenado = add_par_column(df_ordenado, columna_mora)
-        
-        
-        # Verificación de integridad de datos - DESPUÉS de transformaciones (sobre datos filtrados)
+        # --- PASO 3: Verificación de integridad de datos - DESPUÉS de transformaciones (sobre datos filtrados)
         medio_comunic_1_despues = df_ordenado['Medio comunic. 1'].notna().sum() if 'Medio comunic. 1' in df_ordenado.columns else 0
         medio_comunic_2_despues = df_ordenado['Medio comunic. 2'].notna().sum() if 'Medio comunic. 2' in df_ordenado.columns else 0
         
         # Verificar integridad
         if medio_comunic_1_antes == medio_comunic_1_despues:
-            logger.info(f"Verificación 'Medio comunic. 1': Antes -> {medio_comunic_1_antes}, Después -> {medio_comunic_1_despues}. OK.")
+            logger.info("Verificación 'Medio comunic. 1': Antes -> %s, Después -> %s. OK.", medio_comunic_1_antes, medio_comunic_1_despues)
         else:
-            logger.warning(f"Verificación 'Medio comunic. 1': Antes -> {medio_comunic_1_antes}, Después -> {medio_comunic_1_despues}. PÉRDIDA DE DATOS!")
+            logger.warning("Verificación 'Medio comunic. 1': Antes -> %s, Después -> %s. PÉRDIDA DE DATOS!", medio_comunic_1_antes, medio_comunic_1_despues)
             
         if medio_comunic_2_antes == medio_comunic_2_despues:
-            logger.info(f"Verificación 'Medio comunic. 2': Antes -> {medio_comunic_2_antes}, Después -> {medio_comunic_2_despues}. OK.")
+            logger.info("Verificación 'Medio comunic. 2': Antes -> %s, Después -> %s. OK.", medio_comunic_2_antes, medio_comunic_2_despues)
         else:
-            logger.warning(f"Verificación 'Medio comunic. 2': Antes -> {medio_comunic_2_antes}, Después -> {medio_comunic_2_despues}. PÉRDIDA DE DATOS!")
+            logger.warning("Verificación 'Medio comunic. 2': Antes -> %s, Después -> %s. PÉRDIDA DE DATOS!", medio_comunic_2_antes, medio_comunic_2_despues)
+
+        # Columnas de riesgo y % MORA (por fila) calculadas una sola vez sobre df_ordenado: el informe
+        # completo, Mora y Saldo vencido son subconjuntos de sus filas y las toman por índice
+        riesgo_y_mora_base = calcular_riesgo_y_mora_base(df_ordenado)
 
         # --- PASO 4: Crear DataFrame de Mora ---
-        df_mora = df_ordenado[df_ordenado[columna_mora] >= 1].copy()
-        logger.info(f"Registros en mora: {len(df_mora)}")
-        
-        # Aplicar add_par_column a df_mora para eliminar columnas duplicadas y regenerar 'PAR'
-        logger.info(f"🔍 df_mora ANTES de add_par_column: {[col for col in df_mora.columns if 'par' in str(col).lower()]}")
-        df_mora = add_par_column(df_mora, columna_mora)
-        
-        # Insertar columna 'Link de Geolocalización' después de 'Geolocalización domicilio' si existen los links
-        if 'link_texto' in df_mora.columns and columna_geolocalizacion in df_mora.columns:
-            geo_index = df_mora.columns.get_loc(columna_geolocalizacion)
-            df_mora.insert(geo_index + 1, 'Link de Geolocalización', df_mora['link_texto'])
-            logger.info(f"📍 Insertada columna 'Link de Geolocalización' en df_mora después de '{columna_geolocalizacion}'")
+        # El filtrado booleano ya devuelve un DataFrame nuevo, ordenado y con 'PAR' y links (heredados de df_ordenado)
+        df_mora = df_ordenado[df_ordenado[columna_mora] >= 1]
+        logger.info("Registros en mora: %s", len(df_mora))
         
         # --- PASO 4.1: Crear DataFrame de Cuentas con Saldo Vencido ---
         columna_saldo_vencido = COLUMN_MAPPING.get('saldo_vencido', 'Saldo vencido')
@@ -1399,44 +1952,18 @@ def procesar_reporte_antiguedad(archivo_path, codigos_a_excluir=None):
             df_saldo_vencido = df_ordenado[
                 (df_ordenado[columna_saldo_vencido] >= 1) & 
                 (pd.isna(df_ordenado[columna_mora]) | (df_ordenado[columna_mora] <= 0))
-            ].copy()
-            logger.info(f"Registros con saldo vencido >= 1 y sin mora: {len(df_saldo_vencido)}")
+            ]
+            logger.info("Registros con saldo vencido >= 1 y sin mora: %s", len(df_saldo_vencido))
             
-            if len(df_saldo_vencido) > 0:
-                # Aplicar add_par_column a df_saldo_vencido para eliminar columnas duplicadas y regenerar 'PAR'
-                logger.info(f"🔍 df_saldo_vencido ANTES de add_par_column: {[col for col in df_saldo_vencido.columns if 'par' in str(col).lower()]}")
-                df_saldo_vencido = add_par_column(df_saldo_vencido, columna_mora)
-                
-                # Insertar columna 'Link de Geolocalización' después de 'Geolocalización domicilio' si existen los links
-                if 'link_texto' in df_saldo_vencido.columns and columna_geolocalizacion in df_saldo_vencido.columns:
-                    geo_index = df_saldo_vencido.columns.get_loc(columna_geolocalizacion)
-                    df_saldo_vencido.insert(geo_index + 1, 'Link de Geolocalización', df_saldo_vencido['link_texto'])
-                    logger.info(f"📍 Insertada columna 'Link de Geolocalización' en df_saldo_vencido después de '{columna_geolocalizacion}'")
-            else:
+            if len(df_saldo_vencido) == 0:
                 logger.info("No se encontraron registros con saldo vencido >= 1 y sin mora")
         else:
-            logger.warning(f"⚠️ Columna '{columna_saldo_vencido}' no encontrada en DataFrame. Saltando creación de hoja 'Cuentas con saldo vencido'")
+            logger.warning("⚠️ Columna '%s' no encontrada en DataFrame. Saltando creación de hoja 'Cuentas con saldo vencido'", columna_saldo_vencido)
             df_saldo_vencido = None
 
         # --- PASO 5: Distribuir ---
-        coordinaciones_data = {}
-        lista_coordinaciones = df_ordenado[columna_coordinacion].unique()
-        for coord in lista_coordinaciones:
-            if pd.notna(coord):
-                df_coord = df_ordenado[df_ordenado[columna_coordinacion] == coord].copy()
-                
-                # Aplicar add_par_column a df_coord para eliminar columnas duplicadas y regenerar 'PAR'
-                logger.info(f"🔍 df_coord '{coord}' ANTES de add_par_column: {[col for col in df_coord.columns if 'par' in str(col).lower()]}")
-                df_coord = add_par_column(df_coord, columna_mora)
-                
-                # Insertar columna 'Link de Geolocalización' después de 'Geolocalización domicilio' si existen los links
-                if 'link_texto' in df_coord.columns and columna_geolocalizacion in df_coord.columns:
-                    geo_index = df_coord.columns.get_loc(columna_geolocalizacion)
-                    df_coord.insert(geo_index + 1, 'Link de Geolocalización', df_coord['link_texto'])
-                    logger.info(f"📍 Insertada columna 'Link de Geolocalización' en coordinación '{coord}' después de '{columna_geolocalizacion}'")
-                
-                coordinaciones_data[coord] = df_coord
-                
+        # 'PAR' y 'Link de Geolocalización' ya vienen en df_ordenado; solo se reporta cuántas coordinaciones hay
+        num_coordinaciones = df_ordenado[columna_coordinacion].nunique()
 
         # --- PASO 6: Generar el archivo Excel final ---
         # Calcular fecha del reporte: día anterior, excepto lunes que usa viernes
@@ -1457,25 +1984,25 @@ def procesar_reporte_antiguedad(archivo_path, codigos_a_excluir=None):
         
         if usar_plantilla:
             # --- Flujo con plantilla: usar tablas dinámicas existentes ---
-            logger.info(f"📋 Plantilla con tablas dinámicas encontrada: {plantilla_path}")
-            import shutil
-            shutil.copy(plantilla_path, ruta_salida)
-            logger.info(f"📋 Plantilla copiada a: {ruta_salida}")
+            logger.info("📋 Plantilla con tablas dinámicas encontrada: %s", plantilla_path)
             
-            # Abrir el archivo copiado con openpyxl para llenar R_Completo
-            import openpyxl
-            wb_plantilla = openpyxl.load_workbook(ruta_salida)
+            # Copiar la plantilla a ruta_salida y abrirla con ExcelWriter en modo 'a': el libro que carga
+            # pandas (writer.book) es el que se llena aquí y se guarda una sola vez al cerrar el writer,
+            # sin guardar y volver a abrir el archivo. Ninguna de las hojas que se escriben con to_excel
+            # existe en la plantilla, por lo que no hace falta if_sheet_exists.
+            shutil.copyfile(plantilla_path, ruta_salida)
+            writer = pd.ExcelWriter(ruta_salida, engine='openpyxl', mode='a')
+            wb_plantilla = writer.book
             
             # Preparar datos para R_Completo
-            df_r_completo = df_completo_sin_links.copy()
-            df_r_completo = agregar_columna_concepto_deposito(df_r_completo)
-            df_r_completo = agregar_columnas_riesgo_y_mora(df_r_completo)
+            # preparar_df_hoja_detalle trabaja sobre un DataFrame nuevo: df_completo_sin_links no se modifica
+            _, df_r_completo = preparar_df_hoja_detalle(df_completo_sin_links, 'R_Completo')
             df_r_completo = agregar_columnas_dias_ultimo_pago_y_alerta(df_r_completo)
             df_r_completo = agregar_columnas_nuevas(df_r_completo)
 
             # Iter 10: descartar columnas extra del archivo fuente (Fraude, vacías, etc.)
             df_r_completo = df_r_completo.iloc[:, :74]
-            logger.info(f"✅ df_r_completo recortado a {len(df_r_completo.columns)} columnas: {list(df_r_completo.columns[-3:])}")
+            logger.info("✅ df_r_completo recortado a %s columnas: %s", len(df_r_completo.columns), list(df_r_completo.columns[-3:]))
 
             # Iter 11: agregar columna 'Suma' (col 75) — 1 si Días de mora está entre 1 y 30, else 0
             _col_mora = COLUMN_MAPPING.get('mora', 'Días de mora')
@@ -1487,6 +2014,11 @@ def procesar_reporte_antiguedad(archivo_path, codigos_a_excluir=None):
                 df_r_completo['Suma'] = 0
             logger.info("✅ Columna 'Suma' (col 75) agregada")
 
+            # Las hojas R_Completo, fecha, siguiente e histórico se formatean con df_r_completo: anchos una sola vez
+            anchos_r_completo = calcular_anchos_columnas(df_r_completo)
+            # Las hojas de fecha, siguiente e histórico escriben sus encabezados desde df_r_completo (columna A)
+            encabezados_r_completo = mapa_columnas(df_r_completo)
+
             # Llenar hoja R_Completo con los datos
             if 'R_Completo' in wb_plantilla.sheetnames:
                 ws_r_completo = wb_plantilla['R_Completo']
@@ -1494,8 +2026,8 @@ def procesar_reporte_antiguedad(archivo_path, codigos_a_excluir=None):
                 # Row 2 (headers) viene completa desde la plantilla — no se toca para preservar el autoFilter de la tabla.
                 
                 # Escribir datos desde fila 3
-                logger.info(f"📝 Escribiendo {len(df_r_completo)} filas en R_Completo...")
-                for row_idx, (_, row) in enumerate(df_r_completo.iterrows(), start=3):
+                logger.info("📝 Escribiendo %s filas en R_Completo...", len(df_r_completo))
+                for row_idx, row in enumerate(df_r_completo.itertuples(index=False, name=None), start=3):
                     for col_idx, value in enumerate(row, start=1):
                         cell = ws_r_completo.cell(row=row_idx, column=col_idx)
                         if pd.isna(value):
@@ -1504,22 +2036,24 @@ def procesar_reporte_antiguedad(archivo_path, codigos_a_excluir=None):
                             cell.value = value
                 
                 # Hipervínculos en columna 'Link de Geolocalización'
-                if 'Link de Geolocalización' in df_r_completo.columns and 'link_texto' in df_completo.columns:
-                    link_col_r = df_r_completo.columns.get_loc('Link de Geolocalización') + 1
-                    for i, (_, fila) in enumerate(df_completo.iterrows()):
-                        row_num = i + 3
-                        escribir_hipervinculo_excel(ws_r_completo, row_num, link_col_r, fila.get('link_texto'), fila.get('link_url'))
+                link_col_r = encabezados_r_completo.get('Link de Geolocalización')
+                if link_col_r and 'link_texto' in df_completo.columns:
+                    escribir_hipervinculos_columna(ws_r_completo, link_col_r, df_completo)
 
                 # Formato condicional degradado en columna 'Días de mora'
                 col_mora_nombre = COLUMN_MAPPING.get('mora', 'Días de mora')
-                aplicar_formato_condicional(ws_r_completo, col_mora_nombre, len(df_r_completo))
+                aplicar_formato_condicional(ws_r_completo, col_mora_nombre, len(df_r_completo), encabezados_r_completo)
+
+                # Encabezados de R_Completo tal como vienen en la plantilla, leídos una sola vez
+                encabezados_plantilla = mapa_encabezados(ws_r_completo)
 
                 # Aplicar formatos de porcentaje (% MORA) y Alerta (relleno rojo)
-                aplicar_formato_porcentaje_mora(ws_r_completo, df_r_completo)
-                aplicar_formato_alerta(ws_r_completo, df_r_completo)
+                aplicar_formato_porcentaje_mora(ws_r_completo, df_r_completo, encabezados_plantilla)
+                aplicar_formato_alerta(ws_r_completo, df_r_completo, encabezados_plantilla)
 
                 # Aplicar formato de moneda y fecha corta a R_Completo
-                aplicar_formato_final(ws_r_completo, df_r_completo, es_hoja_mora=False)
+                aplicar_formato_final(ws_r_completo, df_r_completo, es_hoja_mora=False, anchos=anchos_r_completo,
+                                      encabezados=encabezados_plantilla)
 
                 # Actualizar rango de la tabla existente para abarcar todos los datos escritos
                 num_filas_escritas = len(df_r_completo)
@@ -1530,15 +2064,15 @@ def procesar_reporte_antiguedad(archivo_path, codigos_a_excluir=None):
                 if hasattr(ws_r_completo, 'tables') and ws_r_completo.tables:
                     for t_name in list(ws_r_completo.tables.keys()):
                         ws_r_completo.tables[t_name].ref = nuevo_rango
-                        logger.info(f"✅ Rango de tabla '{t_name}' en R_Completo actualizado a {nuevo_rango}")
+                        logger.info("✅ Rango de tabla '%s' en R_Completo actualizado a %s", t_name, nuevo_rango)
                 
-                logger.info(f"✅ R_Completo llenado con {len(df_r_completo)} registros")
+                logger.info("✅ R_Completo llenado con %s registros", len(df_r_completo))
             else:
                 logger.warning("⚠️ Hoja 'R_Completo' no encontrada en la plantilla")
 
             # --- ITERACIÓN 4: Crear hoja de fecha (copia idéntica de R_Completo) ---
             nombre_hoja_fecha = fecha_actual  # DDMMYYYY
-            logger.info(f"📋 Creando hoja de fecha '{nombre_hoja_fecha}' (copia de R_Completo)...")
+            logger.info("📋 Creando hoja de fecha '%s' (copia de R_Completo)...", nombre_hoja_fecha)
             if nombre_hoja_fecha in wb_plantilla.sheetnames:
                 del wb_plantilla[nombre_hoja_fecha]
             ws_fecha = wb_plantilla.create_sheet(title=nombre_hoja_fecha)
@@ -1546,16 +2080,14 @@ def procesar_reporte_antiguedad(archivo_path, codigos_a_excluir=None):
             # Encabezados en fila 2
             for col_idx, col_name in enumerate(df_r_completo.columns, start=1):
                 cell = ws_fecha.cell(row=2, column=col_idx, value=col_name)
-                cell.font = Font(bold=True)
+                cell.font = FUENTE_NEGRITA
             ws_fecha.row_dimensions[2].height = EXCEL_CONFIG['header_height']
 
             # Relleno azul en encabezado "Días de mora"
             col_mora_nombre = COLUMN_MAPPING.get('mora', 'Días de mora')
-            for col_idx, col_name in enumerate(df_r_completo.columns, start=1):
-                if col_name == col_mora_nombre:
-                    ws_fecha.cell(row=2, column=col_idx).fill = PatternFill(
-                        start_color=COLORS['light_blue'], end_color=COLORS['light_blue'], fill_type='solid')
-                    break
+            col_idx = encabezados_r_completo.get(col_mora_nombre)
+            if col_idx:
+                ws_fecha.cell(row=2, column=col_idx).fill = RELLENO_AZUL_ENCABEZADO
 
             # Pre-calcular columnas de moneda y fecha para aplicar formato en el mismo loop
             _NO_MONEDA = {'días desde el último pago', 'dias desde el ultimo pago', 'pagos vencidos'}
@@ -1568,7 +2100,7 @@ def procesar_reporte_antiguedad(archivo_path, codigos_a_excluir=None):
                     _cols_moneda_fecha[_ci] = EXCEL_CONFIG['date_format']
 
             # Datos desde fila 3 — formato aplicado celda por celda en el mismo loop
-            for row_idx, (_, row) in enumerate(df_r_completo.iterrows(), start=3):
+            for row_idx, row in enumerate(df_r_completo.itertuples(index=False, name=None), start=3):
                 for col_idx, value in enumerate(row, start=1):
                     cell = ws_fecha.cell(row=row_idx, column=col_idx)
                     cell.value = None if pd.isna(value) else value
@@ -1577,10 +2109,11 @@ def procesar_reporte_antiguedad(archivo_path, codigos_a_excluir=None):
 
             # Mismo formato que R_Completo
             aplicar_formatos_moneda_fecha_openpyxl(ws_fecha, df_r_completo, len(df_r_completo))
-            aplicar_formato_condicional(ws_fecha, col_mora_nombre, len(df_r_completo))
-            aplicar_formato_porcentaje_mora(ws_fecha, df_r_completo)
-            aplicar_formato_alerta(ws_fecha, df_r_completo)
-            aplicar_formato_final(ws_fecha, df_r_completo, es_hoja_mora=False)
+            aplicar_formato_condicional(ws_fecha, col_mora_nombre, len(df_r_completo), encabezados_r_completo)
+            aplicar_formato_porcentaje_mora(ws_fecha, df_r_completo, encabezados_r_completo)
+            aplicar_formato_alerta(ws_fecha, df_r_completo, encabezados_r_completo)
+            aplicar_formato_final(ws_fecha, df_r_completo, es_hoja_mora=False, anchos=anchos_r_completo,
+                                  encabezados=encabezados_r_completo)
 
             # Bug 4-B: agregar tabla formal a ws_fecha
             num_filas_fecha = len(df_r_completo)
@@ -1596,14 +2129,14 @@ def procesar_reporte_antiguedad(archivo_path, codigos_a_excluir=None):
                 showLastColumn=False, showRowStripes=False, showColumnStripes=False
             )
             ws_fecha.add_table(tabla_fecha)
-            logger.info(f"✅ Hoja '{nombre_hoja_fecha}' creada con {len(df_r_completo)} registros y tabla formal")
+            logger.info("✅ Hoja '%s' creada con %s registros y tabla formal", nombre_hoja_fecha, len(df_r_completo))
 
             # --- ITERACIÓN 5: Crear hoja Abril2026 (hardcoded por ahora) ---
             # Bug 5-A: el corte es abril 2026, mes_siguiente daría mayo — hardcodear abril 2026
             mes_filtro = 4
             anio_filtro = 2026
             nombre_hoja_siguiente = "Abril2026"
-            logger.info(f"📋 Creando hoja '{nombre_hoja_siguiente}' (Inicio ciclo = abril 2026)...")
+            logger.info("📋 Creando hoja '%s' (Inicio ciclo = abril 2026)...", nombre_hoja_siguiente)
 
             col_inicio_ciclo = 'Inicio ciclo'
             if col_inicio_ciclo in df_r_completo.columns:
@@ -1612,7 +2145,7 @@ def procesar_reporte_antiguedad(archivo_path, codigos_a_excluir=None):
                     (serie_ciclo.dt.month == mes_filtro) & (serie_ciclo.dt.year == anio_filtro)
                 ].copy()
             else:
-                logger.warning(f"⚠️ Columna '{col_inicio_ciclo}' no encontrada — hoja '{nombre_hoja_siguiente}' se crea vacía")
+                logger.warning("⚠️ Columna '%s' no encontrada — hoja '%s' se crea vacía", col_inicio_ciclo, nombre_hoja_siguiente)
                 df_siguiente = df_r_completo.iloc[0:0].copy()
 
             if nombre_hoja_siguiente in wb_plantilla.sheetnames:
@@ -1622,40 +2155,32 @@ def procesar_reporte_antiguedad(archivo_path, codigos_a_excluir=None):
             # Encabezados en fila 2
             for col_idx, col_name in enumerate(df_r_completo.columns, start=1):
                 cell = ws_siguiente.cell(row=2, column=col_idx, value=col_name)
-                cell.font = Font(bold=True)
+                cell.font = FUENTE_NEGRITA
             ws_siguiente.row_dimensions[2].height = EXCEL_CONFIG['header_height']
 
             # Relleno azul en encabezado "Días de mora"
-            for col_idx, col_name in enumerate(df_r_completo.columns, start=1):
-                if col_name == col_mora_nombre:
-                    ws_siguiente.cell(row=2, column=col_idx).fill = PatternFill(
-                        start_color=COLORS['light_blue'], end_color=COLORS['light_blue'], fill_type='solid')
-                    break
+            col_idx = encabezados_r_completo.get(col_mora_nombre)
+            if col_idx:
+                ws_siguiente.cell(row=2, column=col_idx).fill = RELLENO_AZUL_ENCABEZADO
 
-            # Pre-calcular formatos para df_siguiente (mismas columnas que df_r_completo)
-            _cols_moneda_fecha_sig = {}
-            for _ci, _cn in enumerate(df_r_completo.columns, start=1):
-                _cl = _cn.lower().strip()
-                if any(k in _cl for k in CURRENCY_COLUMNS_KEYWORDS) and _cl not in _NO_MONEDA:
-                    _cols_moneda_fecha_sig[_ci] = EXCEL_CONFIG['currency_format']
-                elif str(df_r_completo[_cn].dtype).startswith('datetime'):
-                    _cols_moneda_fecha_sig[_ci] = EXCEL_CONFIG['date_format']
+            # df_siguiente tiene las mismas columnas que df_r_completo: se reutiliza _cols_moneda_fecha
 
             # Datos desde fila 3 — formato aplicado celda por celda en el mismo loop
-            for row_idx, (_, row) in enumerate(df_siguiente.iterrows(), start=3):
+            for row_idx, row in enumerate(df_siguiente.itertuples(index=False, name=None), start=3):
                 for col_idx, value in enumerate(row, start=1):
                     cell = ws_siguiente.cell(row=row_idx, column=col_idx)
                     cell.value = None if pd.isna(value) else value
-                    if col_idx in _cols_moneda_fecha_sig:
-                        cell.number_format = _cols_moneda_fecha_sig[col_idx]
+                    if col_idx in _cols_moneda_fecha:
+                        cell.number_format = _cols_moneda_fecha[col_idx]
 
             # Mismo formato que R_Completo (solo si hay datos — rango vacío causa error en formato condicional)
             if len(df_siguiente) > 0:
                 aplicar_formatos_moneda_fecha_openpyxl(ws_siguiente, df_siguiente, len(df_siguiente))
-                aplicar_formato_condicional(ws_siguiente, col_mora_nombre, len(df_siguiente))
-                aplicar_formato_porcentaje_mora(ws_siguiente, df_siguiente)
-                aplicar_formato_alerta(ws_siguiente, df_siguiente)
-            aplicar_formato_final(ws_siguiente, df_r_completo, es_hoja_mora=False)
+                aplicar_formato_condicional(ws_siguiente, col_mora_nombre, len(df_siguiente), encabezados_r_completo)
+                aplicar_formato_porcentaje_mora(ws_siguiente, df_siguiente, encabezados_r_completo)
+                aplicar_formato_alerta(ws_siguiente, df_siguiente, encabezados_r_completo)
+            aplicar_formato_final(ws_siguiente, df_r_completo, es_hoja_mora=False, anchos=anchos_r_completo,
+                                  encabezados=encabezados_r_completo)
 
             # Bug 5-B: agregar tabla formal a ws_siguiente
             num_filas_sig = len(df_siguiente)
@@ -1670,19 +2195,19 @@ def procesar_reporte_antiguedad(archivo_path, codigos_a_excluir=None):
                 showLastColumn=False, showRowStripes=False, showColumnStripes=False
             )
             ws_siguiente.add_table(tabla_siguiente)
-            logger.info(f"✅ Hoja '{nombre_hoja_siguiente}' creada con {len(df_siguiente)} registros y tabla formal")
+            logger.info("✅ Hoja '%s' creada con %s registros y tabla formal", nombre_hoja_siguiente, len(df_siguiente))
 
             # --- ITERACIÓN 13: Crear hoja histórica acumulada 'Marzo2026' ---
             # Contiene TODOS los registros con Inicio ciclo < 01/04/2026 (acumulado, no solo marzo)
             nombre_hoja_historico = "Marzo2026"
             corte_historico = pd.Timestamp(2026, 4, 1)
-            logger.info(f"📋 Creando hoja histórica '{nombre_hoja_historico}' (Inicio ciclo < {corte_historico.date()})...")
+            logger.info("📋 Creando hoja histórica '%s' (Inicio ciclo < %s)...", nombre_hoja_historico, corte_historico.date())
 
             if col_inicio_ciclo in df_r_completo.columns:
                 serie_ciclo_hist = pd.to_datetime(df_r_completo[col_inicio_ciclo], errors='coerce')
                 df_historico = df_r_completo[serie_ciclo_hist < corte_historico].copy()
             else:
-                logger.warning(f"⚠️ Columna '{col_inicio_ciclo}' no encontrada — hoja '{nombre_hoja_historico}' se crea vacía")
+                logger.warning("⚠️ Columna '%s' no encontrada — hoja '%s' se crea vacía", col_inicio_ciclo, nombre_hoja_historico)
                 df_historico = df_r_completo.iloc[0:0].copy()
 
             if nombre_hoja_historico in wb_plantilla.sheetnames:
@@ -1692,31 +2217,30 @@ def procesar_reporte_antiguedad(archivo_path, codigos_a_excluir=None):
             # Encabezados en fila 2
             for col_idx, col_name in enumerate(df_r_completo.columns, start=1):
                 cell = ws_historico.cell(row=2, column=col_idx, value=col_name)
-                cell.font = Font(bold=True)
+                cell.font = FUENTE_NEGRITA
             ws_historico.row_dimensions[2].height = EXCEL_CONFIG['header_height']
 
             # Relleno azul en encabezado "Días de mora"
-            for col_idx, col_name in enumerate(df_r_completo.columns, start=1):
-                if col_name == col_mora_nombre:
-                    ws_historico.cell(row=2, column=col_idx).fill = PatternFill(
-                        start_color=COLORS['light_blue'], end_color=COLORS['light_blue'], fill_type='solid')
-                    break
+            col_idx = encabezados_r_completo.get(col_mora_nombre)
+            if col_idx:
+                ws_historico.cell(row=2, column=col_idx).fill = RELLENO_AZUL_ENCABEZADO
 
             # Datos desde fila 3
-            for row_idx, (_, row) in enumerate(df_historico.iterrows(), start=3):
+            for row_idx, row in enumerate(df_historico.itertuples(index=False, name=None), start=3):
                 for col_idx, value in enumerate(row, start=1):
                     cell = ws_historico.cell(row=row_idx, column=col_idx)
                     cell.value = None if pd.isna(value) else value
-                    if col_idx in _cols_moneda_fecha_sig:
-                        cell.number_format = _cols_moneda_fecha_sig[col_idx]
+                    if col_idx in _cols_moneda_fecha:
+                        cell.number_format = _cols_moneda_fecha[col_idx]
 
             # Formatos
             if len(df_historico) > 0:
                 aplicar_formatos_moneda_fecha_openpyxl(ws_historico, df_historico, len(df_historico))
-                aplicar_formato_condicional(ws_historico, col_mora_nombre, len(df_historico))
-                aplicar_formato_porcentaje_mora(ws_historico, df_historico)
-                aplicar_formato_alerta(ws_historico, df_historico)
-            aplicar_formato_final(ws_historico, df_r_completo, es_hoja_mora=False)
+                aplicar_formato_condicional(ws_historico, col_mora_nombre, len(df_historico), encabezados_r_completo)
+                aplicar_formato_porcentaje_mora(ws_historico, df_historico, encabezados_r_completo)
+                aplicar_formato_alerta(ws_historico, df_historico, encabezados_r_completo)
+            aplicar_formato_final(ws_historico, df_r_completo, es_hoja_mora=False, anchos=anchos_r_completo,
+                                  encabezados=encabezados_r_completo)
 
             # Tabla formal
             ultima_col_hist = get_column_letter(len(df_r_completo.columns))
@@ -1730,7 +2254,7 @@ def procesar_reporte_antiguedad(archivo_path, codigos_a_excluir=None):
                 showLastColumn=False, showRowStripes=False, showColumnStripes=False
             )
             ws_historico.add_table(tabla_historico)
-            logger.info(f"✅ Hoja '{nombre_hoja_historico}' creada con {len(df_historico)} registros (acumulado hasta {corte_historico.date()})")
+            logger.info("✅ Hoja '%s' creada con %s registros (acumulado hasta %s)", nombre_hoja_historico, len(df_historico), corte_historico.date())
 
             # --- ITERACIÓN 14: Reordenar pestañas ---
             ORDEN_HOJAS = [
@@ -1749,22 +2273,25 @@ def procesar_reporte_antiguedad(archivo_path, codigos_a_excluir=None):
                 if nombre in wb_plantilla.sheetnames:
                     idx_actual = wb_plantilla.sheetnames.index(nombre)
                     wb_plantilla.move_sheet(nombre, offset=i - idx_actual)
-            logger.info(f"✅ Orden de pestañas aplicado: {[s for s in ORDEN_HOJAS if s in wb_plantilla.sheetnames]}")
+            logger.info("✅ Orden de pestañas aplicado: %s", [s for s in ORDEN_HOJAS if s in wb_plantilla.sheetnames])
 
-            # Guardar cambios
-            wb_plantilla.save(ruta_salida)
-            wb_plantilla.close()
             
             # Configurar tablas dinámicas para que se actualicen automáticamente al abrir
             # NOTA: Por ahora desactivado para pruebas - el usuario puede activar refreshOnLoad manualmente en la plantilla
             logger.info("ℹ️ Para actualización automática de tablas dinámicas, configura 'Actualizar al abrir' en la plantilla")
             
-            # Usar ExcelWriter en modo append para agregar las demás hojas
-            writer = pd.ExcelWriter(ruta_salida, engine='openpyxl', mode='a', if_sheet_exists='new')
+            logger.info("📋 Plantilla se guardará en: %s", ruta_salida)
         else:
             # --- Flujo sin plantilla: crear todo desde cero ---
-            logger.info(f"ℹ️ Plantilla no encontrada en: {plantilla_path}")
+            logger.info("ℹ️ Plantilla no encontrada en: %s", plantilla_path)
             logger.info("   Generando archivo sin tablas dinámicas")
+            # Se mantiene openpyxl también sin plantilla: después de to_excel las hojas se releen y
+            # modifican (copia de encabezados, limpieza de áreas, tablas, combinaciones, hipervínculos),
+            # y xlsxwriter solo permite escribir hacia adelante, sin acceso a las celdas ya escritas.
+            # Por la misma razón no se usa Workbook(write_only=True): las hojas de solo escritura no
+            # permiten leer ni modificar celdas ya agregadas. Si lxml está instalado, openpyxl lo usa
+            # automáticamente para serializar el archivo al guardar. El equivalente a los formatos
+            # compartidos de xlsxwriter (add_format) son los estilos con nombre de registrar_estilos_resumen.
             writer = pd.ExcelWriter(ruta_salida, engine='openpyxl')
         
         with writer:
@@ -1772,717 +2299,399 @@ def procesar_reporte_antiguedad(archivo_path, codigos_a_excluir=None):
             # Si usamos plantilla, estas hojas ya existen con tablas dinámicas
             crear_hojas_resumen = not usar_plantilla
             
-            if crear_hojas_resumen:
+            if not crear_hojas_resumen:
+                logger.info("📋 Usando plantilla - X_Coordinación ya existe con tabla dinámica")
+            else:
                 logger.info("Creando hoja 'X_Coordinación' (PRIMERA HOJA)...")
                 try:
-                    df_x_coordinacion = crear_hoja_x_coordinacion(df_completo)
-                    logger.info(f"🔍 DataFrame X_Coordinación creado: {len(df_x_coordinacion)} filas, {len(df_x_coordinacion.columns)} columnas")
-                    logger.info(f"🔍 Columnas en df_x_coordinacion: {list(df_x_coordinacion.columns)}")
+                    df_x_coordinacion = crear_hoja_x_coordinacion(df_completo, riesgo_y_mora_base)
+                    logger.info("🔍 DataFrame X_Coordinación creado: %s filas, %s columnas", len(df_x_coordinacion), len(df_x_coordinacion.columns))
+                    logger.debug("🔍 Columnas en df_x_coordinacion: %s", list(df_x_coordinacion.columns))
+                except SinDatosError as e:
+                    logger.warning("⚠️ No se pudo crear la hoja 'X_Coordinación': %s", e)
+                    logger.warning("🔍 Columnas disponibles en df_completo: %s...", list(df_completo.columns)[:20])
+                    logger.warning("🔍 Total columnas en df_completo: %s", len(df_completo.columns))
                 except Exception as e:
-                    logger.error(f"❌ Error creando hoja X_Coordinación: {str(e)}")
-                    import traceback
+                    logger.error("❌ Error creando hoja X_Coordinación: %s", str(e))
                     logger.error(traceback.format_exc())
-                    df_x_coordinacion = pd.DataFrame()
-            else:
-                df_x_coordinacion = pd.DataFrame()  # Vacío para saltar el bloque siguiente
-                logger.info("📋 Usando plantilla - X_Coordinación ya existe con tabla dinámica")
-            
-            if not df_x_coordinacion.empty:
-                # Reorganizar columnas del DataFrame para que coincidan con la estructura
-                columnas_principales = [
-                    'Coordinación', 'Cantidad Prestada', 'Saldo capital', 'Saldo vencido',
-                    'Saldo total', 'Saldo riesgo capital', 'Saldo riesgo total', '% MORA'
-                ]
-                
-                # Verificar que las columnas existan y reordenar
-                columnas_disponibles = [col for col in columnas_principales if col in df_x_coordinacion.columns]
-                columnas_adicionales = [col for col in df_x_coordinacion.columns if col not in columnas_principales]
-                
-                # Reordenar DataFrame
-                df_x_coordinacion_ordenado = df_x_coordinacion[columnas_disponibles + columnas_adicionales].copy()
-                
-                # Renombrar columnas de rangos para que coincidan
-                mapeo_rangos = {
-                    'Rango_0': '0',
-                    'Rango_1-7': '1-7 días',
-                    'Rango_8-15': '8-15 días',
-                    'Rango_16-30': '16-30 días',
-                    'Rango_31-60': '31-60 días',
-                    'Rango_61-90': '61-90 días',
-                    'Rango_Mayor_90': 'Mayor_90'
-                }
-                
-                # Renombrar columnas de rangos
-                for col_antigua, col_nueva in mapeo_rangos.items():
-                    if col_antigua in df_x_coordinacion_ordenado.columns:
-                        df_x_coordinacion_ordenado = df_x_coordinacion_ordenado.rename(columns={col_antigua: col_nueva})
-                
-                logger.info(f"🔍 Escribiendo hoja X_Coordinación con {len(df_x_coordinacion_ordenado)} filas")
-                
-                # Escribir DataFrame empezando en fila 9 (después de encabezados en fila 6 y filas 7-8 comprimidas)
-                df_x_coordinacion_ordenado.to_excel(writer, sheet_name='X_Coordinación', index=False, startrow=9)
-                ws_x_coord = writer.sheets['X_Coordinación']
-                
-                logger.info(f"✅ Hoja X_Coordinación creada en Excel. Filas: {ws_x_coord.max_row}, Columnas: {ws_x_coord.max_column}")
-                
-                # Escribir estructura completa (filas 1-7) según formato objetivo
-                # Filas 1-4: Vacías (no hacer nada)
-                
-                # Color azul para encabezados (sombreado claro con letra azul fuerte)
-                color_fondo_azul_claro = 'D9E1F2'  # Azul claro para fondo
-                color_texto_azul_fuerte = '002060'  # Azul fuerte para texto
-                
-                # Fila 5: "PAR" centrado desde J5 hasta O5 con fondo azul
-                ws_x_coord.merge_cells('J5:O5')
-                cell_par = ws_x_coord.cell(row=5, column=10)  # Columna J (10)
-                cell_par.value = 'PAR'
-                cell_par.font = Font(bold=True, size=11, color=color_texto_azul_fuerte)
-                cell_par.fill = PatternFill(start_color=color_fondo_azul_claro, end_color=color_fondo_azul_claro, fill_type='solid')
-                cell_par.alignment = Alignment(horizontal='center', vertical='center')
-                cell_par.border = Border(
-                    left=Side(style='thin', color='000000'),
-                    right=Side(style='thin', color='000000'),
-                    top=Side(style='thin', color='000000'),
-                    bottom=Side(style='thin', color='000000')
-                )
-                
-                # Fila 6: Encabezados de AMBAS tablas
-                # TABLA 1: Columnas A-H (1-8) - Encabezados principales
-                encabezados_tabla1 = [
-                    'Coordinación', 'Cantidad\nPrestada', 'Saldo\nCapital', 'Saldo\nVencido',
-                    'Saldo\nTotal', 'Saldo\nRiesgo Capital', 'Saldo\nRiesgo Total', '% MORA'
-                ]
-                for col_idx, encabezado in enumerate(encabezados_tabla1, start=1):
-                    cell = ws_x_coord.cell(row=6, column=col_idx)
-                    cell.value = encabezado
-                    cell.font = Font(bold=True, size=11, color=color_texto_azul_fuerte)
-                    cell.fill = PatternFill(start_color=color_fondo_azul_claro, end_color=color_fondo_azul_claro, fill_type='solid')
-                    cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-                    cell.border = Border(
-                        left=Side(style='thin', color='000000'),
-                        right=Side(style='thin', color='000000'),
-                        top=Side(style='thin', color='000000'),
-                        bottom=Side(style='thin', color='000000')
-                    )
-                
-                # Columna I (9): Vacía - separador entre tablas (no hacer nada)
-                
-                # TABLA 2: Columnas J-S (10-19) - Copiar encabezados de la fila 10 (donde pandas los escribió) a la fila 6
-                # Primero, leer los encabezados que pandas escribió en la fila 10
-                # Limpiar todos los encabezados de la fila 10 (tanto de tabla 1 como tabla 2) y copiar solo los de tabla 2 a fila 6
-                for col_idx in range(1, ws_x_coord.max_column + 1):
-                    cell_fila10 = ws_x_coord.cell(row=10, column=col_idx)
-                    if cell_fila10.value is not None:
-                        # Si es del segundo segmento (columna 10 en adelante), copiar a la fila 6
-                        if col_idx >= 10:
-                            cell_fila6 = ws_x_coord.cell(row=6, column=col_idx)
-                            cell_fila6.value = cell_fila10.value
-                            cell_fila6.font = Font(bold=True, size=11, color=color_texto_azul_fuerte)
-                            cell_fila6.fill = PatternFill(start_color=color_fondo_azul_claro, end_color=color_fondo_azul_claro, fill_type='solid')
-                            cell_fila6.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-                            cell_fila6.border = Border(
-                                left=Side(style='thin', color='000000'),
-                                right=Side(style='thin', color='000000'),
-                                top=Side(style='thin', color='000000'),
-                                bottom=Side(style='thin', color='000000')
-                            )
-                        # Limpiar la celda de la fila 10 (solo si no está fusionada)
-                        limpiar_celda_segura(cell_fila10)
-                
-                # Fila 7: Comprimir (altura mínima) - Solo algunos valores específicos
-                # Columna 10: "Suma de Saldo riesgo total"
-                cell_suma = ws_x_coord.cell(row=7, column=10)
-                cell_suma.value = 'Suma de Saldo riesgo total'
-                cell_suma.font = Font(bold=True, size=9, color=color_texto_azul_fuerte)
-                cell_suma.fill = PatternFill(start_color=color_fondo_azul_claro, end_color=color_fondo_azul_claro, fill_type='solid')
-                cell_suma.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-                
-                # Columna 11: "PAR"
-                cell_par_fila7 = ws_x_coord.cell(row=7, column=11)
-                cell_par_fila7.value = 'PAR'
-                cell_par_fila7.font = Font(bold=True, size=9, color=color_texto_azul_fuerte)
-                cell_par_fila7.fill = PatternFill(start_color=color_fondo_azul_claro, end_color=color_fondo_azul_claro, fill_type='solid')
-                cell_par_fila7.alignment = Alignment(horizontal='center', vertical='center')
-                
-                # Fila 8: Comprimir (altura mínima) - Solo algunos valores específicos
-                # Columna 1: "Coordinación" (repetir)
-                cell_coord_fila8 = ws_x_coord.cell(row=8, column=1)
-                cell_coord_fila8.value = 'Coordinación'
-                cell_coord_fila8.font = Font(bold=True, size=9, color=color_texto_azul_fuerte)
-                cell_coord_fila8.fill = PatternFill(start_color=color_fondo_azul_claro, end_color=color_fondo_azul_claro, fill_type='solid')
-                cell_coord_fila8.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-                
-                # Columna 10: "Etiquetas de fila" (repetir)
-                cell_etiquetas = ws_x_coord.cell(row=8, column=10)
-                cell_etiquetas.value = 'Etiquetas de fila'
-                cell_etiquetas.font = Font(bold=True, size=9, color=color_texto_azul_fuerte)
-                cell_etiquetas.fill = PatternFill(start_color=color_fondo_azul_claro, end_color=color_fondo_azul_claro, fill_type='solid')
-                cell_etiquetas.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-                
-                # Columna 11: "PAR" (repetir)
-                cell_par_fila8 = ws_x_coord.cell(row=8, column=11)
-                cell_par_fila8.value = 'PAR'
-                cell_par_fila8.font = Font(bold=True, size=9, color=color_texto_azul_fuerte)
-                cell_par_fila8.fill = PatternFill(start_color=color_fondo_azul_claro, end_color=color_fondo_azul_claro, fill_type='solid')
-                cell_par_fila8.alignment = Alignment(horizontal='center', vertical='center')
-                
-                # Aplicar formato a datos (fila 11+)
-                # Formato de moneda a columnas numéricas
-                columnas_moneda = ['Cantidad Prestada', 'Saldo capital', 'Saldo vencido', 'Saldo total',
-                                  'Saldo riesgo capital', 'Saldo riesgo total'] + list(mapeo_rangos.values())
-                for col_name in columnas_moneda:
-                    if col_name in df_x_coordinacion_ordenado.columns:
-                        col_idx = df_x_coordinacion_ordenado.columns.get_loc(col_name) + 1
-                        for row in range(11, ws_x_coord.max_row + 1):
-                            cell = ws_x_coord.cell(row=row, column=col_idx)
-                            if cell.value is not None:
-                                cell.number_format = EXCEL_CONFIG['currency_format']
-                                cell.alignment = Alignment(horizontal='right', vertical='center')
-                                cell.border = Border(
-                                    left=Side(style='thin', color='000000'),
-                                    right=Side(style='thin', color='000000'),
-                                    top=Side(style='thin', color='000000'),
-                                    bottom=Side(style='thin', color='000000')
-                                )
-                
-                # Formato de porcentaje a % MORA - Solo encabezado en amarillo
-                color_amarillo = 'FFFF00'  # Amarillo
-                if '% MORA' in df_x_coordinacion_ordenado.columns:
-                    col_idx = df_x_coordinacion_ordenado.columns.get_loc('% MORA') + 1
-                    # Aplicar formato a encabezado en fila 6 (solo el encabezado en amarillo)
-                    cell_header = ws_x_coord.cell(row=6, column=col_idx)
-                    cell_header.fill = PatternFill(start_color=color_amarillo, end_color=color_amarillo, fill_type='solid')
-                    # Aplicar formato a datos (fila 11+) - SIN fondo amarillo, solo formato de porcentaje
-                    for row in range(11, ws_x_coord.max_row + 1):
-                        cell = ws_x_coord.cell(row=row, column=col_idx)
-                        if cell.value is not None:
-                            cell.number_format = '0.00%'
-                            cell.alignment = Alignment(horizontal='right', vertical='center')
-                            cell.border = Border(
-                                left=Side(style='thin', color='000000'),
-                                right=Side(style='thin', color='000000'),
-                                top=Side(style='thin', color='000000'),
-                                bottom=Side(style='thin', color='000000')
-                            )
-                
-                # Formato a columna Coordinación
-                if 'Coordinación' in df_x_coordinacion_ordenado.columns:
-                    col_idx = df_x_coordinacion_ordenado.columns.get_loc('Coordinación') + 1
-                    for row in range(10, ws_x_coord.max_row + 1):
-                        cell = ws_x_coord.cell(row=row, column=col_idx)
-                        cell.alignment = Alignment(horizontal='left', vertical='center')
-                        cell.border = Border(
-                            left=Side(style='thin', color='000000'),
-                            right=Side(style='thin', color='000000'),
-                            top=Side(style='thin', color='000000'),
-                            bottom=Side(style='thin', color='000000')
-                        )
-                        # Resaltar fila de Total con azul claro (mismo que encabezados)
-                        if cell.value == 'Total':
-                            for col in range(1, ws_x_coord.max_column + 1):
-                                total_cell = ws_x_coord.cell(row=row, column=col)
-                                total_cell.fill = PatternFill(start_color=color_fondo_azul_claro, end_color=color_fondo_azul_claro, fill_type='solid')
-                                total_cell.font = Font(bold=True, color=color_texto_azul_fuerte)
-                                total_cell.border = Border(
-                                    left=Side(style='thin', color='000000'),
-                                    right=Side(style='thin', color='000000'),
-                                    top=Side(style='thin', color='000000'),
-                                    bottom=Side(style='thin', color='000000')
-                                )
-                
-                # Ajustar ancho de columnas
-                for col_idx in range(1, ws_x_coord.max_column + 1):
-                    column_letter = get_column_letter(col_idx)
-                    if col_idx != 9:  # Todas las columnas excepto I
-                        max_length = 0
-                        for row in range(1, ws_x_coord.max_row + 1):
-                            cell = ws_x_coord.cell(row=row, column=col_idx)
-                            if cell.value:
-                                max_length = max(max_length, len(str(cell.value)))
-                        ws_x_coord.column_dimensions[column_letter].width = min(max_length + 2, 20)
-                
-                # Columna I (9): Completamente oculta (ancho 0 y hidden) - Hacerlo al final
-                column_letter_i = get_column_letter(9)
-                ws_x_coord.column_dimensions[column_letter_i].width = 0.0  # 0.00 de ancho
-                ws_x_coord.column_dimensions[column_letter_i].hidden = True  # Ocultar completamente
-                # Limpiar todas las celdas de la columna I
-                for row in range(1, ws_x_coord.max_row + 1):
-                    cell = ws_x_coord.cell(row=row, column=9)
-                    limpiar_celda_segura(cell)
-                
-                # Ajustar altura de filas - Fila 6 visible y larga, filas 7-10 con altura 0 (completamente invisibles)
-                ws_x_coord.row_dimensions[6].height = 30  # Fila 6: Visible y larga (encabezados)
-                ws_x_coord.row_dimensions[7].height = 0.0   # Fila 7: Altura 0.0 (completamente invisible)
-                ws_x_coord.row_dimensions[8].height = 0.0   # Fila 8: Altura 0.0 (completamente invisible)
-                ws_x_coord.row_dimensions[9].height = 0.0   # Fila 9: Altura 0.0 (completamente invisible)
-                ws_x_coord.row_dimensions[10].height = 0.0   # Fila 10: Altura 0.0 (completamente invisible)
-                
-                # Ocultar filas 7, 8, 9 y 10 completamente (método adicional)
-                ws_x_coord.row_dimensions[7].hidden = True
-                ws_x_coord.row_dimensions[8].hidden = True
-                ws_x_coord.row_dimensions[9].hidden = True
-                ws_x_coord.row_dimensions[10].hidden = True
-                
-                # Determinar límites reales de la tabla
-                # Última columna con datos: buscar en todas las filas de datos (11+)
-                ultima_col_con_datos = 0
-                ultima_fila_con_datos = 0
-                for row in range(11, ws_x_coord.max_row + 1):
-                    for col in range(1, ws_x_coord.max_column + 1):
-                        cell = ws_x_coord.cell(row=row, column=col)
-                        if cell.value is not None and str(cell.value).strip() != '':
-                            ultima_col_con_datos = max(ultima_col_con_datos, col)
-                            ultima_fila_con_datos = max(ultima_fila_con_datos, row)
-                
-                # Si no encontramos datos, usar la última columna del segundo segmento (S = 19)
-                if ultima_col_con_datos == 0:
-                    ultima_col_con_datos = 19  # Columna S
-                
-                logger.info(f"📊 Límites de tabla: Última columna={ultima_col_con_datos}, Última fila={ultima_fila_con_datos}")
-                
-                # Limpiar filas 1-4 (fuera del área) - completamente blancas sin bordes
-                for row in range(1, 5):
-                    for col in range(1, ws_x_coord.max_column + 1):
-                        cell = ws_x_coord.cell(row=row, column=col)
-                        limpiar_celda_segura(cell)
-                
-                # Limpiar fila 5 excepto la celda PAR (J5:O5)
-                for col in range(1, ws_x_coord.max_column + 1):
-                    # Si no es parte de PAR (J5:O5), limpiar
-                    if not (col >= 10 and col <= 15):  # J=10, O=15
-                        cell = ws_x_coord.cell(row=5, column=col)
-                        limpiar_celda_segura(cell)
-                
-                # Limpiar columnas a la DERECHA de la tabla (después de la última columna con datos)
-                for row in range(1, ws_x_coord.max_row + 1):
-                    for col in range(ultima_col_con_datos + 1, ws_x_coord.max_column + 1):
-                        cell = ws_x_coord.cell(row=row, column=col)
-                        limpiar_celda_segura(cell)
-                
-                # Limpiar filas ABAJO de la tabla (después de la última fila con datos)
-                if ultima_fila_con_datos > 0:
-                    for row in range(ultima_fila_con_datos + 1, ws_x_coord.max_row + 1):
-                        for col in range(1, ws_x_coord.max_column + 1):
-                            cell = ws_x_coord.cell(row=row, column=col)
-                            limpiar_celda_segura(cell)
-                
-                # Limpiar celdas vacías en las filas de datos (después de la última columna con datos)
-                for row in range(11, ultima_fila_con_datos + 1 if ultima_fila_con_datos > 0 else ws_x_coord.max_row + 1):
-                    for col in range(ultima_col_con_datos + 1, ws_x_coord.max_column + 1):
-                        cell = ws_x_coord.cell(row=row, column=col)
-                        limpiar_celda_segura(cell)
-                
-                # Limpiar también las celdas fuera del rango de datos en la fila 6 (encabezados)
-                # Área principal: A-H (1-8) y J-S (10-19)
-                for col in range(1, ws_x_coord.max_column + 1):
-                    if col != 9:  # No tocar columna I (ya está oculta)
-                        cell = ws_x_coord.cell(row=6, column=col)
-                        # Si no está en el rango A-H o J-S, limpiar
-                        if not ((col >= 1 and col <= 8) or (col >= 10 and col <= 19)):
-                            limpiar_celda_segura(cell)
-                
-                # LIMPIEZA FINAL: Asegurar que TODAS las celdas fuera del área estén blancas sin bordes
-                # Esto se hace al final para evitar que otros formatos sobrescriban
-                # Área principal: filas 5-6 (encabezados) y filas 11 hasta ultima_fila_con_datos (datos)
-                # Columnas: A-H (1-8) y J hasta ultima_col_con_datos (10+)
-                
-                # Limpiar TODAS las celdas fuera del área principal (hacerlo al final)
-                for row in range(1, ws_x_coord.max_row + 1):
-                    for col in range(1, ws_x_coord.max_column + 1):
-                        # Determinar si la celda está dentro del área principal
-                        en_area_principal = False
-                        
-                        # Fila 5: Solo PAR (J5:O5) está en el área
-                        if row == 5:
-                            if col >= 10 and col <= 15:  # J-O
-                                en_area_principal = True
-                        
-                        # Fila 6: Columnas A-H y J-S están en el área
-                        elif row == 6:
-                            if (col >= 1 and col <= 8) or (col >= 10 and col <= 19):  # A-H o J-S
-                                en_area_principal = True
-                        
-                        # Filas 11+: Columnas A-H y J hasta ultima_col_con_datos están en el área
-                        elif row >= 11 and row <= ultima_fila_con_datos:
-                            if (col >= 1 and col <= 8) or (col >= 10 and col <= ultima_col_con_datos):
-                                en_area_principal = True
-                        
-                        # Si NO está en el área principal, limpiar completamente
-                        if not en_area_principal:
-                            cell = ws_x_coord.cell(row=row, column=col)
-                            if limpiar_celda_segura(cell):
-                                try:
-                                    cell.font = Font()  # Resetear fuente
-                                    cell.alignment = Alignment()  # Resetear alineación
-                                except:
-                                    pass
-                
-                logger.info("✅ Hoja 'X_Coordinación' creada exitosamente como PRIMERA HOJA")
-            else:
-                logger.warning("⚠️ No se pudo crear la hoja 'X_Coordinación' (DataFrame vacío)")
-                logger.warning(f"🔍 Columnas disponibles en df_completo: {list(df_completo.columns)[:20]}...")
-                logger.warning(f"🔍 Total columnas en df_completo: {len(df_completo.columns)}")
+                else:
+                    # Solo se atrapan los errores de la agregación; los de escritura de la hoja se propagan
+                    # Reorganizar columnas del DataFrame para que coincidan con la estructura
+                    columnas_principales = [
+                        'Coordinación', 'Cantidad Prestada', 'Saldo capital', 'Saldo vencido',
+                        'Saldo total', 'Saldo riesgo capital', 'Saldo riesgo total', '% MORA'
+                    ]
+                    
+                    # Verificar que las columnas existan y reordenar
+                    columnas_disponibles = [col for col in columnas_principales if col in df_x_coordinacion.columns]
+                    columnas_adicionales = [col for col in df_x_coordinacion.columns if col not in columnas_principales]
+                    
+                    # Reordenar DataFrame
+                    df_x_coordinacion_ordenado = df_x_coordinacion[columnas_disponibles + columnas_adicionales]
+                    
+                    # Renombrar columnas de rangos para que coincidan
+                    mapeo_rangos = {
+                        'Rango_0': '0',
+                        'Rango_1-7': '1-7 días',
+                        'Rango_8-15': '8-15 días',
+                        'Rango_16-30': '16-30 días',
+                        'Rango_31-60': '31-60 días',
+                        'Rango_61-90': '61-90 días',
+                        'Rango_Mayor_90': 'Mayor_90'
+                    }
+                    
+                    # Renombrar columnas de rangos (rename ignora las que no existan)
+                    df_x_coordinacion_ordenado = df_x_coordinacion_ordenado.rename(columns=mapeo_rangos)
+                    
+                    logger.info("🔍 Escribiendo hoja X_Coordinación con %s filas", len(df_x_coordinacion_ordenado))
+                    
+                    # Escribir los datos desde la fila 11 (después de encabezados en fila 6, filas 7-8 comprimidas y 9-10 ocultas)
+                    ws_x_coord = escribir_resumen_en_hoja(writer.book, 'X_Coordinación', df_x_coordinacion_ordenado)
+                    registrar_estilos_resumen(writer.book)
+                    
+                    logger.info("✅ Hoja X_Coordinación creada en Excel. Filas: %s, Columnas: %s", 10 + len(df_x_coordinacion_ordenado), len(df_x_coordinacion_ordenado.columns))
+                    
+                    # Escribir estructura completa (filas 1-7) según formato objetivo
+                    # Filas 1-4: Vacías (no hacer nada)
+                    
+                    # Fila 5: "PAR" centrado desde J5 hasta O5 con fondo azul
+                    ws_x_coord.merge_cells('J5:O5')
+                    cell_par = ws_x_coord.cell(row=5, column=10)  # Columna J (10)
+                    cell_par.value = 'PAR'
+                    cell_par.font = FUENTE_ENCABEZADO
+                    cell_par.fill = RELLENO_AZUL_CLARO
+                    cell_par.alignment = ALINEACION_CENTRO
+                    cell_par.border = BORDE_DELGADO
+                    
+                    # Fila 6: Encabezados de AMBAS tablas
+                    # TABLA 1: Columnas A-H (1-8) - Encabezados principales
+                    encabezados_tabla1 = [
+                        'Coordinación', 'Cantidad\nPrestada', 'Saldo\nCapital', 'Saldo\nVencido',
+                        'Saldo\nTotal', 'Saldo\nRiesgo Capital', 'Saldo\nRiesgo Total', '% MORA'
+                    ]
+                    for col_idx, encabezado in enumerate(encabezados_tabla1, start=1):
+                        ws_x_coord.cell(row=6, column=col_idx, value=encabezado).style = ESTILO_ENCABEZADO_RESUMEN
+                    
+                    # Columna I (9): Vacía - separador entre tablas (no hacer nada)
+                    
+                    # TABLA 2: Columnas J-S (10-19) - Encabezados tomados directamente de las columnas del DataFrame
+                    for col_idx, encabezado in enumerate(df_x_coordinacion_ordenado.columns[9:], start=10):
+                        ws_x_coord.cell(row=6, column=col_idx, value=encabezado).style = ESTILO_ENCABEZADO_RESUMEN
+                    
+                    # Fila 7: Comprimir (altura mínima) - Solo algunos valores específicos
+                    # Columna 10: "Suma de Saldo riesgo total"
+                    cell_suma = ws_x_coord.cell(row=7, column=10)
+                    cell_suma.value = 'Suma de Saldo riesgo total'
+                    cell_suma.font = FUENTE_ENCABEZADO_COMPACTO
+                    cell_suma.fill = RELLENO_AZUL_CLARO
+                    cell_suma.alignment = ALINEACION_CENTRO_AJUSTE
+                    
+                    # Columna 11: "PAR"
+                    cell_par_fila7 = ws_x_coord.cell(row=7, column=11)
+                    cell_par_fila7.value = 'PAR'
+                    cell_par_fila7.font = FUENTE_ENCABEZADO_COMPACTO
+                    cell_par_fila7.fill = RELLENO_AZUL_CLARO
+                    cell_par_fila7.alignment = ALINEACION_CENTRO
+                    
+                    # Fila 8: Comprimir (altura mínima) - Solo algunos valores específicos
+                    # Columna 1: "Coordinación" (repetir)
+                    cell_coord_fila8 = ws_x_coord.cell(row=8, column=1)
+                    cell_coord_fila8.value = 'Coordinación'
+                    cell_coord_fila8.font = FUENTE_ENCABEZADO_COMPACTO
+                    cell_coord_fila8.fill = RELLENO_AZUL_CLARO
+                    cell_coord_fila8.alignment = ALINEACION_CENTRO_AJUSTE
+                    
+                    # Columna 10: "Etiquetas de fila" (repetir)
+                    cell_etiquetas = ws_x_coord.cell(row=8, column=10)
+                    cell_etiquetas.value = 'Etiquetas de fila'
+                    cell_etiquetas.font = FUENTE_ENCABEZADO_COMPACTO
+                    cell_etiquetas.fill = RELLENO_AZUL_CLARO
+                    cell_etiquetas.alignment = ALINEACION_CENTRO_AJUSTE
+                    
+                    # Columna 11: "PAR" (repetir)
+                    cell_par_fila8 = ws_x_coord.cell(row=8, column=11)
+                    cell_par_fila8.value = 'PAR'
+                    cell_par_fila8.font = FUENTE_ENCABEZADO_COMPACTO
+                    cell_par_fila8.fill = RELLENO_AZUL_CLARO
+                    cell_par_fila8.alignment = ALINEACION_CENTRO
+                    
+                    # Aplicar formato a datos (fila 11+)
+                    # Posición en Excel (1-indexada) de cada columna del resumen, calculada una sola vez
+                    posicion_columna = {col: i for i, col in enumerate(df_x_coordinacion_ordenado.columns, start=1)}
+                    # Dimensiones de la hoja (max_row / max_column recorren todas las celdas en cada lectura): las filas
+                    # se conocen por el DataFrame (datos desde la fila 11) y la columna máxima se lee una sola vez
+                    max_fila, max_columna = 10 + len(df_x_coordinacion_ordenado), ws_x_coord.max_column
+                    # Formato de moneda a columnas numéricas
+                    columnas_moneda = ['Cantidad Prestada', 'Saldo capital', 'Saldo vencido', 'Saldo total',
+                                      'Saldo riesgo capital', 'Saldo riesgo total'] + list(mapeo_rangos.values())
+                    
+                    # Formato de porcentaje a % MORA - Solo encabezado en amarillo (fila 6)
+                    if '% MORA' in posicion_columna:
+                        ws_x_coord.cell(row=6, column=posicion_columna['% MORA']).fill = RELLENO_AMARILLO
+                    
+                    # Moneda, % MORA (SIN fondo amarillo) y columna Coordinación en un solo recorrido por fila
+                    aplicar_formato_datos_resumen(ws_x_coord, posicion_columna, columnas_moneda, ['Coordinación'], max_fila)
+                    
+                    if 'Coordinación' in posicion_columna:
+                        # Resaltar fila de Total con azul claro (mismo que encabezados); la fila se ubica
+                        # desde el DataFrame: los datos empiezan en la fila 11
+                        es_total = df_x_coordinacion_ordenado['Coordinación'].to_numpy() == 'Total'
+                        resaltar_filas_total(ws_x_coord, es_total, max_columna)
+                    
+                    # Ajustar ancho de columnas (calculado desde el DataFrame, sin recorrer las filas de datos)
+                    for col_idx, ancho in enumerate(calcular_anchos_hoja_resumen(ws_x_coord, df_x_coordinacion_ordenado), start=1):
+                        if col_idx != 9:  # Todas las columnas excepto I
+                            ws_x_coord.column_dimensions[get_column_letter(col_idx)].width = ancho
+                    
+                    # Columna I (9): Completamente oculta (ancho 0 y hidden) - Hacerlo al final
+                    column_letter_i = get_column_letter(9)
+                    ws_x_coord.column_dimensions[column_letter_i].width = 0.0  # 0.00 de ancho
+                    ws_x_coord.column_dimensions[column_letter_i].hidden = True  # Ocultar completamente
+                    # Las celdas de la columna I quedan fuera del área principal: las limpia la limpieza final
+                    
+                    # Ajustar altura de filas - Fila 6 visible y larga, filas 7-10 con altura 0 (completamente invisibles)
+                    ws_x_coord.row_dimensions[6].height = 30  # Fila 6: Visible y larga (encabezados)
+                    ws_x_coord.row_dimensions[7].height = 0.0   # Fila 7: Altura 0.0 (completamente invisible)
+                    ws_x_coord.row_dimensions[8].height = 0.0   # Fila 8: Altura 0.0 (completamente invisible)
+                    ws_x_coord.row_dimensions[9].height = 0.0   # Fila 9: Altura 0.0 (completamente invisible)
+                    ws_x_coord.row_dimensions[10].height = 0.0   # Fila 10: Altura 0.0 (completamente invisible)
+                    
+                    # Ocultar filas 7, 8, 9 y 10 completamente (método adicional)
+                    ws_x_coord.row_dimensions[7].hidden = True
+                    ws_x_coord.row_dimensions[8].hidden = True
+                    ws_x_coord.row_dimensions[9].hidden = True
+                    ws_x_coord.row_dimensions[10].hidden = True
+                    
+                    # Determinar límites reales de la tabla a partir del DataFrame escrito
+                    # (datos desde la fila 11, columnas desde A)
+                    ultima_col_con_datos = len(df_x_coordinacion_ordenado.columns)
+                    ultima_fila_con_datos = 10 + len(df_x_coordinacion_ordenado)
+                    
+                    logger.info("📊 Límites de tabla: Última columna=%s, Última fila=%s", ultima_col_con_datos, ultima_fila_con_datos)
+                    
+                    # LIMPIEZA FINAL: Asegurar que TODAS las celdas fuera del área estén blancas sin bordes
+                    # Esto se hace al final para evitar que otros formatos sobrescriban
+                    # Área principal: filas 5-6 (encabezados) y filas 11 hasta ultima_fila_con_datos (datos)
+                    # Columnas: A-H (1-8) y J hasta ultima_col_con_datos (10+)
+                    
+                    # Columnas del área principal por fila; el resto de filas queda fuera del área
+                    area_datos = set(range(1, 9)) | set(range(10, ultima_col_con_datos + 1))
+                    area_cols_por_fila = {
+                        5: set(range(10, 16)),  # Fila 5: Solo PAR (J5:O5)
+                        6: set(range(1, 9)) | set(range(10, 20)),  # Fila 6: A-H y J-S
+                    }
+                    # Filas 11+: Columnas A-H y J hasta ultima_col_con_datos
+                    area_cols_por_fila.update(dict.fromkeys(range(11, ultima_fila_con_datos + 1), area_datos))
+                    
+                    # Limpiar TODAS las celdas fuera del área principal (hacerlo al final)
+                    limpiar_fuera_de_area(ws_x_coord, area_cols_por_fila, max_fila, max_columna)
+                    
+                    logger.info("✅ Hoja 'X_Coordinación' creada exitosamente como PRIMERA HOJA")
             
             # --- PASO 6.1: Crear hoja "X_Recuperador" SEGUNDA (solo sin plantilla) ---
-            if crear_hojas_resumen:
+            if not crear_hojas_resumen:
+                logger.info("📋 Usando plantilla - X_Recuperador ya existe con tabla dinámica")
+            else:
                 logger.info("Creando hoja 'X_Recuperador' (SEGUNDA HOJA)...")
                 try:
-                    df_x_recuperador = crear_hoja_x_recuperador(df_completo)
-                    logger.info(f"🔍 DataFrame X_Recuperador creado: {len(df_x_recuperador)} filas, {len(df_x_recuperador.columns)} columnas")
-                    logger.info(f"🔍 Columnas en df_x_recuperador: {list(df_x_recuperador.columns)}")
+                    df_x_recuperador = crear_hoja_x_recuperador(df_completo, riesgo_y_mora_base)
+                    logger.info("🔍 DataFrame X_Recuperador creado: %s filas, %s columnas", len(df_x_recuperador), len(df_x_recuperador.columns))
+                    logger.debug("🔍 Columnas en df_x_recuperador: %s", list(df_x_recuperador.columns))
+                except SinDatosError as e:
+                    logger.warning("⚠️ No se pudo crear la hoja 'X_Recuperador': %s", e)
                 except Exception as e:
-                    logger.error(f"❌ Error creando hoja X_Recuperador: {str(e)}")
-                    import traceback
+                    logger.error("❌ Error creando hoja X_Recuperador: %s", str(e))
                     logger.error(traceback.format_exc())
-                    df_x_recuperador = pd.DataFrame()
-            else:
-                df_x_recuperador = pd.DataFrame()  # Vacío para saltar el bloque siguiente
-                logger.info("📋 Usando plantilla - X_Recuperador ya existe con tabla dinámica")
-            
-            if not df_x_recuperador.empty:
-                # Reorganizar columnas del DataFrame para que coincidan con la estructura
-                # X_Recuperador tiene: Coordinación, Código recuperador, Nombre recuperador, luego las métricas
-                columnas_principales = [
-                    'Coordinación', 'Código recuperador', 'Nombre recuperador',
-                    'Cantidad Prestada', 'Saldo capital', 'Saldo vencido',
-                    'Saldo total', 'Saldo riesgo capital', 'Saldo riesgo total', '% MORA'
-                ]
-                
-                # Verificar que las columnas existan y reordenar
-                columnas_disponibles = [col for col in columnas_principales if col in df_x_recuperador.columns]
-                columnas_adicionales = [col for col in df_x_recuperador.columns if col not in columnas_principales]
-                
-                # Reordenar DataFrame
-                df_x_recuperador_ordenado = df_x_recuperador[columnas_disponibles + columnas_adicionales].copy()
-                
-                # Renombrar columnas de rangos para que coincidan
-                mapeo_rangos = {
-                    'Rango_0': '0',
-                    'Rango_1-7': '1-7 días',
-                    'Rango_8-15': '8-15 días',
-                    'Rango_16-30': '16-30 días',
-                    'Rango_31-60': '31-60 días',
-                    'Rango_61-90': '61-90 días',
-                    'Rango_Mayor_90': 'Mayor_90'
-                }
-                
-                # Renombrar columnas de rangos
-                for col_antigua, col_nueva in mapeo_rangos.items():
-                    if col_antigua in df_x_recuperador_ordenado.columns:
-                        df_x_recuperador_ordenado = df_x_recuperador_ordenado.rename(columns={col_antigua: col_nueva})
-                
-                logger.info(f"🔍 Escribiendo hoja X_Recuperador con {len(df_x_recuperador_ordenado)} filas")
-                
-                # Escribir DataFrame empezando en fila 9 (después de encabezados en fila 6 y filas 7-8 comprimidas)
-                df_x_recuperador_ordenado.to_excel(writer, sheet_name='X_Recuperador', index=False, startrow=9)
-                ws_x_recup = writer.sheets['X_Recuperador']
-                
-                logger.info(f"✅ Hoja X_Recuperador creada en Excel. Filas: {ws_x_recup.max_row}, Columnas: {ws_x_recup.max_column}")
-                
-                # Aplicar el mismo formato que X_Coordinación (reutilizar código)
-                # Color azul para encabezados
-                color_fondo_azul_claro = 'D9E1F2'
-                color_texto_azul_fuerte = '002060'
-                
-                # Fila 5: "PAR" centrado desde J5 hasta O5 con fondo azul
-                ws_x_recup.merge_cells('J5:O5')
-                cell_par = ws_x_recup.cell(row=5, column=10)
-                cell_par.value = 'PAR'
-                cell_par.font = Font(bold=True, size=11, color=color_texto_azul_fuerte)
-                cell_par.fill = PatternFill(start_color=color_fondo_azul_claro, end_color=color_fondo_azul_claro, fill_type='solid')
-                cell_par.alignment = Alignment(horizontal='center', vertical='center')
-                cell_par.border = Border(
-                    left=Side(style='thin', color='000000'),
-                    right=Side(style='thin', color='000000'),
-                    top=Side(style='thin', color='000000'),
-                    bottom=Side(style='thin', color='000000')
-                )
-                
-                # Fila 6: Encabezados de AMBAS tablas
-                # TABLA 1: Columnas A-J (1-10) - Coordinación, Código recuperador, Nombre recuperador, y métricas
-                encabezados_tabla1 = [
-                    'Coordinación', 'Código\nrecuperador', 'Nombre\nrecuperador',
-                    'Cantidad\nPrestada', 'Saldo\nCapital', 'Saldo\nVencido',
-                    'Saldo\nTotal', 'Saldo\nRiesgo Capital', 'Saldo\nRiesgo Total', '% MORA'
-                ]
-                for col_idx, encabezado in enumerate(encabezados_tabla1, start=1):
-                    cell = ws_x_recup.cell(row=6, column=col_idx)
-                    cell.value = encabezado
-                    cell.font = Font(bold=True, size=11, color=color_texto_azul_fuerte)
-                    cell.fill = PatternFill(start_color=color_fondo_azul_claro, end_color=color_fondo_azul_claro, fill_type='solid')
-                    cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-                    cell.border = Border(
-                        left=Side(style='thin', color='000000'),
-                        right=Side(style='thin', color='000000'),
-                        top=Side(style='thin', color='000000'),
-                        bottom=Side(style='thin', color='000000')
-                    )
-                
-                # Columna K (11): Vacía - separador entre tablas
-                
-                # TABLA 2: Columnas L-U (12-21) - Copiar encabezados de la fila 10 (donde pandas los escribió) a la fila 6
-                for col_idx in range(1, ws_x_recup.max_column + 1):
-                    cell_fila10 = ws_x_recup.cell(row=10, column=col_idx)
-                    if cell_fila10.value is not None:
-                        # Si es del segundo segmento (columna 12 en adelante), copiar a la fila 6
-                        if col_idx >= 12:
-                            cell_fila6 = ws_x_recup.cell(row=6, column=col_idx)
-                            cell_fila6.value = cell_fila10.value
-                            cell_fila6.font = Font(bold=True, size=11, color=color_texto_azul_fuerte)
-                            cell_fila6.fill = PatternFill(start_color=color_fondo_azul_claro, end_color=color_fondo_azul_claro, fill_type='solid')
-                            cell_fila6.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-                            cell_fila6.border = Border(
-                                left=Side(style='thin', color='000000'),
-                                right=Side(style='thin', color='000000'),
-                                top=Side(style='thin', color='000000'),
-                                bottom=Side(style='thin', color='000000')
-                            )
-                        # Limpiar la celda de la fila 10 (solo si no está fusionada)
-                        # Limpiar la celda de la fila 10 (solo si no está fusionada)
-                        limpiar_celda_segura(cell_fila10)
-                
-                # Aplicar formato a datos (fila 11+)
-                # Formato de moneda a columnas numéricas
-                mapeo_rangos_recup = {
-                    '0': '0',
-                    '1-7 días': '1-7 días',
-                    '8-15 días': '8-15 días',
-                    '16-30 días': '16-30 días',
-                    '31-60 días': '31-60 días',
-                    '61-90 días': '61-90 días',
-                    'Mayor_90': 'Mayor_90'
-                }
-                columnas_moneda = ['Cantidad Prestada', 'Saldo capital', 'Saldo vencido', 'Saldo total',
-                                  'Saldo riesgo capital', 'Saldo riesgo total'] + list(mapeo_rangos_recup.values())
-                for col_name in columnas_moneda:
-                    if col_name in df_x_recuperador_ordenado.columns:
-                        col_idx = df_x_recuperador_ordenado.columns.get_loc(col_name) + 1
-                        for row in range(11, ws_x_recup.max_row + 1):
-                            cell = ws_x_recup.cell(row=row, column=col_idx)
-                            if cell.value is not None:
-                                cell.number_format = EXCEL_CONFIG['currency_format']
-                                cell.alignment = Alignment(horizontal='right', vertical='center')
-                                cell.border = Border(
-                                    left=Side(style='thin', color='000000'),
-                                    right=Side(style='thin', color='000000'),
-                                    top=Side(style='thin', color='000000'),
-                                    bottom=Side(style='thin', color='000000')
-                                )
-                
-                # Formato de porcentaje a % MORA - Solo encabezado en amarillo
-                color_amarillo = 'FFFF00'
-                if '% MORA' in df_x_recuperador_ordenado.columns:
-                    col_idx = df_x_recuperador_ordenado.columns.get_loc('% MORA') + 1
-                    cell_header = ws_x_recup.cell(row=6, column=col_idx)
-                    cell_header.fill = PatternFill(start_color=color_amarillo, end_color=color_amarillo, fill_type='solid')
-                    for row in range(11, ws_x_recup.max_row + 1):
-                        cell = ws_x_recup.cell(row=row, column=col_idx)
-                        if cell.value is not None:
-                            cell.number_format = '0.00%'
-                            cell.alignment = Alignment(horizontal='right', vertical='center')
-                            cell.border = Border(
-                                left=Side(style='thin', color='000000'),
-                                right=Side(style='thin', color='000000'),
-                                top=Side(style='thin', color='000000'),
-                                bottom=Side(style='thin', color='000000')
-                            )
-                
-                # Formato a columnas de texto (Coordinación, Código recuperador, Nombre recuperador)
-                for col_name in ['Coordinación', 'Código recuperador', 'Nombre recuperador']:
-                    if col_name in df_x_recuperador_ordenado.columns:
-                        col_idx = df_x_recuperador_ordenado.columns.get_loc(col_name) + 1
-                        for row in range(11, ws_x_recup.max_row + 1):
-                            cell = ws_x_recup.cell(row=row, column=col_idx)
-                            cell.alignment = Alignment(horizontal='left', vertical='center')
-                            cell.border = Border(
-                                left=Side(style='thin', color='000000'),
-                                right=Side(style='thin', color='000000'),
-                                top=Side(style='thin', color='000000'),
-                                bottom=Side(style='thin', color='000000')
-                            )
-                            # Resaltar fila de Total con azul claro
-                            if cell.value == 'Total':
-                                for col in range(1, ws_x_recup.max_column + 1):
-                                    total_cell = ws_x_recup.cell(row=row, column=col)
-                                    total_cell.fill = PatternFill(start_color=color_fondo_azul_claro, end_color=color_fondo_azul_claro, fill_type='solid')
-                                    total_cell.font = Font(bold=True, color=color_texto_azul_fuerte)
-                                    total_cell.border = Border(
-                                        left=Side(style='thin', color='000000'),
-                                        right=Side(style='thin', color='000000'),
-                                        top=Side(style='thin', color='000000'),
-                                        bottom=Side(style='thin', color='000000')
-                                    )
-                
-                # Ajustar ancho de columnas
-                for col_idx in range(1, ws_x_recup.max_column + 1):
-                    column_letter = get_column_letter(col_idx)
-                    if col_idx != 11:  # Columna K (11) será comprimida
-                        max_length = 0
-                        for row in range(1, ws_x_recup.max_row + 1):
-                            cell = ws_x_recup.cell(row=row, column=col_idx)
-                            if cell.value:
-                                max_length = max(max_length, len(str(cell.value)))
-                        ws_x_recup.column_dimensions[column_letter].width = min(max_length + 2, 20)
-                
-                # Columna K (11): Completamente oculta (ancho 0 y hidden)
-                column_letter_k = get_column_letter(11)
-                ws_x_recup.column_dimensions[column_letter_k].width = 0.0
-                ws_x_recup.column_dimensions[column_letter_k].hidden = True
-                for row in range(1, ws_x_recup.max_row + 1):
-                    cell = ws_x_recup.cell(row=row, column=11)
-                    limpiar_celda_segura(cell)
-                
-                # Ajustar altura de filas - Fila 6 visible y larga, filas 7-10 con altura 0 (completamente invisibles)
-                ws_x_recup.row_dimensions[6].height = 30
-                ws_x_recup.row_dimensions[7].height = 0.0
-                ws_x_recup.row_dimensions[8].height = 0.0
-                ws_x_recup.row_dimensions[9].height = 0.0
-                ws_x_recup.row_dimensions[10].height = 0.0
-                
-                # Ocultar filas 7, 8, 9 y 10 completamente
-                ws_x_recup.row_dimensions[7].hidden = True
-                ws_x_recup.row_dimensions[8].hidden = True
-                ws_x_recup.row_dimensions[9].hidden = True
-                ws_x_recup.row_dimensions[10].hidden = True
-                
-                # Determinar límites reales de la tabla
-                ultima_col_con_datos = 0
-                ultima_fila_con_datos = 0
-                for row in range(11, ws_x_recup.max_row + 1):
-                    for col in range(1, ws_x_recup.max_column + 1):
-                        cell = ws_x_recup.cell(row=row, column=col)
-                        if cell.value is not None and str(cell.value).strip() != '':
-                            ultima_col_con_datos = max(ultima_col_con_datos, col)
-                            ultima_fila_con_datos = max(ultima_fila_con_datos, row)
-                
-                if ultima_col_con_datos == 0:
-                    ultima_col_con_datos = 21  # Columna U
-                
-                # Limpiar celdas fuera del área principal (igual que X_Coordinación)
-                for row in range(1, ws_x_recup.max_row + 1):
-                    for col in range(1, ws_x_recup.max_column + 1):
-                        en_area_principal = False
-                        
-                        if row == 5:
-                            if col >= 10 and col <= 15:  # J-O
-                                en_area_principal = True
-                        elif row == 6:
-                            if (col >= 1 and col <= 10) or (col >= 12 and col <= 21):  # A-J o L-U
-                                en_area_principal = True
-                        elif row >= 11 and row <= ultima_fila_con_datos:
-                            if (col >= 1 and col <= 10) or (col >= 12 and col <= ultima_col_con_datos):
-                                en_area_principal = True
-                        
-                        if not en_area_principal:
-                            cell = ws_x_recup.cell(row=row, column=col)
-                            if limpiar_celda_segura(cell):
-                                try:
-                                    cell.font = Font()
-                                    cell.alignment = Alignment()
-                                except:
-                                    pass
-                
-                logger.info("✅ Hoja 'X_Recuperador' creada exitosamente como SEGUNDA HOJA")
-            else:
-                logger.warning("⚠️ No se pudo crear la hoja 'X_Recuperador' (DataFrame vacío)")
+                else:
+                    # Solo se atrapan los errores de la agregación; los de escritura de la hoja se propagan
+                    # Reorganizar columnas del DataFrame para que coincidan con la estructura
+                    # X_Recuperador tiene: Coordinación, Código recuperador, Nombre recuperador, luego las métricas
+                    columnas_principales = [
+                        'Coordinación', 'Código recuperador', 'Nombre recuperador',
+                        'Cantidad Prestada', 'Saldo capital', 'Saldo vencido',
+                        'Saldo total', 'Saldo riesgo capital', 'Saldo riesgo total', '% MORA'
+                    ]
+                    
+                    # Verificar que las columnas existan y reordenar
+                    columnas_disponibles = [col for col in columnas_principales if col in df_x_recuperador.columns]
+                    columnas_adicionales = [col for col in df_x_recuperador.columns if col not in columnas_principales]
+                    
+                    # Reordenar DataFrame
+                    df_x_recuperador_ordenado = df_x_recuperador[columnas_disponibles + columnas_adicionales]
+                    
+                    # Renombrar columnas de rangos para que coincidan
+                    mapeo_rangos = {
+                        'Rango_0': '0',
+                        'Rango_1-7': '1-7 días',
+                        'Rango_8-15': '8-15 días',
+                        'Rango_16-30': '16-30 días',
+                        'Rango_31-60': '31-60 días',
+                        'Rango_61-90': '61-90 días',
+                        'Rango_Mayor_90': 'Mayor_90'
+                    }
+                    
+                    # Renombrar columnas de rangos (rename ignora las que no existan)
+                    df_x_recuperador_ordenado = df_x_recuperador_ordenado.rename(columns=mapeo_rangos)
+                    
+                    logger.info("🔍 Escribiendo hoja X_Recuperador con %s filas", len(df_x_recuperador_ordenado))
+                    
+                    # Escribir los datos desde la fila 11 (después de encabezados en fila 6, filas 7-8 comprimidas y 9-10 ocultas)
+                    ws_x_recup = escribir_resumen_en_hoja(writer.book, 'X_Recuperador', df_x_recuperador_ordenado)
+                    registrar_estilos_resumen(writer.book)
+                    
+                    logger.info("✅ Hoja X_Recuperador creada en Excel. Filas: %s, Columnas: %s", 10 + len(df_x_recuperador_ordenado), len(df_x_recuperador_ordenado.columns))
+                    
+                    # Aplicar el mismo formato que X_Coordinación (estilos compartidos de nivel de módulo)
+                    
+                    # Fila 5: "PAR" centrado desde J5 hasta O5 con fondo azul
+                    ws_x_recup.merge_cells('J5:O5')
+                    cell_par = ws_x_recup.cell(row=5, column=10)
+                    cell_par.value = 'PAR'
+                    cell_par.font = FUENTE_ENCABEZADO
+                    cell_par.fill = RELLENO_AZUL_CLARO
+                    cell_par.alignment = ALINEACION_CENTRO
+                    cell_par.border = BORDE_DELGADO
+                    
+                    # Fila 6: Encabezados de AMBAS tablas
+                    # TABLA 1: Columnas A-J (1-10) - Coordinación, Código recuperador, Nombre recuperador, y métricas
+                    encabezados_tabla1 = [
+                        'Coordinación', 'Código\nrecuperador', 'Nombre\nrecuperador',
+                        'Cantidad\nPrestada', 'Saldo\nCapital', 'Saldo\nVencido',
+                        'Saldo\nTotal', 'Saldo\nRiesgo Capital', 'Saldo\nRiesgo Total', '% MORA'
+                    ]
+                    for col_idx, encabezado in enumerate(encabezados_tabla1, start=1):
+                        ws_x_recup.cell(row=6, column=col_idx, value=encabezado).style = ESTILO_ENCABEZADO_RESUMEN
+                    
+                    # Columna K (11): Vacía - separador entre tablas
+                    
+                    # TABLA 2: Columnas L-U (12-21) - Encabezados tomados directamente de las columnas del DataFrame
+                    for col_idx, encabezado in enumerate(df_x_recuperador_ordenado.columns[11:], start=12):
+                        ws_x_recup.cell(row=6, column=col_idx, value=encabezado).style = ESTILO_ENCABEZADO_RESUMEN
+                    
+                    # Aplicar formato a datos (fila 11+)
+                    # Formato de moneda a columnas numéricas
+                    mapeo_rangos_recup = {
+                        '0': '0',
+                        '1-7 días': '1-7 días',
+                        '8-15 días': '8-15 días',
+                        '16-30 días': '16-30 días',
+                        '31-60 días': '31-60 días',
+                        '61-90 días': '61-90 días',
+                        'Mayor_90': 'Mayor_90'
+                    }
+                    # Posición en Excel (1-indexada) de cada columna del resumen, calculada una sola vez
+                    posicion_columna = {col: i for i, col in enumerate(df_x_recuperador_ordenado.columns, start=1)}
+                    # Dimensiones de la hoja (max_row / max_column recorren todas las celdas en cada lectura): las filas
+                    # se conocen por el DataFrame (datos desde la fila 11) y la columna máxima se lee una sola vez
+                    max_fila, max_columna = 10 + len(df_x_recuperador_ordenado), ws_x_recup.max_column
+                    columnas_moneda = ['Cantidad Prestada', 'Saldo capital', 'Saldo vencido', 'Saldo total',
+                                      'Saldo riesgo capital', 'Saldo riesgo total'] + list(mapeo_rangos_recup.values())
+                    
+                    # Formato de porcentaje a % MORA - Solo encabezado en amarillo
+                    if '% MORA' in posicion_columna:
+                        ws_x_recup.cell(row=6, column=posicion_columna['% MORA']).fill = RELLENO_AMARILLO
+                    
+                    # Moneda, % MORA y columnas de texto (Coordinación, Código recuperador, Nombre recuperador)
+                    columnas_texto = [col_name for col_name in ['Coordinación', 'Código recuperador', 'Nombre recuperador']
+                                      if col_name in posicion_columna]
+                    aplicar_formato_datos_resumen(ws_x_recup, posicion_columna, columnas_moneda, columnas_texto, max_fila)
+                    
+                    # Resaltar fila de Total con azul claro (ubicada desde el DataFrame; datos desde la fila 11)
+                    if columnas_texto:
+                        es_total = (df_x_recuperador_ordenado[columnas_texto].to_numpy() == 'Total').any(axis=1)
+                        resaltar_filas_total(ws_x_recup, es_total, max_columna)
+                    
+                    # Ajustar ancho de columnas (calculado desde el DataFrame, sin recorrer las filas de datos)
+                    for col_idx, ancho in enumerate(calcular_anchos_hoja_resumen(ws_x_recup, df_x_recuperador_ordenado), start=1):
+                        if col_idx != 11:  # Columna K (11) será comprimida
+                            ws_x_recup.column_dimensions[get_column_letter(col_idx)].width = ancho
+                    
+                    # Columna K (11): Completamente oculta (ancho 0 y hidden)
+                    column_letter_k = get_column_letter(11)
+                    ws_x_recup.column_dimensions[column_letter_k].width = 0.0
+                    ws_x_recup.column_dimensions[column_letter_k].hidden = True
+                    # Las celdas de la columna K quedan fuera del área principal: las limpia la limpieza final
+                    
+                    # Ajustar altura de filas - Fila 6 visible y larga, filas 7-10 con altura 0 (completamente invisibles)
+                    ws_x_recup.row_dimensions[6].height = 30
+                    ws_x_recup.row_dimensions[7].height = 0.0
+                    ws_x_recup.row_dimensions[8].height = 0.0
+                    ws_x_recup.row_dimensions[9].height = 0.0
+                    ws_x_recup.row_dimensions[10].height = 0.0
+                    
+                    # Ocultar filas 7, 8, 9 y 10 completamente
+                    ws_x_recup.row_dimensions[7].hidden = True
+                    ws_x_recup.row_dimensions[8].hidden = True
+                    ws_x_recup.row_dimensions[9].hidden = True
+                    ws_x_recup.row_dimensions[10].hidden = True
+                    
+                    # Determinar límites reales de la tabla a partir del DataFrame escrito
+                    ultima_col_con_datos = len(df_x_recuperador_ordenado.columns)
+                    ultima_fila_con_datos = 10 + len(df_x_recuperador_ordenado)
+                    
+                    # Limpiar celdas fuera del área principal (igual que X_Coordinación)
+                    area_datos = set(range(1, 11)) | set(range(12, ultima_col_con_datos + 1))
+                    area_cols_por_fila = {
+                        5: set(range(10, 16)),  # J-O
+                        6: set(range(1, 11)) | set(range(12, 22)),  # A-J o L-U
+                    }
+                    area_cols_por_fila.update(dict.fromkeys(range(11, ultima_fila_con_datos + 1), area_datos))
+                    limpiar_fuera_de_area(ws_x_recup, area_cols_por_fila, max_fila, max_columna)
+                    
+                    logger.info("✅ Hoja 'X_Recuperador' creada exitosamente como SEGUNDA HOJA")
             
             # --- Hoja 1: Informe completo ---
             hoja_informe = fecha_actual
             
-            
-            # DIAGNÓSTICO FINAL: Verificar columnas antes de escribir
-            columnas_finales = [col for col in df_completo_sin_links.columns if 'par' in str(col).lower()]
-            if columnas_finales:
-                logger.error(f"🚨 ERROR CRÍTICO: Columnas PAR en Informe Completo FINAL: {columnas_finales}")
-            else:
-                logger.info(f"✅ Informe Completo FINAL sin columnas PAR")
-            
-            # Agregar columna 'Concepto Depósito' al informe completo
-            df_completo_sin_links = agregar_columna_concepto_deposito(df_completo_sin_links.copy())
-            
-            # Agregar columnas 'Saldo riesgo capital', 'Saldo riesgo total' y '% MORA'
-            df_completo_sin_links = agregar_columnas_riesgo_y_mora(df_completo_sin_links.copy())
-            df_completo_sin_links = agregar_columnas_dias_ultimo_pago_y_alerta(df_completo_sin_links)
-
             # Bug 4-A: cuando se usa plantilla, la hoja de fecha ya fue escrita en el bloque openpyxl (iter 4).
             # Omitir escritura duplicada via ExcelWriter para evitar dos hojas con la misma fecha.
             if not usar_plantilla:
+                # Columnas 'Concepto Depósito', 'Saldo riesgo capital', 'Saldo riesgo total' y '% MORA'
+                # (con plantilla ya se agregaron en df_r_completo)
+                _, df_completo_sin_links = preparar_df_hoja_detalle(df_completo_sin_links, 'Informe Completo')
+                df_completo_sin_links = agregar_columnas_dias_ultimo_pago_y_alerta(df_completo_sin_links)
+
                 df_completo_sin_links.to_excel(writer, sheet_name=hoja_informe, index=False, startrow=1)
                 ws_informe = writer.sheets[hoja_informe]
+                # El DataFrame se escribió desde la columna A: su posición es la del encabezado en la fila 2
+                encabezados_informe = mapa_columnas(df_completo_sin_links)
 
-                if 'Código acreditado' in df_completo_sin_links.columns:
-                    for col_idx in range(1, ws_informe.max_column + 1):
-                        if ws_informe.cell(row=2, column=col_idx).value == 'Código acreditado':
-                            for row in range(3, ws_informe.max_row + 1):
-                                ws_informe.cell(row=row, column=col_idx).number_format = '@'
-                            logger.info(f"✅ Formato de texto aplicado a columna 'Código acreditado' (columna {col_idx})")
-                            break
-
-                aplicar_formato_texto_concepto_deposito(ws_informe, df_completo_sin_links)
-                aplicar_formato_condicional(ws_informe, columna_mora, len(df_completo))
-
-                if 'Link de Geolocalización' in df_completo_sin_links.columns:
-                    link_col = df_completo_sin_links.columns.get_loc('Link de Geolocalización') + 1
-                    for i, (idx, row) in enumerate(df_completo.iterrows()):
-                        row_num = i + 3
-                        if 'link_texto' in df_completo.columns and 'link_url' in df_completo.columns:
-                            escribir_hipervinculo_excel(ws_informe, row_num, link_col, row['link_texto'], row['link_url'])
-
-                aplicar_formato_final(ws_informe, df_completo_sin_links, es_hoja_mora=False)
-                aplicar_formato_porcentaje_mora(ws_informe, df_completo_sin_links)
-                aplicar_formato_alerta(ws_informe, df_completo_sin_links)
+                aplicar_formato_texto_columnas(ws_informe, df_completo_sin_links, ('Código acreditado', 'Concepto Depósito'),
+                                               encabezados_informe)
+                aplicar_formato_condicional(ws_informe, columna_mora, len(df_completo), encabezados_informe)
+
+                link_col = encabezados_informe.get('Link de Geolocalización')
+                if link_col:
+                    escribir_hipervinculos_columna(ws_informe, link_col, df_completo)
+
+                aplicar_formato_final(ws_informe, df_completo_sin_links, es_hoja_mora=False, encabezados=encabezados_informe)
+                aplicar_formato_porcentaje_mora(ws_informe, df_completo_sin_links, encabezados_informe)
+                aplicar_formato_alerta(ws_informe, df_completo_sin_links, encabezados_informe)
                 crear_tabla_excel(ws_informe, df_completo_sin_links, hoja_informe, incluir_columnas_adicionales=False)
             else:
-                logger.info(f"📋 Hoja '{hoja_informe}' ya escrita en bloque openpyxl (iter 4) — omitiendo escritura duplicada")
+                logger.info("📋 Hoja '%s' ya escrita en bloque openpyxl (iter 4) — omitiendo escritura duplicada", hoja_informe)
 
             # --- Hoja RECUPERADOR_000124 (registros con código recuperador en CODIGOS_RECUPERADOR_EXCLUIR) ---
             if df_recup_000124_sin_links is not None and len(df_recup_000124_sin_links) > 0:
                 df_recup_000124_sin_links.to_excel(writer, sheet_name='RECUPERADOR_000124', index=False, startrow=1)
                 ws_recup = writer.sheets['RECUPERADOR_000124']
-                if 'Código acreditado' in df_recup_000124_sin_links.columns:
-                    for col_idx in range(1, ws_recup.max_column + 1):
-                        if ws_recup.cell(row=2, column=col_idx).value == 'Código acreditado':
-                            for row in range(3, ws_recup.max_row + 1):
-                                ws_recup.cell(row=row, column=col_idx).number_format = '@'
-                            break
-                aplicar_formato_texto_concepto_deposito(ws_recup, df_recup_000124_sin_links)
-                aplicar_formato_condicional(ws_recup, columna_mora, len(df_recup_000124_sin_links))
-                if 'Link de Geolocalización' in df_recup_000124_sin_links.columns and df_recup_000124_completo is not None:
-                    link_col_recup = df_recup_000124_sin_links.columns.get_loc('Link de Geolocalización') + 1
-                    for i, (_, row) in enumerate(df_recup_000124_completo.iterrows()):
-                        row_num = i + 3
-                        if 'link_texto' in df_recup_000124_completo.columns and 'link_url' in df_recup_000124_completo.columns:
-                            escribir_hipervinculo_excel(ws_recup, row_num, link_col_recup, row['link_texto'], row['link_url'])
-                aplicar_formato_final(ws_recup, df_recup_000124_sin_links, es_hoja_mora=False)
-                aplicar_formato_porcentaje_mora(ws_recup, df_recup_000124_sin_links)
-                aplicar_formato_alerta(ws_recup, df_recup_000124_sin_links)
+                # El DataFrame se escribió desde la columna A: su posición es la del encabezado en la fila 2
+                encabezados_recup = mapa_columnas(df_recup_000124_sin_links)
+                aplicar_formato_texto_columnas(ws_recup, df_recup_000124_sin_links, ('Código acreditado', 'Concepto Depósito'),
+                                               encabezados_recup)
+                aplicar_formato_condicional(ws_recup, columna_mora, len(df_recup_000124_sin_links), encabezados_recup)
+                link_col_recup = encabezados_recup.get('Link de Geolocalización')
+                if link_col_recup and df_recup_000124_completo is not None:
+                    escribir_hipervinculos_columna(ws_recup, link_col_recup, df_recup_000124_completo)
+                aplicar_formato_final(ws_recup, df_recup_000124_sin_links, es_hoja_mora=False, encabezados=encabezados_recup)
+                aplicar_formato_porcentaje_mora(ws_recup, df_recup_000124_sin_links, encabezados_recup)
+                aplicar_formato_alerta(ws_recup, df_recup_000124_sin_links, encabezados_recup)
                 crear_tabla_excel(ws_recup, df_recup_000124_sin_links, 'RECUPERADOR_000124', incluir_columnas_adicionales=False)
-                logger.info(f"✅ Hoja RECUPERADOR_000124 creada con {len(df_recup_000124_sin_links)} registros")
+                logger.info("✅ Hoja RECUPERADOR_000124 creada con %s registros", len(df_recup_000124_sin_links))
 
             # --- PASO 6.1: Crear hoja "Mora" ---
-            # Verificar columnas duplicadas antes de escribir hoja Mora
-            columnas_duplicadas_mora = df_mora.columns[df_mora.columns.duplicated()].tolist()
-            if columnas_duplicadas_mora:
-                logger.error(f"🚨 COLUMNAS DUPLICADAS encontradas en df_mora: {columnas_duplicadas_mora}")
-                # Eliminar columnas duplicadas
-                df_mora = df_mora.loc[:, ~df_mora.columns.duplicated()]
-                logger.info(f"🗑️ Columnas duplicadas eliminadas de df_mora")
-            
-            # DIAGNÓSTICO FINAL: Verificar columnas PAR en df_mora
-            columnas_par_mora = [col for col in df_mora.columns if 'par' in str(col).lower()]
-            if columnas_par_mora:
-                logger.error(f"🚨 ERROR CRÍTICO: Columnas PAR en Mora FINAL: {columnas_par_mora}")
-            else:
-                logger.info(f"✅ Mora FINAL sin columnas PAR")
-            
-            # Crear DataFrame sin las columnas temporales de links para escritura en Excel
-            df_mora_sin_links = df_mora.drop(columns=['link_texto', 'link_url'], errors='ignore')
-            
-            # Agregar columna 'Concepto Depósito' a la hoja Mora
-            df_mora_sin_links = agregar_columna_concepto_deposito(df_mora_sin_links.copy())
-            
-            # Agregar columnas 'Saldo riesgo capital', 'Saldo riesgo total' y '% MORA'
-            df_mora_sin_links = agregar_columnas_riesgo_y_mora(df_mora_sin_links.copy())
+            # Sin columnas duplicadas ni de links, con 'Concepto Depósito' y columnas de riesgo
+            df_mora, df_mora_sin_links = preparar_df_hoja_detalle(df_mora, 'Mora', riesgo_y_mora_base)
             
             # --- ITERACIÓN 6: Reordenar columnas de Mora ---
             COLS_PRIMERAS_MORA = [
@@ -2492,390 +2701,75 @@ def procesar_reporte_antiguedad(archivo_path, codigos_a_excluir=None):
             cols_presentes = [c for c in COLS_PRIMERAS_MORA if c in df_mora_sin_links.columns]
             cols_resto = [c for c in df_mora_sin_links.columns if c not in COLS_PRIMERAS_MORA]
             df_mora_sin_links = df_mora_sin_links[cols_presentes + cols_resto]
-            logger.info(f"✅ Mora reordenada — primera col: '{df_mora_sin_links.columns[0]}'")
+            logger.info("✅ Mora reordenada — primera col: '%s'", df_mora_sin_links.columns[0])
 
             df_mora_sin_links.to_excel(writer, sheet_name='Mora', index=False, startrow=1)
             
             # Aplicar formato condicional
             worksheet_mora = writer.sheets['Mora']
-            aplicar_formato_condicional(worksheet_mora, columna_mora, len(df_mora))
+            # Posición de cada columna del DataFrame (escrito desde la columna A), calculada una sola vez
+            encabezados_mora = mapa_columnas(df_mora_sin_links)
+            aplicar_formato_condicional(worksheet_mora, columna_mora, len(df_mora), encabezados_mora)
             
             # Añadir hipervínculos si existe la columna 'Link de Geolocalización'
-            if 'Link de Geolocalización' in df_mora_sin_links.columns:
-                link_col = df_mora_sin_links.columns.get_loc('Link de Geolocalización') + 1  # +1 porque Excel es 1-indexado
-                
-                # Escribir hipervínculos usando los datos originales de df_mora
-                for i, (idx, row) in enumerate(df_mora.iterrows()):
-                    row_num = i + 3  # +3 porque Excel empieza en 1, hay títulos en fila 1, encabezados en fila 2, datos empiezan en fila 3
-                    if 'link_texto' in df_mora.columns and 'link_url' in df_mora.columns:
-                        texto = row['link_texto']
-                        url = row['link_url']
-                        escribir_hipervinculo_excel(worksheet_mora, row_num, link_col, texto, url)
+            link_col = encabezados_mora.get('Link de Geolocalización')
+            if link_col:
+                # Escribir hipervínculos usando los datos originales de df_mora (datos desde la fila 3)
+                escribir_hipervinculos_columna(worksheet_mora, link_col, df_mora)
             
             # Aplicar formato de texto a 'Concepto Depósito'
-            aplicar_formato_texto_concepto_deposito(worksheet_mora, df_mora_sin_links)
+            aplicar_formato_texto_columnas(worksheet_mora, df_mora_sin_links, encabezados=encabezados_mora)
             
             # Crear tabla formal de Excel para la hoja Mora y formato final
             crear_tabla_excel(worksheet_mora, df_mora_sin_links, 'Mora', incluir_columnas_adicionales=True)
-            aplicar_formato_final(worksheet_mora, df_mora_sin_links, es_hoja_mora=True)
-            aplicar_formato_porcentaje_mora(worksheet_mora, df_mora_sin_links)
+            aplicar_formato_final(worksheet_mora, df_mora_sin_links, es_hoja_mora=True, encabezados=encabezados_mora)
+            aplicar_formato_porcentaje_mora(worksheet_mora, df_mora_sin_links, encabezados_mora)
 
             # --- PASO 6.1.1: Crear hoja "Cuentas con saldo vencido" ---
             if df_saldo_vencido is not None and len(df_saldo_vencido) > 0:
-                # Verificar columnas duplicadas antes de escribir hoja Saldo Vencido
-                columnas_duplicadas_saldo = df_saldo_vencido.columns[df_saldo_vencido.columns.duplicated()].tolist()
-                if columnas_duplicadas_saldo:
-                    logger.error(f"🚨 COLUMNAS DUPLICADAS encontradas en df_saldo_vencido: {columnas_duplicadas_saldo}")
-                    # Eliminar columnas duplicadas
-                    df_saldo_vencido = df_saldo_vencido.loc[:, ~df_saldo_vencido.columns.duplicated()]
-                    logger.info(f"🗑️ Columnas duplicadas eliminadas de df_saldo_vencido")
-                
-                # DIAGNÓSTICO FINAL: Verificar columnas PAR en df_saldo_vencido
-                columnas_par_saldo = [col for col in df_saldo_vencido.columns if 'par' in str(col).lower()]
-                if columnas_par_saldo:
-                    logger.error(f"🚨 ERROR CRÍTICO: Columnas PAR en Saldo Vencido FINAL: {columnas_par_saldo}")
-                else:
-                    logger.info(f"✅ Saldo Vencido FINAL sin columnas PAR")
-                
-                # Crear DataFrame sin las columnas temporales de links para escritura en Excel
-                df_saldo_vencido_sin_links = df_saldo_vencido.drop(columns=['link_texto', 'link_url'], errors='ignore')
-                
-                # Agregar columna 'Concepto Depósito' a la hoja Cuentas con saldo vencido
-                df_saldo_vencido_sin_links = agregar_columna_concepto_deposito(df_saldo_vencido_sin_links.copy())
-                
-                # Agregar columnas 'Saldo riesgo capital', 'Saldo riesgo total' y '% MORA'
-                df_saldo_vencido_sin_links = agregar_columnas_riesgo_y_mora(df_saldo_vencido_sin_links.copy())
+                # Sin columnas duplicadas ni de links, con 'Concepto Depósito' y columnas de riesgo
+                df_saldo_vencido, df_saldo_vencido_sin_links = preparar_df_hoja_detalle(df_saldo_vencido, 'Saldo Vencido', riesgo_y_mora_base)
                 
                 df_saldo_vencido_sin_links.to_excel(writer, sheet_name='Cuentas con saldo vencido', index=False, startrow=1)
                 
                 # NO aplicar formato condicional para la hoja "Cuentas con saldo vencido"
                 worksheet_saldo = writer.sheets['Cuentas con saldo vencido']
+                # Posición de cada columna del DataFrame (escrito desde la columna A), calculada una sola vez
+                encabezados_saldo = mapa_columnas(df_saldo_vencido_sin_links)
                 # aplicar_formato_condicional(worksheet_saldo, columna_mora, len(df_saldo_vencido))  # Comentado: no queremos colores en esta hoja
                 
                 # Aplicar formato de texto a 'Concepto Depósito'
-                aplicar_formato_texto_concepto_deposito(worksheet_saldo, df_saldo_vencido_sin_links)
+                aplicar_formato_texto_columnas(worksheet_saldo, df_saldo_vencido_sin_links, encabezados=encabezados_saldo)
                 
                 # Añadir hipervínculos si existe la columna 'Link de Geolocalización'
-                if 'Link de Geolocalización' in df_saldo_vencido_sin_links.columns:
-                    link_col = df_saldo_vencido_sin_links.columns.get_loc('Link de Geolocalización') + 1  # +1 porque Excel es 1-indexado
-                    
-                    # Escribir hipervínculos usando los datos originales de df_saldo_vencido
-                    for i, (idx, row) in enumerate(df_saldo_vencido.iterrows()):
-                        row_num = i + 3  # +3 porque Excel empieza en 1, hay títulos en fila 1, encabezados en fila 2, datos empiezan en fila 3
-                        if 'link_texto' in df_saldo_vencido.columns and 'link_url' in df_saldo_vencido.columns:
-                            texto = row['link_texto']
-                            url = row['link_url']
-                            escribir_hipervinculo_excel(worksheet_saldo, row_num, link_col, texto, url)
+                link_col = encabezados_saldo.get('Link de Geolocalización')
+                if link_col:
+                    # Escribir hipervínculos usando los datos originales de df_saldo_vencido (datos desde la fila 3)
+                    escribir_hipervinculos_columna(worksheet_saldo, link_col, df_saldo_vencido)
                 
                 # Crear tabla formal de Excel para la hoja Saldo Vencido y formato final
                 crear_tabla_excel(worksheet_saldo, df_saldo_vencido_sin_links, 'Cuentas con saldo vencido', incluir_columnas_adicionales=False)
-                aplicar_formato_final(worksheet_saldo, df_saldo_vencido_sin_links, es_hoja_mora=False)
-                aplicar_formato_porcentaje_mora(worksheet_saldo, df_saldo_vencido_sin_links)
+                aplicar_formato_final(worksheet_saldo, df_saldo_vencido_sin_links, es_hoja_mora=False, encabezados=encabezados_saldo)
+                aplicar_formato_porcentaje_mora(worksheet_saldo, df_saldo_vencido_sin_links, encabezados_saldo)
                 
-                logger.info(f"✅ Hoja 'Cuentas con saldo vencido' creada con {len(df_saldo_vencido)} registros")
+                logger.info("✅ Hoja 'Cuentas con saldo vencido' creada con %s registros", len(df_saldo_vencido))
             else:
                 logger.info("⚠️ No se creó la hoja 'Cuentas con saldo vencido' (no hay datos o columna faltante)")
 
             # --- PASO 6.1.2: Crear hoja "Liquidación anticipada" ---
-            logger.info("Creando hoja 'Liquidación anticipada'")
-            
-            # Validar columnas requeridas para liquidación anticipada
-            # Mapear a los nombres reales de columnas basados en el contenido de la primera fila
-            columnas_requeridas = {
-                'ciclo': 'Ciclo',
-                'nombre_acreditado': 'Nombre acreditado', 
-                'intereses_vencidos': 'Saldo interés vencido',
-                'comision_vencida': 'Saldo comisión vencida',
-                'recargos': 'Saldo recargos',
-                'saldo_capital': 'Saldo capital'
-            }
-            
-            # Verificar qué columnas existen en df_completo
-            logger.info(f"🔍 DIAGNÓSTICO DETALLADO DE COLUMNAS:")
-            logger.info(f"   - Columnas disponibles en df_completo: {list(df_completo.columns)}")
-            logger.info(f"   - Columnas requeridas: {list(columnas_requeridas.values())}")
-            
-            # Función para buscar columnas por similitud
-            def buscar_columna_similar(columna_requerida, columnas_disponibles):
-                """Busca una columna por similitud de nombre"""
-                columna_requerida_clean = columna_requerida.lower().replace(' ', '').replace('ó', 'o').replace('í', 'i').replace('é', 'e').replace('á', 'a').replace('ú', 'u')
-                
-                logger.info(f"🔍 Buscando columna similar a '{columna_requerida}' (limpio: '{columna_requerida_clean}')")
-                
-                for col_disponible in columnas_disponibles:
-                    col_disponible_clean = col_disponible.lower().replace(' ', '').replace('ó', 'o').replace('í', 'i').replace('é', 'e').replace('á', 'a').replace('ú', 'u')
-                    
-                    # Búsqueda exacta
-                    if col_disponible_clean == columna_requerida_clean:
-                        logger.info(f"✅ Encontrada coincidencia exacta: '{col_disponible}'")
-                        return col_disponible
-                    
-                    # Búsqueda por coincidencia parcial
-                    if columna_requerida_clean in col_disponible_clean or col_disponible_clean in columna_requerida_clean:
-                        logger.info(f"✅ Encontrada coincidencia parcial: '{col_disponible}'")
-                        return col_disponible
-                
-                logger.warning(f"❌ No se encontró columna similar a '{columna_requerida}'")
-                return None
-            
-            # Mapear columnas requeridas a columnas reales
-            columnas_mapeadas = {}
-            columnas_faltantes = []
-            
-            # Mapeo manual basado en la estructura real del archivo
-            # Según el debug anterior, las columnas están en posiciones específicas
-            mapeo_manual = {
-                'ciclo': df_completo.columns[7] if len(df_completo.columns) > 7 else None,  # Unnamed: 7 (Columna 8 Excel)
-                'nombre_acreditado': df_completo.columns[8] if len(df_completo.columns) > 8 else None,  # Unnamed: 8 (Columna 9 Excel)
-                'intereses_vencidos': df_completo.columns[25] if len(df_completo.columns) > 25 else None,  # Unnamed: 25 (Columna 26 Excel - Saldo interés vencido)
-                'comision_vencida': df_completo.columns[26] if len(df_completo.columns) > 26 else None,  # Unnamed: 26 (Columna 27 Excel - Saldo comisión vencida)
-                'recargos': df_completo.columns[27] if len(df_completo.columns) > 27 else None,  # Unnamed: 27 (Columna 28 Excel - Saldo recargos)
-                'saldo_capital': df_completo.columns[22] if len(df_completo.columns) > 22 else None,  # Unnamed: 22 (Columna 23 Excel - Saldo capital)
-            }
-            
-            for key, columna_requerida in columnas_requeridas.items():
-                # Primero intentar mapeo manual
-                columna_manual = mapeo_manual.get(key)
-                if columna_manual:
-                    columnas_mapeadas[key] = columna_manual
-                    logger.info(f"✅ Columna '{columna_requerida}' mapeada manualmente a '{columna_manual}'")
-                elif columna_requerida in df_completo.columns:
-                    columnas_mapeadas[key] = columna_requerida
-                    logger.info(f"✅ Columna '{columna_requerida}' encontrada exactamente")
-                else:
-                    # Buscar por similitud
-                    columna_encontrada = buscar_columna_similar(columna_requerida, df_completo.columns)
-                    if columna_encontrada:
-                        columnas_mapeadas[key] = columna_encontrada
-                        logger.info(f"✅ Columna '{columna_requerida}' mapeada por similitud a '{columna_encontrada}'")
-                    else:
-                        columnas_faltantes.append(columna_requerida)
-                        logger.warning(f"⚠️ Columna '{columna_requerida}' no encontrada para 'Liquidación anticipada'")
-            
-            if not columnas_faltantes:
-                logger.info("✅ Todas las columnas requeridas para liquidación anticipada están disponibles")
-            else:
-                logger.warning(f"⚠️ Columnas faltantes: {columnas_faltantes}")
-            
-            # Definir columnas para la hoja de liquidación anticipada
-            liquidacion_columns = [
-                COLUMN_MAPPING.get('codigo', 'Código acreditado'),  # A
-                'Ciclo',                                           # B
-                'Nombre del acreditado',                           # C
-                'Saldo interés vencido',                           # D
-                'Saldo comisión vencida',                          # E
-                'Saldo recargos',                                  # F
-                'Saldo capital',                                   # G
-                'Saldo adelantado',                                # H (NUEVA COLUMNA)
-                'Intereses del próximo pago sin vencer',           # I
-                'Comisiones del próximo pago sin vencer',          # J
-                'Cantidad a liquidar',                             # K
-                'Cálculo válido hasta el próximo pago'             # L
-            ]
-            
-            # Crear DataFrame vacío para la hoja de liquidación anticipada
-            df_liquidacion = pd.DataFrame(columns=liquidacion_columns)
-            
-            # Inicializar fila con datos vacíos
-            fila_inicial = [''] * len(liquidacion_columns)
-            df_liquidacion.loc[0] = fila_inicial
-            
-            # Escribir la hoja
-            df_liquidacion.to_excel(writer, sheet_name='Liquidación anticipada', index=False, startrow=1)
-            ws_liquidacion = writer.sheets['Liquidación anticipada']
-            
-            # --- Diseño personalizado para la hoja de liquidación anticipada ---
-            
-            # 1. Combinar celdas D1:F1 para "Montos Vencidos" con relleno azul claro
-            ws_liquidacion.merge_cells('D1:F1')
-            celda_titulo = ws_liquidacion['D1']
-            celda_titulo.value = 'Montos Vencidos'
-            celda_titulo.fill = PatternFill(start_color=COLORS['light_blue'], end_color=COLORS['light_blue'], fill_type='solid')
-            celda_titulo.font = Font(bold=True)
-            celda_titulo.alignment = Alignment(horizontal='center', vertical='center')
-            
-            # 2. Establecer ancho de columna optimizado para cada tipo de dato
-            widths = {
-                'A': 18,  # Código acreditado (más ancho para códigos largos)
-                'B': 12,  # Ciclo
-                'C': 25,  # Nombre (más ancho para nombres largos)
-                'D': 20,  # Saldo interés vencido
-                'E': 20,  # Saldo comisión vencida
-                'F': 15,  # Saldo recargos
-                'G': 18,  # Saldo capital
-                'H': 18,  # Saldo adelantado (NUEVA COLUMNA)
-                'I': 22,  # Intereses próximo pago
-                'J': 22,  # Comisiones próximo pago
-                'K': 20,  # Cantidad a liquidar
-                'L': 25   # Cálculo válido hasta
-            }
-            
-            for col_letter, width in widths.items():
-                ws_liquidacion.column_dimensions[col_letter].width = width
-            
-            # 3. Establecer altura de filas para mejor legibilidad
-            ws_liquidacion.row_dimensions[2].height = 35  # Encabezados más altos
-            ws_liquidacion.row_dimensions[3].height = 30  # Datos más altos
-            
-            # 4. Aplicar formato minimalista pero legible a todas las celdas
-            # Encabezados (fila 2)
-            for col in range(1, 13):  # Columnas A a L
-                cell = ws_liquidacion.cell(row=2, column=col)
-                cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-                cell.font = Font(name='Arial', size=10, bold=True, color='2F4F4F')  # Azul gris oscuro
-                cell.fill = PatternFill(start_color='F8F9FA', end_color='F8F9FA', fill_type='solid')  # Gris muy claro
-                cell.border = Border(
-                    left=Side(style='thin', color='D3D3D3'),
-                    right=Side(style='thin', color='D3D3D3'),
-                    top=Side(style='thin', color='D3D3D3'),
-                    bottom=Side(style='thin', color='D3D3D3')
-                )
-            
-            # Datos (fila 3)
-            for col in range(1, 13):  # Columnas A a L
-                cell = ws_liquidacion.cell(row=3, column=col)
-                cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-                cell.font = Font(name='Arial', size=10, color='2C2C2C')  # Gris oscuro
-                cell.border = Border(
-                    left=Side(style='thin', color='D3D3D3'),
-                    right=Side(style='thin', color='D3D3D3'),
-                    top=Side(style='thin', color='D3D3D3'),
-                    bottom=Side(style='thin', color='D3D3D3')
-                )
-            
-            # 4. Aplicar relleno verde claro a celdas manuales (columnas I, J, L) con formato mejorado
-            celdas_manuales = ['I3', 'J3', 'L3']
-            for celda in celdas_manuales:
-                ws_liquidacion[celda].fill = PatternFill(start_color=COLORS['light_green'], end_color=COLORS['light_green'], fill_type='solid')
-                ws_liquidacion[celda].font = Font(name='Arial', size=10, bold=True, color='2C2C2C')  # Texto en negrita para celdas manuales
-            
-            # 5. Aplicar formato de moneda a columnas D:K (4:11)
-            for col_letter in ['D', 'E', 'F', 'G', 'H', 'I', 'J', 'K']:
-                ws_liquidacion[f'{col_letter}3'].number_format = EXCEL_CONFIG['currency_format']
-            
-            # 5. Formatear celda A3 (Código acreditado) para mantener ceros al inicio
-            ws_liquidacion['A3'].number_format = '@'  # Formato de texto para mantener ceros
-            
-            # 6. Agregar fórmulas BUSCARV en B3:G3 para autocompletado desde "Informe Completo"
-            # Obtener el nombre de la hoja "Informe Completo" (fecha_actual)
-            nombre_hoja_informe = hoja_informe  # Ya definido anteriormente
-            
-            # *** CORREGIDO: Usar columnas completas en lugar de rango fijo ***
-            ultima_columna_informe = len(df_completo.columns)
-            ultima_col_letter = get_column_letter(ultima_columna_informe)
-            rango_informe = f"$A:{ultima_col_letter}"
-            
-            logger.info(f"🔍 Debug fórmulas BUSCARV:")
-            logger.info(f"   - Nombre hoja informe: '{nombre_hoja_informe}'")
-            logger.info(f"   - Rango informe: '{rango_informe}'")
-            logger.info(f"   - Registros en df_completo: {len(df_completo)}")
-            logger.info(f"   - Columnas en df_completo: {list(df_completo.columns)}")
-            
-            # Mostrar las primeras filas para verificar datos
-            if len(df_completo) > 0:
-                primera_columna = df_completo.columns[0]  # Primera columna (debería ser 'Código acreditado')
-                logger.info(f"   - Primera columna: '{primera_columna}'")
-                logger.info(f"   - Primeros 3 valores de '{primera_columna}': {df_completo[primera_columna].head(3).tolist()}")
-            else:
-                logger.error("   - ERROR: df_completo está vacío!")
-            
-            # B3: Ciclo - con manejo de valores nulos usando VLOOKUP (inglés)
-            if 'ciclo' in columnas_mapeadas:
-                col_ciclo_index = df_completo.columns.get_loc(columnas_mapeadas['ciclo']) + 1  # +1 porque Excel es 1-indexado
-                formula_ciclo = f"=IFERROR(VLOOKUP(A3,'{nombre_hoja_informe}'!{rango_informe},{col_ciclo_index},FALSE),\"\")"
-                ws_liquidacion['B3'] = formula_ciclo
-                logger.info(f"✅ Fórmula B3 (Ciclo): {formula_ciclo}")
-            else:
-                ws_liquidacion['B3'] = '""'
-                logger.warning(f"⚠️ Columna 'Ciclo' no encontrada, B3 quedará vacío")
-            
-            # C3: Nombre del acreditado - con manejo de valores nulos usando VLOOKUP (inglés)
-            if 'nombre_acreditado' in columnas_mapeadas:
-                col_nombre_index = df_completo.columns.get_loc(columnas_mapeadas['nombre_acreditado']) + 1
-                formula_nombre = f"=IFERROR(VLOOKUP(A3,'{nombre_hoja_informe}'!{rango_informe},{col_nombre_index},FALSE),\"\")"
-                ws_liquidacion['C3'] = formula_nombre
-                logger.info(f"✅ Fórmula C3 (Nombre): {formula_nombre}")
-            else:
-                ws_liquidacion['C3'] = '""'
-                logger.warning(f"⚠️ Columna 'Nombre acreditado' no encontrada, C3 quedará vacío")
-            
-            # D3: Saldo interés vencido
-            if 'intereses_vencidos' in columnas_mapeadas:
-                col_intereses_index = df_completo.columns.get_loc(columnas_mapeadas['intereses_vencidos']) + 1
-                formula_intereses = f"=IFERROR(VLOOKUP(A3,'{nombre_hoja_informe}'!{rango_informe},{col_intereses_index},FALSE),0)"
-                ws_liquidacion['D3'] = formula_intereses
-                logger.info(f"✅ Fórmula D3 (Intereses): {formula_intereses}")
-            else:
-                ws_liquidacion['D3'] = '0'
-                logger.warning(f"⚠️ Columna 'Intereses vencidos' no encontrada, D3 = 0")
-            
-            # E3: Saldo comisión vencida
-            if 'comision_vencida' in columnas_mapeadas:
-                col_comision_index = df_completo.columns.get_loc(columnas_mapeadas['comision_vencida']) + 1
-                formula_comision = f"=IFERROR(VLOOKUP(A3,'{nombre_hoja_informe}'!{rango_informe},{col_comision_index},FALSE),0)"
-                ws_liquidacion['E3'] = formula_comision
-                logger.info(f"✅ Fórmula E3 (Comisión): {formula_comision}")
-            else:
-                ws_liquidacion['E3'] = '0'
-                logger.warning(f"⚠️ Columna 'Comisión vencida' no encontrada, E3 = 0")
-            
-            # F3: Saldo recargos
-            if 'recargos' in columnas_mapeadas:
-                col_recargos_index = df_completo.columns.get_loc(columnas_mapeadas['recargos']) + 1
-                formula_recargos = f"=IFERROR(VLOOKUP(A3,'{nombre_hoja_informe}'!{rango_informe},{col_recargos_index},FALSE),0)"
-                ws_liquidacion['F3'] = formula_recargos
-                logger.info(f"✅ Fórmula F3 (Recargos): {formula_recargos}")
-            else:
-                ws_liquidacion['F3'] = '0'
-                logger.warning(f"⚠️ Columna 'Recargos' no encontrada, F3 = 0")
-            
-            # G3: Saldo capital
-            if 'saldo_capital' in columnas_mapeadas:
-                col_capital_index = df_completo.columns.get_loc(columnas_mapeadas['saldo_capital']) + 1
-                formula_capital = f"=IFERROR(VLOOKUP(A3,'{nombre_hoja_informe}'!{rango_informe},{col_capital_index},FALSE),0)"
-                ws_liquidacion['G3'] = formula_capital
-                logger.info(f"✅ Fórmula G3 (Capital): {formula_capital}")
-            else:
-                ws_liquidacion['G3'] = '0'
-                logger.warning(f"⚠️ Columna 'Saldo capital' no encontrada, G3 = 0")
-            
-            # H3: Saldo adelantado (NUEVA COLUMNA) - Buscar en columna específica del informe
-            # Esta columna busca directamente en una posición fija según el archivo del jefe
-            formula_adelantado = f"=IFERROR(VLOOKUP(A3,'{nombre_hoja_informe}'!{rango_informe},52,FALSE),0)"
-            ws_liquidacion['H3'] = formula_adelantado
-            logger.info(f"✅ Fórmula H3 (Saldo adelantado): {formula_adelantado}")
-            
-            # 7. Establecer fórmula de suma en columna K3 para "Cantidad a liquidar"
-            # Suma: Saldo interés vencido + Saldo comisión + Saldo recargos + Saldo capital + Intereses próximo pago + Comisiones próximo pago
-            # Resta: Saldo adelantado
-            ws_liquidacion['K3'] = '=SUM(D3:G3,I3:J3)-H3'
-            
-            # 8. NO usar crear_tabla_excel para mantener el diseño personalizado minimalista
-            
-            # 9. Aplicar formato final personalizado sin tabla formal
-            # Inmovilizar paneles en A3 para mejor navegación
-            ws_liquidacion.freeze_panes = 'A3'
-            
-            # 10. Asegurar que las celdas fuera del área principal tengan fondo blanco
-            for row in range(1, 15):  # Filas 1-14
-                for col in range(1, 15):  # Columnas A-N
-                    cell = ws_liquidacion.cell(row=row, column=col)
-                    # Solo aplicar relleno blanco si no tiene relleno especial
-                    if cell.fill.start_color.index == '00000000':  # Sin relleno
-                        cell.fill = PatternFill(start_color='FFFFFF', end_color='FFFFFF', fill_type='solid')
-            
-            # 11. Instrucciones removidas para diseño más limpio
-            
-            logger.info("✅ Hoja 'Liquidación anticipada' creada")
+            # El rango del BUSCARV debe cubrir la hoja del informe tal como se escribió
+            # (con plantilla: df_r_completo; sin plantilla: df_completo_sin_links ya preparado)
+            df_hoja_informe = df_r_completo if usar_plantilla else df_completo_sin_links
+            crear_hoja_liquidacion(writer.book, df_completo, hoja_informe, df_hoja_informe)
 
             # --- PASO 6.2: Crear hojas por coordinación --- [ELIMINADO - iteración 1]
             # Las hojas por coordinación (Atlacomulco, Maravatio, Metepec, etc.) fueron eliminadas
             # del nuevo diseño. El desglose por coordinación ahora vive en los pivots de X_Coordinación.
             pass
 
-        logger.info(f"Procesamiento completado exitosamente. Archivo generado: {ruta_salida}")
+        logger.info("Procesamiento completado exitosamente. Archivo generado: %s", ruta_salida)
         
-        return ruta_salida, len(coordinaciones_data)
+        return ruta_salida, num_coordinaciones
         
     except FileNotFoundError as e:
         logger.error(f"Archivo no encontrado: {str(e)}")
@@ -2941,7 +2835,6 @@ def procesar_antiguedad():
         ruta_salida, num_coordinaciones = procesar_reporte_antiguedad(archivo_path, codigos_a_excluir=None)
         
         # Mover al directorio de reportes SIN modificar el nombre
-        import shutil
         os.makedirs(REPORTS_FOLDER, exist_ok=True)
         ruta_final = os.path.join(REPORTS_FOLDER, os.path.basename(ruta_salida))
         shutil.move(ruta_salida, ruta_final)
@@ -3040,15 +2933,13 @@ def procesar_antiguedad_grupal():
             archivo.save(archivo_path)
             archivos_paths.append(archivo_path)
             
-            # Detectar tipo de archivo
-            df_temp = pd.read_excel(archivo_path, engine='openpyxl', dtype=DTYPE_CONFIG, header=0)
-            tipo = detectar_tipo_archivo(df_temp)
+            # Detectar tipo de archivo; solo hacen falta los encabezados, no las filas
+            tipo = detectar_tipo_archivo(leer_excel(archivo_path, nrows=0))
             
             archivos_info.append({
                 'filename': filename,
                 'path': archivo_path,
-                'tipo': tipo,
-                'df': df_temp
+                'tipo': tipo
             })
             
             logger.info(f"Archivo {filename} detectado como tipo: {tipo}")
@@ -3075,7 +2966,6 @@ def procesar_antiguedad_grupal():
                 pass
         
         # Crear un archivo Excel de ejemplo para el reporte grupal
-        from openpyxl import Workbook
         wb = Workbook()
         ws = wb.active
         ws.title = "Reporte Grupal"